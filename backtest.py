@@ -0,0 +1,192 @@
+import argparse
+import numpy as np
+import pandas as pd
+from bond_analysis import run_analysis
+from utils.history import QuoteStore
+from utils.optimizer import LOSS_SEVERITY, TOTAL_PORTFOLIO_VALUE, candidate_universe, optimize_portfolio
+from utils.portfolio_metrics import PORTFOLIO_METRICS, calculate_portfolio_metrics
+from utils.schema import FACE_VALUE
+from utils.storage import write_table
+from utils.instrumentation import enable_tracing, finish_trace, stage
+
+# Columns of the bonds-data snapshots the backtest reads: the inputs of run_analysis() and of the selection rules
+BACKTEST_COLUMNS = ['Issuer', 'Cpn', 'Maturity', 'Mty Type', 'Country', 'YTM - Ask', 'YTM - Bid', 'Spread_5y']
+
+# Diversification limits of the selection: the largest bond, issuer and country weights of portfolio.xlsx, rounded up
+SELECTION_CONSTRAINTS = {'max_bond_weight': 0.01, 'max_issuer_weight': 0.3, 'max_country_weight': 0.75}
+
+# =============================================================================
+# BACKTEST
+# =============================================================================
+
+def _settle(holdings, analyzed, cash, date, previous_date):
+    """
+    Roll the holdings from previous_date to date: coupons accrued in between (Cpn / 100 per year on the face value,
+    counted in actual days / 365) are paid into cash, bonds that matured are redeemed at FACE_VALUE, and the other
+    bonds are marked at their bid ('Sell Price') of the date, or keep their last mark when they are not quoted.
+
+    Returns:
+    - tuple: (holdings with updated 'Mark', cash)
+    """
+
+    years = (pd.to_datetime(date) - pd.to_datetime(previous_date)).days / 365
+    matured = holdings['Maturity'] <= pd.to_datetime(date)
+
+    # coupons up to the maturity of the bonds that matured in between
+    accrual_years = np.where(matured, (holdings['Maturity'] - pd.to_datetime(previous_date)).dt.days.clip(lower=0) / 365, years)
+    cash += float((holdings['Number of Bond'] * FACE_VALUE * holdings['Cpn'].fillna(0) / 100 * accrual_years).sum())
+    cash += float((holdings.loc[matured, 'Number of Bond'] * FACE_VALUE).sum())
+
+    holdings = holdings[~matured].copy()
+    holdings['Mark'] = analyzed['Sell Price'].reindex(holdings.index).astype(float).fillna(holdings['Mark'])
+
+    return holdings, cash
+
+
+def run_backtest(start=None, end=None, store=None, rebalance_every=1, total_value=TOTAL_PORTFOLIO_VALUE,
+                 max_turnover=None, candidate_options=None, **constraints):
+    """
+    Replay the portfolio selection over the stored snapshots of bonds-data (see utils/history.py), oldest first.
+
+    On every snapshot date the bonds are analyzed as of that date (bond_analysis.run_analysis()) and the holdings are
+    rolled forward: accrued coupons and redemptions are paid into cash and the bonds are marked at their bid. Every
+    rebalance_every snapshots the selection of portfolio_selection.ipynb is repeated on the candidates of the date
+    (candidate_universe() and optimize_portfolio() with the constraints) for the current portfolio value. Bonds are
+    bought at their ask and sold at their bid, so the bid-ask spread is paid on every trade. The metrics of
+    calculate_portfolio_metrics() are reported for the holdings of every date.
+
+    Only one snapshot, and only BACKTEST_COLUMNS of it, is in memory at a time; bonds are followed across dates by
+    their keys in the history.
+
+    Parameters:
+    - start (date-like, optional): First snapshot date. Default is None for the oldest snapshot.
+    - end (date-like, optional): Last snapshot date. Default is None for the latest snapshot.
+    - store (QuoteStore, optional): The history of bonds-data. Default is None for QuoteStore("bonds-data").
+    - rebalance_every (int, optional): Number of snapshots between two selections. Default is 1, i.e. every snapshot.
+    - total_value (float, optional): The amount invested on the first date. Default is TOTAL_PORTFOLIO_VALUE.
+    - max_turnover (float, optional): Largest sum of absolute weight changes per rebalance. Default is None for no limit.
+    - candidate_options (dict, optional): Keyword arguments of candidate_universe(), e.g. {'ytm_range': (0, 15)}.
+    - **constraints: Keyword arguments of optimize_portfolio(). Default is SELECTION_CONSTRAINTS.
+
+    Returns:
+    - DataFrame: One row per snapshot date with 'Rebalanced', 'Portfolio Value', 'Return (%)', 'Cash', 'Bonds Held',
+                 'Turnover', 'Net Yield', 'Status' and the PORTFOLIO_METRICS of the holdings.
+    """
+
+    store = store or QuoteStore("bonds-data")
+    constraints = constraints or SELECTION_CONSTRAINTS
+
+    dates = store.dates(start, end)
+    if not dates:
+        raise ValueError(f"no snapshots of {store.table} between {start} and {end} in {store.directory}")
+
+    holdings = None
+    cash = float(total_value)
+    value = float(total_value)
+    previous_date = None
+    records = []
+
+    for i, date in enumerate(dates):
+        with stage('read snapshot') as record:
+            snapshot = store.read(date, columns=BACKTEST_COLUMNS)
+            # a bond quoted on several rows of a snapshot is followed through its first quote
+            snapshot = snapshot[~snapshot.index.duplicated()]
+            record['rows_out'] = len(snapshot)
+
+        with stage('analysis'):
+            analyzed = run_analysis(snapshot, as_of=date)
+            analyzed['PD_5y_pct'] = analyzed['Spread_5y'] / LOSS_SEVERITY / 100
+
+        with stage('settle'):
+            if holdings is not None:
+                holdings, cash = _settle(holdings, analyzed, cash, date, previous_date)
+            previous_value = value
+            value = cash + (0 if holdings is None else float((holdings['Number of Bond'] * holdings['Mark']).sum()))
+
+        entry = {'Date': date, 'Rebalanced': False, 'Turnover': 0.0, 'Net Yield': np.nan, 'Status': None}
+        if i % rebalance_every == 0:
+            with stage('selection'):
+                candidates = candidate_universe(analyzed, **(candidate_options or {}))
+                current = None
+                if holdings is not None and max_turnover is not None:
+                    current = holdings.assign(**{'Share per Bond': holdings['Number of Bond'] * holdings['Mark'] / value})
+                result = optimize_portfolio(candidates, total_value=value, current=current, max_turnover=max_turnover,
+                                            **constraints)
+                entry['Status'] = result.message
+
+            if result.portfolio is not None:
+                with stage('trades'):
+                    target = result.portfolio['Number of Bond'].groupby(level=0).sum()
+                    held = pd.Series(dtype=float) if holdings is None else holdings['Number of Bond']
+                    change = target.reindex(target.index.union(held.index), fill_value=0) - held.reindex(target.index.union(held.index), fill_value=0)
+
+                    # buy at the ask, sell at the bid (or the last mark of a bond that is not quoted)
+                    bought, sold = change.clip(lower=0), (-change).clip(lower=0)
+                    ask = analyzed['Buy Price'].reindex(bought.index).astype(float)
+                    bid = analyzed['Sell Price'].reindex(sold.index).astype(float)
+                    if holdings is not None:
+                        bid = bid.fillna(holdings['Mark'].reindex(sold.index))
+                    cash += float((sold * bid).sum() - (bought * ask).sum())
+                    entry['Turnover'] = float(((bought * ask).sum() + (sold * bid).sum()) / value)
+
+                    holdings = analyzed.loc[target.index, ['Issuer', 'Maturity', 'Cpn']].assign(
+                        **{'Number of Bond': target, 'Mark': analyzed.loc[target.index, 'Sell Price'].astype(float)})
+                    entry['Rebalanced'] = True
+                    entry['Net Yield'] = result.objective['Net Yield']
+
+                # the trades cost the bid-ask spread, so the value is marked at the bid again
+                value = cash + float((holdings['Number of Bond'] * holdings['Mark']).sum())
+
+        with stage('metrics'):
+            metrics = dict.fromkeys(PORTFOLIO_METRICS, np.nan)
+            quoted = holdings.index[holdings.index.isin(analyzed.index)] if holdings is not None else []
+            if len(quoted):
+                portfolio = analyzed.loc[quoted].assign(**{'Number of Bond': holdings.loc[quoted, 'Number of Bond']})
+                portfolio['Share per Bond'] = portfolio['Number of Bond'] * portfolio['Buy Price'] / (portfolio['Number of Bond'] * portfolio['Buy Price']).sum()
+                totals = calculate_portfolio_metrics(portfolio, weight_col='Share per Bond', num_bonds_col='Number of Bond',
+                                                     price_col='Buy Price', ytm_col='YTM - Ask',
+                                                     maturity_col='Years to Maturity', coupon_col='Cpn')
+                metrics = dict(zip(totals['Metric'], totals['Value']))
+
+        entry.update({'Portfolio Value': value, 'Return (%)': (value / previous_value - 1) * 100 if i else 0.0,
+                      'Cash': cash, 'Bonds Held': 0 if holdings is None else len(holdings), **metrics})
+        records.append(entry)
+        previous_date = date
+
+    columns = ['Date', 'Rebalanced', 'Portfolio Value', 'Return (%)', 'Cash', 'Bonds Held', 'Turnover', 'Net Yield', 'Status'] + PORTFOLIO_METRICS
+    return pd.DataFrame(records, columns=columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest the portfolio selection over the snapshots in processed_data/history/.")
+    parser.add_argument("--start", default=None, help="first snapshot date (default: the oldest)")
+    parser.add_argument("--end", default=None, help="last snapshot date (default: the latest)")
+    parser.add_argument("--rebalance-every", type=int, default=1, help="snapshots between two selections (default: 1)")
+    parser.add_argument("--total-value", type=float, default=TOTAL_PORTFOLIO_VALUE, help=f"amount invested on the first date (default: {TOTAL_PORTFOLIO_VALUE})")
+    parser.add_argument("--max-turnover", type=float, default=None, help="largest sum of absolute weight changes per rebalance (default: no limit)")
+    for name, limit in SELECTION_CONSTRAINTS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=float, default=limit, help=f"selection limit (default: {limit})")
+    parser.add_argument("--price-options", action="store_true", help="also select callable and putable bonds, priced on short-rate trees (see utils/lattice.py)")
+    parser.add_argument("--trace", action="store_true", help="time every step and write a trace to processed_data/traces/")
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        enable_tracing()
+
+    results = run_backtest(start=args.start, end=args.end, rebalance_every=args.rebalance_every,
+                           total_value=args.total_value, max_turnover=args.max_turnover,
+                           candidate_options={'price_options': True} if args.price_options else None,
+                           **{name: getattr(args, name) for name in SELECTION_CONSTRAINTS})
+
+    # write the results to the columnar store
+    write_table(results, "backtest")
+    print(results[['Date', 'Rebalanced', 'Portfolio Value', 'Return (%)', 'Bonds Held', 'Turnover', 'Net Yield',
+                   'YTM', 'Modified Duration']].to_string(index=False, float_format=lambda value: f"{value:,.4f}"))
+    total_return = (results['Portfolio Value'].iloc[-1] / args.total_value - 1) * 100
+    print(f"total return {total_return:.2f}% over {len(results)} snapshots")
+
+    finish_trace("backtest")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+# run.py
+# |--- BENCHMARKS
+# |--- time_benchmark()
+# |--- run_benchmarks()
+# |--- compare_to_baseline()
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_bonds, synthetic_cds, synthetic_portfolio, synthetic_raw_bonds
+from bond_analysis import run_analysis, update_analysis
+from pricing_service import BondUniverse, PricingService
+from utils import bond_math
+from utils.correct_avg_and_3m import correct_avg_and_3m
+from utils.get_country import CountryResolver
+from utils.lattice import price_embedded_options
+from utils.portfolio_metrics import calculate_portfolio_metrics
+from utils.schema import FACE_VALUE
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+PROJECT_DIR = BENCHMARK_DIR.parent
+RESULTS_FILE = BENCHMARK_DIR / "results.json"
+BASELINE_FILE = BENCHMARK_DIR / "baseline.json"
+
+# Universe sizes (bonds of the raw export) run by default; 1,000,000 is supported but takes a few minutes
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+REPEAT = 5
+SEED = 0
+
+# A benchmark is a regression when its median time (or peak memory) grows by more than this share of the baseline
+TOLERANCE = 0.25
+
+# Bonds per bond_math call, like the chunks of bond_analysis.run_analysis(); bounds the padded period matrices
+BATCH_SIZE = 100_000
+
+# Bonds priced one at a time by the scalar bond_math functions; their cost per call does not depend on the universe
+SCALAR_CALLS = 2_000
+
+# Concurrent clients of the pricing service, risk requests per client and bonds per request
+SERVICE_CLIENTS = 32
+SERVICE_REQUESTS = 50
+SERVICE_BONDS_PER_REQUEST = 10
+
+# A benchmark prepares its inputs in setup(n_bonds, seed), which is not timed, and is timed on run(*inputs).
+# Subprocess benchmarks return the peak resident memory of the child process in bytes from run().
+Benchmark = namedtuple('Benchmark', ['name', 'group', 'setup', 'run', 'subprocess'])
+
+# ==============================================================================================================
+# 1. BENCHMARKS
+# ==============================================================================================================
+
+@lru_cache(maxsize=1)
+def _universe(n_bonds, seed):
+    """Synthetic bonds-data, its bond_math inputs and the analyzed bonds, shared by the benchmarks of one size."""
+    bonds = synthetic_bonds(n_bonds, seed=seed)
+    analyzed = run_analysis(bonds, chunk_size=BATCH_SIZE)
+    inputs = {col: analyzed[col].to_numpy(dtype=float)
+              for col in ['Years to Maturity', 'YTM - Bid', 'YTM - Ask', 'Cpn', 'Buy Price']}
+    return bonds, analyzed, inputs
+
+
+def _batched(function, *arrays, **kwargs):
+    """Call function on BATCH_SIZE slices of the per-bond arrays."""
+    for start in range(0, len(arrays[0]), BATCH_SIZE):
+        function(*(array[start:start + BATCH_SIZE] for array in arrays), **kwargs)
+
+
+def _per_bond(function, *arrays, **kwargs):
+    """Call function once per bond, like the DataFrame.apply() calls of the notebooks."""
+    for values in zip(*(array.tolist() for array in arrays)):
+        function(*values, **kwargs)
+
+
+def _bond_math_benchmark(name, argument_columns, scalar=False):
+    """
+    Benchmark of a bond_math function called with FACE_VALUE and the given input columns. Batched functions get the
+    whole universe in BATCH_SIZE slices; the scalar API is called once per bond on the first SCALAR_CALLS bonds.
+    """
+
+    def setup(n_bonds, seed):
+        inputs = _universe(n_bonds, seed)[2]
+        n_calls = min(len(inputs['Cpn']), SCALAR_CALLS) if scalar else len(inputs['Cpn'])
+        return [np.full(n_calls, FACE_VALUE, dtype=float)] + [inputs[col][:n_calls] for col in argument_columns]
+
+    function = getattr(bond_math, name)
+    return Benchmark(name, 'bond_math', setup, lambda *arrays: (_per_bond if scalar else _batched)(function, *arrays), False)
+
+
+def _setup_solve_ytm(n_bonds, seed):
+    # back out the yields of the ask prices
+    inputs = _universe(n_bonds, seed)[2]
+    face_value = np.full(len(inputs['Cpn']), FACE_VALUE, dtype=float)
+    return inputs['Buy Price'], face_value, inputs['Years to Maturity'], inputs['Cpn']
+
+
+def _setup_get_country(n_bonds, seed):
+    return [synthetic_raw_bonds(n_bonds, seed=seed)['Issuer Name']]
+
+
+def _setup_correct_avg_and_3m(n_bonds, seed):
+    return [synthetic_cds(n_bonds, seed=seed)]
+
+
+def _setup_update_analysis(n_bonds, seed):
+    # 1% of the bonds get a new quote
+    bonds, analyzed, _ = _universe(n_bonds, seed)
+    requoted = bonds.copy()
+    changed = np.random.default_rng([seed, 4]).random(len(bonds)) < 0.01
+    requoted.loc[changed, 'YTM - Ask'] += 0.01
+    return requoted, analyzed
+
+
+def _setup_portfolio_metrics(n_bonds, seed):
+    return [synthetic_portfolio(_universe(n_bonds, seed)[1], seed=seed)]
+
+
+def _calculate_portfolio_metrics(portfolio):
+    calculate_portfolio_metrics(portfolio, weight_col='Share per Bond', num_bonds_col='Number of Bond',
+                                price_col='Buy Price', ytm_col='YTM - Ask', maturity_col='Years to Maturity', coupon_col='Cpn')
+
+
+# Scratch projects of the data_cleaning benchmark, removed after the run
+_SCRATCH_DIRS = []
+
+# Runs a script as __main__ and reports its peak resident memory (ru_maxrss is in kB on Linux) on the last stderr line
+_CHILD = ("import resource, runpy, sys; sys.argv = sys.argv[1:]; runpy.run_path(sys.argv[0], run_name='__main__'); "
+          "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, file=sys.stderr)")
+
+
+def _setup_data_cleaning(n_bonds, seed):
+    # a scratch project with the original CDS and pairing workbooks, so processed_data/ is never touched
+    workdir = Path(tempfile.mkdtemp(prefix="bond-benchmark-"))
+    _SCRATCH_DIRS.append(workdir)
+    shutil.copytree(PROJECT_DIR / "original_data", workdir / "original_data",
+                    ignore=shutil.ignore_patterns("bonds.xlsx"))
+    synthetic_raw_bonds(n_bonds, seed=seed).to_parquet(workdir / "bonds.parquet")
+
+    # build the cached CDS table once, outside of the timings
+    _data_cleaning(workdir)
+    return [workdir]
+
+
+def _data_cleaning(workdir):
+    completed = subprocess.run([sys.executable, "-c", _CHILD, str(PROJECT_DIR / "data_cleaning.py"), "--input", "bonds.parquet"],
+                               cwd=workdir, env={**os.environ, "PYTHONPATH": str(PROJECT_DIR), "PYTHONHASHSEED": "0"},
+                               check=True, capture_output=True, text=True)
+    return int(completed.stderr.split()[-1])
+
+
+# Pricing services of the pricing_service benchmark as (loop, serving task, thread), stopped after the run
+_SERVICES = []
+
+
+def _setup_pricing_service(n_bonds, seed):
+    # the synthetic universe mapped from a scratch directory, served on a free port by a thread of this process
+    analyzed = _universe(n_bonds, seed)[1]
+    workdir = Path(tempfile.mkdtemp(prefix="bond-benchmark-"))
+    _SCRATCH_DIRS.append(workdir)
+    service = PricingService(BondUniverse.build(analyzed, f"synthetic-{n_bonds}-{seed}", directory=workdir))
+
+    loop = asyncio.new_event_loop()
+    listening = threading.Event()
+    address = []
+    task = loop.create_task(service.serve("127.0.0.1", 0, started=lambda host_port: (address.append(host_port), listening.set())))
+    thread = threading.Thread(target=lambda: loop.run_until_complete(asyncio.gather(task, return_exceptions=True)), daemon=True)
+    thread.start()
+    listening.wait()
+    _SERVICES.append((loop, task, thread))
+
+    rows = np.random.default_rng([seed, 5]).integers(0, len(analyzed), (SERVICE_CLIENTS, SERVICE_REQUESTS, SERVICE_BONDS_PER_REQUEST))
+    requests = [[json.dumps({'bonds': bonds.tolist()}).encode() for bonds in client] for client in rows]
+    return address[0], requests
+
+
+async def _service_client(address, requests):
+    """Send the risk requests one after the other over one keep-alive connection."""
+    reader, writer = await asyncio.open_connection(*address)
+    for body in requests:
+        writer.write(b"POST /risk HTTP/1.1\r\nHost: localhost\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+        headers = await reader.readuntil(b"\r\n\r\n")
+        length = int(headers.lower().split(b"content-length:")[1].split(b"\r\n")[0])
+        await reader.readexactly(length)
+    writer.close()
+
+
+def _pricing_service(address, requests):
+    async def load():
+        await asyncio.gather(*(_service_client(address, client) for client in requests))
+    asyncio.run(load())
+
+
+def _stop_services():
+    while _SERVICES:
+        loop, task, thread = _SERVICES.pop()
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join()
+        loop.close()
+
+
+BENCHMARKS = [
+    _bond_math_benchmark('compute_bond_risk', ['Years to Maturity', 'YTM - Ask', 'Cpn']),
+    _bond_math_benchmark('calculate_bond_analytics', ['Years to Maturity', 'YTM - Bid', 'YTM - Ask', 'Cpn']),
+    _bond_math_benchmark('calculate_bond_price', ['Years to Maturity', 'YTM - Bid', 'YTM - Ask', 'Cpn'], scalar=True),
+    _bond_math_benchmark('calculate_macaulay_duration', ['Years to Maturity', 'YTM - Bid', 'YTM - Ask', 'Cpn'], scalar=True),
+    _bond_math_benchmark('calculate_modified_duration', ['Years to Maturity', 'YTM - Bid', 'YTM - Ask', 'Cpn'], scalar=True),
+    _bond_math_benchmark('calculate_bond_convexity', ['Years to Maturity', 'YTM - Bid', 'YTM - Ask', 'Cpn'], scalar=True),
+    _bond_math_benchmark('calculate_dv01', ['Cpn', 'Years to Maturity', 'YTM - Bid'], scalar=True),
+    Benchmark('solve_ytm', 'bond_math', _setup_solve_ytm, lambda *arrays: _batched(bond_math.solve_ytm, *arrays), False),
+    # a fresh resolver (including its index) for every run, so every distinct issuer name is resolved
+    Benchmark('get_country', 'data_cleaning', _setup_get_country,
+              lambda issuer_names: CountryResolver().resolve_series(issuer_names), False),
+    # correct_avg_and_3m() corrects its input in place, so every run gets a fresh copy
+    Benchmark('correct_avg_and_3m', 'data_cleaning', _setup_correct_avg_and_3m, lambda cds: correct_avg_and_3m(cds.copy()), False),
+    Benchmark('data_cleaning', 'stage', _setup_data_cleaning, _data_cleaning, True),
+    Benchmark('bond_analysis', 'stage', lambda n_bonds, seed: [_universe(n_bonds, seed)[0]],
+              lambda bonds: run_analysis(bonds, chunk_size=BATCH_SIZE), False),
+    Benchmark('bond_analysis (incremental)', 'stage', _setup_update_analysis,
+              lambda bonds, previous: update_analysis(bonds, previous, chunk_size=BATCH_SIZE), False),
+    Benchmark('portfolio_metrics', 'stage', _setup_portfolio_metrics, _calculate_portfolio_metrics, False),
+    # OAS, effective duration and convexity of the callable and putable bonds, including the fits of the country curves
+    Benchmark('price_embedded_options', 'lattice', lambda n_bonds, seed: [_universe(n_bonds, seed)[1]], price_embedded_options, False),
+    # SERVICE_CLIENTS concurrent clients, each sending SERVICE_REQUESTS risk requests of SERVICE_BONDS_PER_REQUEST bonds
+    Benchmark('pricing_service', 'service', _setup_pricing_service, _pricing_service, False),
+]
+
+# ==============================================================================================================
+# 2. time_benchmark()
+# ==============================================================================================================
+
+def time_benchmark(benchmark, n_bonds, seed=SEED, repeat=REPEAT):
+    """
+    Time a benchmark on a synthetic universe of n_bonds bonds and measure its peak memory.
+
+    Every run is timed with time.perf_counter() and the garbage collector disabled, like timeit. The peak memory of
+    in-process benchmarks is measured in one extra, untimed run with tracemalloc (which tracks the NumPy and pandas
+    allocations); subprocess benchmarks report the peak resident memory of the child process.
+
+    Parameters:
+    - benchmark (Benchmark): The benchmark, an entry of BENCHMARKS.
+    - n_bonds (int): Size of the synthetic universe (bonds of the raw export).
+    - seed (int, optional): Seed of the synthetic data. Default is SEED.
+    - repeat (int, optional): Number of timed runs. Default is REPEAT.
+
+    Returns:
+    - dict: 'name', 'group', 'n_bonds', 'times_s', 'min_s', 'median_s', 'peak_memory_mb' and 'memory_method'.
+    """
+
+    inputs = benchmark.setup(n_bonds, seed)
+
+    times, peaks = [], []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            output = benchmark.run(*inputs)
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+        if benchmark.subprocess:
+            peaks.append(output)
+        del output
+
+    if not benchmark.subprocess:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            benchmark.run(*inputs)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'name': benchmark.name,
+        'group': benchmark.group,
+        'n_bonds': n_bonds,
+        'times_s': times,
+        'min_s': min(times),
+        'median_s': statistics.median(times),
+        'peak_memory_mb': max(peaks) / 2**20,
+        'memory_method': 'maxrss' if benchmark.subprocess else 'tracemalloc',
+    }
+
+# ==============================================================================================================
+# 3. run_benchmarks()
+# ==============================================================================================================
+
+def run_benchmarks(sizes=DEFAULT_SIZES, names=None, seed=SEED, repeat=REPEAT):
+    """
+    Run the benchmarks on synthetic universes of every size. The inputs only depend on the sizes and the seed and
+    nothing is read from or written to processed_data/, so runs are reproducible and need no network.
+
+    Parameters:
+    - sizes (list, optional): Universe sizes. Default is DEFAULT_SIZES.
+    - names (list, optional): Names of the benchmarks to run. Default is None for all of BENCHMARKS.
+    - seed (int, optional): Seed of the synthetic data. Default is SEED.
+    - repeat (int, optional): Number of timed runs per benchmark. Default is REPEAT.
+
+    Returns:
+    - dict: 'metadata' (versions, machine and settings) and 'results' (one time_benchmark() dict per benchmark and size).
+    """
+
+    benchmarks = [benchmark for benchmark in BENCHMARKS if names is None or benchmark.name in names]
+
+    results = []
+    try:
+        for n_bonds in sizes:
+            for benchmark in benchmarks:
+                result = time_benchmark(benchmark, n_bonds, seed=seed, repeat=repeat)
+                print(f"{benchmark.name:<30} {n_bonds:>9} bonds  {result['median_s']:>9.4f} s  {result['peak_memory_mb']:>8.1f} MB")
+                results.append(result)
+    finally:
+        _stop_services()
+        _universe.cache_clear()
+        while _SCRATCH_DIRS:
+            shutil.rmtree(_SCRATCH_DIRS.pop(), ignore_errors=True)
+
+    metadata = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'repeat': repeat,
+        'sizes': list(sizes),
+    }
+
+    return {'metadata': metadata, 'results': results}
+
+# ==============================================================================================================
+# 4. compare_to_baseline()
+# ==============================================================================================================
+
+def compare_to_baseline(results, baseline, tolerance=TOLERANCE):
+    """
+    Compare the median times and peak memory of a run with a baseline run, benchmark by benchmark and size by size.
+
+    Parameters:
+    - results (dict): Output of run_benchmarks().
+    - baseline (dict): An earlier output of run_benchmarks(), e.g. loaded from BASELINE_FILE.
+    - tolerance (float, optional): Relative growth above which a benchmark is a regression. Default is TOLERANCE.
+
+    Returns:
+    - DataFrame: One row per benchmark and size found in both runs, with 'Benchmark', 'Bonds', the baseline and
+                 current median time and peak memory, their ratios and 'Status' ('regression', 'improvement' or 'ok').
+    """
+
+    previous = {(result['name'], result['n_bonds']): result for result in baseline['results']}
+
+    rows = []
+    for result in results['results']:
+        base = previous.get((result['name'], result['n_bonds']))
+        if base is None:
+            continue
+        time_ratio = result['median_s'] / base['median_s']
+        memory_ratio = result['peak_memory_mb'] / base['peak_memory_mb'] if base['peak_memory_mb'] else 1.0
+        if time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance:
+            status = 'regression'
+        elif time_ratio < 1 / (1 + tolerance):
+            status = 'improvement'
+        else:
+            status = 'ok'
+        rows.append({
+            'Benchmark': result['name'],
+            'Bonds': result['n_bonds'],
+            'Baseline Time (s)': base['median_s'],
+            'Time (s)': result['median_s'],
+            'Time Ratio': time_ratio,
+            'Baseline Memory (MB)': base['peak_memory_mb'],
+            'Memory (MB)': result['peak_memory_mb'],
+            'Memory Ratio': memory_ratio,
+            'Status': status,
+        })
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark bond_math, data_cleaning, bond_analysis, portfolio_metrics and the pricing service on synthetic bond universes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="universe sizes in bonds (default: 1000 10000 100000)")
+    parser.add_argument("--only", nargs="+", default=None, help="names of the benchmarks to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help=f"timed runs per benchmark (default: {REPEAT})")
+    parser.add_argument("--seed", type=int, default=SEED, help=f"seed of the synthetic data (default: {SEED})")
+    parser.add_argument("--output", type=Path, default=RESULTS_FILE, help="where to write the results (default: benchmarks/results.json)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE, help="baseline to compare with (default: benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="also store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help=f"relative slowdown counted as a regression (default: {TOLERANCE})")
+    args = parser.parse_args()
+
+    results = run_benchmarks(sizes=args.sizes, names=args.only, seed=args.seed, repeat=args.repeat)
+
+    # compare with the stored baseline before it may be replaced
+    comparison = None
+    if args.baseline.exists():
+        comparison = compare_to_baseline(results, json.loads(args.baseline.read_text()), tolerance=args.tolerance)
+        results['comparison'] = comparison.to_dict(orient='records')
+        if not comparison.empty:
+            print()
+            print(comparison.to_string(index=False, float_format=lambda value: f"{value:.4g}"))
+
+    args.output.write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2))
+
+    # a non-zero exit code lets the run gate a change
+    if comparison is not None and not comparison.empty and (comparison['Status'] == 'regression').any():
+        sys.exit(1)
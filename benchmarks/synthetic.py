@@ -0,0 +1,215 @@
+# synthetic.py
+# |--- synthetic_raw_bonds()
+# |--- synthetic_bonds()
+# |--- synthetic_cds()
+# |--- synthetic_portfolio()
+
+import numpy as np
+import pandas as pd
+from utils.schema import AS_OF_DATE, CDS_COLUMNS, apply_schema
+
+# Countries of the synthetic issuers; all of them are known to pycountry, so the country resolver finds them
+SYNTHETIC_COUNTRIES = ['United States', 'Germany', 'France', 'Italy', 'Spain', 'Mexico', 'Brazil', 'Chile', 'Peru',
+                       'Colombia', 'Indonesia', 'Philippines', 'Japan', 'Korea', 'China', 'India', 'Turkey', 'Poland',
+                       'Romania', 'Hungary', 'South Africa', 'Nigeria', 'Egypt', 'Morocco', 'Saudi Arabia', 'Qatar',
+                       'Israel', 'Canada', 'Australia', 'Norway', 'Sweden', 'Austria', 'Belgium', 'Netherlands',
+                       'Portugal', 'Greece', 'Panama', 'Uruguay', 'Argentina', 'Ukraine']
+
+# Issuer name patterns, the last one has no country in it (like the issuers of the manual pairings)
+ISSUER_TEMPLATES = ['{country} Treasury Note/Bond', 'Republic of {country}', '{country} Government International Bond',
+                    '{country} Development Bank {i}', 'Synthetic Holdings {i}']
+
+# Columns and value sets of the raw export (original_data/bonds.xlsx)
+MTY_TYPES = ['AT MATURITY', 'CALLABLE', 'NORMAL', 'SINKABLE', 'PUTABLE', 'CALL/SINK', 'CALL/PUT']
+MTY_TYPE_SHARES = [0.64, 0.28, 0.055, 0.013, 0.005, 0.004, 0.003]
+RATINGS = ['AAA', 'AA+', 'AA-', 'A+', 'BBB', 'NR']
+CURRENCIES = ['USD', 'EUR']
+
+# Bonds per issuer in bonds-data is about 20
+BONDS_PER_ISSUER = 20
+
+# ==============================================================================================================
+# 1. synthetic_raw_bonds()
+# ==============================================================================================================
+
+def _issuers(n_bonds, rng):
+    """Issuer names and countries of n_bonds bonds, about BONDS_PER_ISSUER bonds per issuer."""
+    n_issuers = max(len(SYNTHETIC_COUNTRIES), n_bonds // BONDS_PER_ISSUER)
+    issuer_ids = np.arange(n_issuers)
+    countries = np.array(SYNTHETIC_COUNTRIES)[issuer_ids % len(SYNTHETIC_COUNTRIES)]
+    names = np.array([ISSUER_TEMPLATES[i % len(ISSUER_TEMPLATES)].format(country=country, i=i)
+                      for i, country in zip(issuer_ids, countries)])
+    issuer_of_bond = rng.integers(0, n_issuers, n_bonds)
+    return names[issuer_of_bond], countries[issuer_of_bond]
+
+
+def synthetic_raw_bonds(n_bonds, seed=0):
+    """
+    Generate a raw bond export with the columns and quirks of original_data/bonds.xlsx: maturities as 'dd.mm.YYYY'
+    text (some already matured or beyond 2054), empty BVAL columns, missing and '#N/A Field Not Applicable' yields,
+    'NR' ratings and '#N/A' series. The same n_bonds and seed always give the same export.
+
+    Parameters:
+    - n_bonds (int): Number of bonds.
+    - seed (int, optional): Seed of the generator. Default is 0.
+
+    Returns:
+    - DataFrame: The raw export, ready for data_cleaning.py (e.g. written to Parquet or CSV and passed as --input).
+    """
+
+    rng = np.random.default_rng(seed)
+    issuers, countries = _issuers(n_bonds, rng)
+
+    # maturities from a year in the past to 35 years ahead, so the maturity filter drops a few percent
+    maturity = pd.Timestamp(AS_OF_DATE) + pd.to_timedelta(rng.integers(-365, 35 * 365, n_bonds), unit='D')
+    tenor = np.clip((maturity - pd.Timestamp(AS_OF_DATE)).days.to_numpy() / 365, 0.05, None)
+
+    # upward sloping curve per country plus bond noise; the bid yield is a few bp above the ask yield
+    country_level = pd.Series(rng.uniform(2, 9, len(SYNTHETIC_COUNTRIES)), index=SYNTHETIC_COUNTRIES)
+    ask = country_level[countries].to_numpy() + 0.4 * np.log1p(tenor) + rng.normal(0, 0.3, n_bonds)
+    bid = ask + rng.uniform(0.005, 0.15, n_bonds)
+
+    # yields are text in the export where some of them are not applicable, like a CSV column read as text
+    ask, bid = ask.round(6).astype(str).astype(object), bid.round(6).astype(str).astype(object)
+    missing = rng.random(n_bonds) < 0.02
+    not_applicable = rng.random(n_bonds) < 0.002
+    ask[missing], bid[missing] = None, None
+    ask[not_applicable] = '#N/A Field Not Applicable'
+
+    return pd.DataFrame({
+        'Issuer Name': issuers,
+        'Ticker': [name.split()[0].upper()[:4] for name in issuers],
+        'Amt Out': rng.integers(1, 500, n_bonds) * 10_000_000,
+        'Cpn': (rng.integers(0, 41, n_bonds) * 0.25).astype(float),
+        'Maturity': maturity.strftime('%d.%m.%Y'),
+        'BVAL Ask Yld': '#N/A Authorization',
+        'BVAL Bid Yld': '#N/A Authorization',
+        'Yld to Mty (Ask)': ask,
+        'Yld to Mty (Bid)': bid,
+        'Series': np.where(rng.random(n_bonds) < 0.9, '#N/A Field Not Applicable', 'REGS'),
+        'BBG Composite': rng.choice(RATINGS, n_bonds),
+        'Mty Type': rng.choice(MTY_TYPES, n_bonds, p=MTY_TYPE_SHARES),
+        'Currency': rng.choice(CURRENCIES, n_bonds, p=[0.68, 0.32]),
+    })
+
+# ==============================================================================================================
+# 2. synthetic_bonds()
+# ==============================================================================================================
+
+def synthetic_bonds(n_bonds, seed=0):
+    """
+    Generate a cleaned bond universe with the columns and dtypes of processed_data/bonds-data.parquet, i.e. the
+    input of bond_analysis.py. The bonds are those of synthetic_raw_bonds() that the cleaning rules would keep, with
+    CDS quotes from synthetic_cds() merged by country; there are slightly fewer than n_bonds of them.
+
+    Parameters:
+    - n_bonds (int): Number of bonds of the raw export.
+    - seed (int, optional): Seed of the generator. Default is 0.
+
+    Returns:
+    - DataFrame: The bonds data.
+    """
+
+    raw = synthetic_raw_bonds(n_bonds, seed=seed)
+
+    bonds = raw.assign(Maturity=pd.to_datetime(raw['Maturity'], format='%d.%m.%Y'))
+    bonds = bonds[(bonds['Maturity'] >= pd.Timestamp(AS_OF_DATE)) & (bonds['Maturity'].dt.year <= 2054)]
+    bonds = bonds.dropna(subset=['Yld to Mty (Ask)', 'Yld to Mty (Bid)'])
+    bonds = bonds[bonds['Yld to Mty (Ask)'] != '#N/A Field Not Applicable']
+
+    # one row of CDS statistics per country and tenor
+    cds = pd.DataFrame({'Country': SYNTHETIC_COUNTRIES})
+    for i, tenor in enumerate(('10y', '5y', '2y')):
+        quotes = synthetic_cds(len(SYNTHETIC_COUNTRIES), seed=3 * seed + i, swapped=0).drop(columns='Name')
+        cds = cds.join(quotes.add_suffix(f'_{tenor}'))
+    cds[CDS_COLUMNS] = cds[CDS_COLUMNS].apply(pd.to_numeric, errors='coerce')
+
+    # the issuer's country, as the resolver would find it (the last issuer template has none)
+    codes, names = pd.factorize(bonds['Issuer Name'])
+    name_countries = [next((country for country in SYNTHETIC_COUNTRIES if country in name), None) for name in names]
+
+    bonds = bonds.assign(**{
+        'Country': np.array(name_countries, dtype=object)[codes],
+        'Yld to Mty (Ask)': pd.to_numeric(bonds['Yld to Mty (Ask)']),
+        'Yld to Mty (Bid)': pd.to_numeric(bonds['Yld to Mty (Bid)']),
+        'BBG Composite': bonds['BBG Composite'].replace('NR', np.nan),
+        'Series': bonds['Series'].replace('#N/A Field Not Applicable', np.nan),
+    })
+    bonds = bonds.drop(columns=['BVAL Ask Yld', 'BVAL Bid Yld']).merge(cds, on='Country', how='left')
+    bonds = bonds.rename(columns={'Issuer Name': 'Issuer', 'Yld to Mty (Ask)': 'YTM - Ask', 'Yld to Mty (Bid)': 'YTM - Bid'})
+
+    return apply_schema(bonds, 'bonds-data')
+
+# ==============================================================================================================
+# 3. synthetic_cds()
+# ==============================================================================================================
+
+def synthetic_cds(n_rows, seed=0, swapped=0.1):
+    """
+    Generate a sheet of original_data/cds_by_countries.xlsx: 'Name', 'Spread' (text, some with a trailing '*'),
+    'Change' (text with a sign), 'SD', 'Low', 'High', 'Avg', '3M +/-' and '3M Chg'. In a share of the rows the
+    'Avg' and '3M +/-' values are swapped, which correct_avg_and_3m() repairs.
+
+    Parameters:
+    - n_rows (int): Number of rows.
+    - seed (int, optional): Seed of the generator. Default is 0.
+    - swapped (float, optional): Share of rows with 'Avg' and '3M +/-' swapped. Default is 0.1.
+
+    Returns:
+    - DataFrame: The CDS sheet.
+    """
+
+    rng = np.random.default_rng([seed, 2])
+
+    low = rng.uniform(10, 300, n_rows).round(1)
+    high = (low * rng.uniform(1.1, 3, n_rows)).round(1)
+    avg = rng.uniform(low, high).round(1)
+    spread = rng.uniform(low, high).round(2)
+    change_3m = rng.normal(0, 0.3 * low).round(1)
+
+    swap = rng.random(n_rows) < swapped
+    avg, change_3m = np.where(swap, change_3m, avg), np.where(swap, avg, change_3m)
+
+    return pd.DataFrame({
+        'Name': [SYNTHETIC_COUNTRIES[i % len(SYNTHETIC_COUNTRIES)] for i in range(n_rows)],
+        'Spread': [f'{value:.2f}*' if star else f'{value:.2f}' for value, star in zip(spread, rng.random(n_rows) < 0.05)],
+        'Change': [f'{value:+.2f}' for value in rng.normal(0, 2, n_rows)],
+        'SD': rng.normal(0, 1, n_rows).round(1),
+        'Low': low,
+        'High': high,
+        'Avg': avg,
+        '3M +/-': change_3m,
+        '3M Chg': rng.normal(0, 10, n_rows).round(1),
+    })
+
+# ==============================================================================================================
+# 4. synthetic_portfolio()
+# ==============================================================================================================
+
+def synthetic_portfolio(analyzed, n_holdings=None, total_value=10_000_000, loss_severity=0.6, seed=0):
+    """
+    Draw a portfolio with the columns of portfolio.xlsx from analyzed bonds (the output of bond_analysis.run_analysis()).
+
+    Parameters:
+    - analyzed (DataFrame): The analyzed bonds.
+    - n_holdings (int, optional): Number of bonds held. Default is None for all of them.
+    - total_value (float, optional): The amount invested. Default is 10,000,000.
+    - loss_severity (float, optional): Loss given default for 'PD_5y_pct'. Default is 0.6.
+    - seed (int, optional): Seed of the generator. Default is 0.
+
+    Returns:
+    - DataFrame: The portfolio with 'Share per Bond', 'Amount per Bond', 'Number of Bond' and 'PD_5y_pct' columns.
+    """
+
+    rng = np.random.default_rng([seed, 3])
+
+    n_holdings = len(analyzed) if n_holdings is None else min(n_holdings, len(analyzed))
+    portfolio = analyzed.iloc[np.sort(rng.choice(len(analyzed), n_holdings, replace=False))].copy()
+
+    share = rng.random(n_holdings)
+    portfolio['Share per Bond'] = share / share.sum()
+    portfolio['Amount per Bond'] = portfolio['Share per Bond'] * total_value
+    portfolio['Number of Bond'] = portfolio['Amount per Bond'] / portfolio['Buy Price']
+    portfolio['PD_5y_pct'] = portfolio['Spread_5y'] / loss_severity / 100
+
+    return portfolio
@@ -1,134 +1,215 @@
+import argparse
 import pandas as pd
 import numpy as np
-from pathlib import Path
-from utils.bond_math import calculate_bond_price, calculate_macaulay_duration, calculate_modified_duration, calculate_bond_convexity, calculate_dv01
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from utils.bond_math import calculate_bond_analytics
+from utils.storage import read_table, write_table, export_excel
+from utils.schema import AS_OF_DATE, FACE_VALUE, apply_schema
+from utils.instrumentation import enable_tracing, finish_trace, stage
 
-# Set the project directory for easy access to the data
-PROJECT_DIR = Path().resolve()
+# Inputs of calculate_bond_analytics() after the face value (in argument order) and the columns it returns
+ANALYTICS_INPUTS = ['Years to Maturity', 'YTM - Bid', 'YTM - Ask', 'Cpn']
+ANALYTICS_OUTPUTS = ['Buy Price', 'Sell Price',
+                     'Macaulay Duration (Buy)', 'Macaulay Duration (Sell)',
+                     'Modified Duration (Buy)', 'Modified Duration (Sell)',
+                     'Convexity (Buy)', 'Convexity (Sell)',
+                     'DV01 (Buy)', 'DV01 (Sell)']
 
-# load the data
-data = pd.read_pickle(PROJECT_DIR / "processed_data" / "bonds-data.pkl")
+# =============================================================================
+# 0. Chunked (optionally parallel) execution of the bond_math computations
+# =============================================================================
 
-# Convert Maturity column to datetime, and find the years to maturity
-data["Maturity"] = pd.to_datetime(data["Maturity"])
-data["Years to Maturity"] = round((data["Maturity"] - pd.to_datetime('2023-11-24')).dt.days / 365).astype(int)
-data["Years to Maturity"] = np.where(data["Years to Maturity"] == 0, 1, data["Years to Maturity"])
+def _analyze_chunk(task):
+    """
+    Worker: compute the analytics for rows [start, stop) of the shared input buffer and write them into the
+    shared output buffer. Only the buffer names and the row range are pickled, never the data itself.
+    """
 
-# Add a new column named "Face Value" with a constant value of 1000
-data['Face Value'] = 1000
+    input_name, output_name, n_bonds, start, stop, max_periods = task
 
-# =============================================================================
-# 1. BOND PRICE
-# =============================================================================
-# Calculate Buy Price
-data['Buy Price'] = data.apply(lambda row: calculate_bond_price(
-    face_value=row['Face Value'],
-    years_to_maturity=row['Years to Maturity'],
-    ytm_bid=row['YTM - Bid'],
-    ytm_ask=row['YTM - Ask'],
-    coupon_rate=row['Cpn'],
-    buying=True
-), axis=1)
-
-# Calculate Sell Price
-data['Sell Price'] = data.apply(lambda row: calculate_bond_price(
-    face_value=row['Face Value'],
-    years_to_maturity=row['Years to Maturity'],
-    ytm_bid=row['YTM - Bid'],
-    ytm_ask=row['YTM - Ask'],
-    coupon_rate=row['Cpn'], 
-    buying=False
-), axis=1)
+    input_shm = shared_memory.SharedMemory(name=input_name)
+    output_shm = shared_memory.SharedMemory(name=output_name)
+    try:
+        inputs = np.ndarray((len(ANALYTICS_INPUTS), n_bonds), dtype=np.float64, buffer=input_shm.buf)
+        outputs = np.ndarray((len(ANALYTICS_OUTPUTS), n_bonds), dtype=np.float64, buffer=output_shm.buf)
 
-# =============================================================================
-# 2. MACAULAY DURATION
-# =============================================================================
-# Calculate Macaulay Duration for Buying
-data['Macaulay Duration (Buy)'] = data.apply(lambda row: calculate_macaulay_duration(
-    face_value=row['Face Value'],
-    years_to_maturity=row['Years to Maturity'],
-    ytm_bid=row['YTM - Bid'],
-    ytm_ask=row['YTM - Ask'],
-    coupon_rate=row['Cpn'],
-    buying=True
-), axis=1)
-
-# Calculate Macaulay Duration for Selling
-data['Macaulay Duration (Sell)'] = data.apply(lambda row: calculate_macaulay_duration(
-    face_value=row['Face Value'], 
-    years_to_maturity=row['Years to Maturity'],
-    ytm_bid=row['YTM - Bid'],
-    ytm_ask=row['YTM - Ask'],
-    coupon_rate=row['Cpn'],
-    buying=False
-), axis=1)
+        analytics = calculate_bond_analytics(FACE_VALUE, *inputs[:, start:stop], max_periods=max_periods)
+        for i, col in enumerate(ANALYTICS_OUTPUTS):
+            outputs[i, start:stop] = analytics[col]
 
-# =============================================================================
-# 3. MODIFIED DURATION
-# =============================================================================
-# Calculate Modified Duration for Buying
-data['Modified Duration (Buy)'] = data.apply(lambda row: calculate_modified_duration(
-    face_value=row['Face Value'],
-    years_to_maturity=row['Years to Maturity'],
-    ytm_bid=row['YTM - Bid'],
-    ytm_ask=row['YTM - Ask'],
-    coupon_rate=row['Cpn'], 
-    buying=True
-), axis=1)
-
-# Calculate Modified Duration for Selling
-data['Modified Duration (Sell)'] = data.apply(lambda row: calculate_modified_duration(
-    face_value=row['Face Value'], 
-    years_to_maturity=row['Years to Maturity'],
-    ytm_bid=row['YTM - Bid'],
-    ytm_ask=row['YTM - Ask'],
-    coupon_rate=row['Cpn'], 
-    buying=False
-), axis=1)
+        # release the views before closing the shared memory blocks
+        del inputs, outputs
+    finally:
+        input_shm.close()
+        output_shm.close()
 
-# =============================================================================
-# 4. CONVEXITY
-# =============================================================================
-# Calculate Convexity for Buying
-data['Convexity (Buy)'] = data.apply(lambda row: calculate_bond_convexity(
-    face_value=row['Face Value'],
-    years_to_maturity=row['Years to Maturity'],
-    ytm_bid=row['YTM - Bid'],
-    ytm_ask=row['YTM - Ask'],
-    coupon_rate=row['Cpn'],  
-    buying=True
-), axis=1)
-
-# Calculate Convexity for Selling
-data['Convexity (Sell)'] = data.apply(lambda row: calculate_bond_convexity(
-    face_value=row['Face Value'],
-    years_to_maturity=row['Years to Maturity'],
-    ytm_bid=row['YTM - Bid'],
-    ytm_ask=row['YTM - Ask'],
-    coupon_rate=row['Cpn'],
-    buying=False
-), axis=1)
 
-# =============================================================================
-# 5. DV01
-# =============================================================================
-# Calculate DV01 for each bond
-data['DV01'] = data.apply(lambda row: calculate_dv01(
-    face_value=row['Face Value'],
-    coupon_rate=row['Cpn'], 
-    years_to_maturity=row['Years to Maturity'],
-    ytm=row['YTM - Bid'] 
-), axis=1)
+def run_analysis(data, workers=1, chunk_size=None, as_of=AS_OF_DATE):
+    """
+    Calculate prices, durations, convexities, DV01 and bid-ask spreads for the bonds-data frame.
 
-# =============================================================================
-# 6. Compute the Bid-Ask Spread
-# =============================================================================
-data['Buy-Sell Spread'] = data['Buy Price'] - data['Sell Price']
-data['Percentage Spread'] = (data['Buy-Sell Spread'] / data['Buy Price']) * 100
+    The bonds are split into chunks of chunk_size rows. With workers > 1 the chunks are processed by a pool of
+    processes that read their inputs from, and write their results to, shared-memory NumPy buffers. Every chunk
+    uses the same period grid, so the output is identical to the serial path regardless of workers and chunk_size.
 
-# =============================================================================
-# 7. Export data
-# =============================================================================
-# save the data to an Excel and pickle file
-data.to_excel(PROJECT_DIR / "processed_data" / "bonds-analyzed.xlsx", index=False)
-data.to_pickle(PROJECT_DIR / "processed_data" / "bonds-analyzed.pkl")
\ No newline at end of file
+    Parameters:
+    - data (DataFrame): The cleaned bonds data (processed_data/bonds-data.parquet).
+    - workers (int, optional): Number of worker processes. Default is 1, i.e. run in the current process.
+    - chunk_size (int, optional): Number of bonds per chunk. Default is None, i.e. the bonds are split evenly
+                                  across the workers.
+    - as_of (str, optional): The date the years to maturity are measured from. Default is AS_OF_DATE.
+
+    Returns:
+    - DataFrame: A copy of data with the analytics columns added, and as_of in its attrs (stored with the table, so
+                 update_analysis() can tell which date a previous result was computed for).
+    """
+
+    data = data.copy()
+    data.attrs['as_of'] = str(pd.Timestamp(as_of).date())
+
+    # Convert Maturity column to datetime, and find the years to maturity
+    data["Maturity"] = pd.to_datetime(data["Maturity"])
+    data["Years to Maturity"] = round((data["Maturity"] - pd.to_datetime(as_of)).dt.days / 365).astype(int)
+    data["Years to Maturity"] = np.where(data["Years to Maturity"] == 0, 1, data["Years to Maturity"])
+
+    # Every bond has the same face value (FACE_VALUE = 1000), so it is not stored as a column
+
+    n_bonds = len(data)
+    if chunk_size is None:
+        chunk_size = -(-n_bonds // workers)
+    chunk_size = max(int(chunk_size), 1)
+    chunks = [(start, min(start + chunk_size, n_bonds)) for start in range(0, n_bonds, chunk_size)]
+
+    # pad every chunk to the longest (semi-annual) schedule in the universe
+    max_periods = int(np.max(data['Years to Maturity'].to_numpy(), initial=0) * 2) + 1
+
+    # =============================================================================
+    # 1-5. PRICE, MACAULAY DURATION, MODIFIED DURATION, CONVEXITY AND DV01
+    # =============================================================================
+    # Calculate all measures for the buying (YTM Ask) and selling (YTM Bid) side in batched passes
+    input_shm = shared_memory.SharedMemory(create=True, size=max(len(ANALYTICS_INPUTS) * n_bonds * 8, 1))
+    output_shm = shared_memory.SharedMemory(create=True, size=max(len(ANALYTICS_OUTPUTS) * n_bonds * 8, 1))
+    try:
+        inputs = np.ndarray((len(ANALYTICS_INPUTS), n_bonds), dtype=np.float64, buffer=input_shm.buf)
+        outputs = np.ndarray((len(ANALYTICS_OUTPUTS), n_bonds), dtype=np.float64, buffer=output_shm.buf)
+        for i, col in enumerate(ANALYTICS_INPUTS):
+            inputs[i] = pd.to_numeric(data[col], errors='coerce').to_numpy(dtype=np.float64)
+
+        tasks = [(input_shm.name, output_shm.name, n_bonds, start, stop, max_periods) for start, stop in chunks]
+        with stage('bond_math') as record:
+            record['rows_in'] = n_bonds
+            if workers > 1 and len(tasks) > 1:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    list(executor.map(_analyze_chunk, tasks))
+            else:
+                for task in tasks:
+                    _analyze_chunk(task)
+
+        # results come back in row order, whatever order the chunks finished in
+        analytics = {col: outputs[i].copy() for i, col in enumerate(ANALYTICS_OUTPUTS)}
+        del inputs, outputs
+    finally:
+        input_shm.close()
+        input_shm.unlink()
+        output_shm.close()
+        output_shm.unlink()
+
+    for col in ANALYTICS_OUTPUTS[:-2]:
+        data[col] = analytics[col]
+
+    # DV01 for each bond is measured on the YTM - Bid
+    data['DV01'] = analytics['DV01 (Sell)']
+
+    # =============================================================================
+    # 6. Compute the Bid-Ask Spread
+    # =============================================================================
+    data['Buy-Sell Spread'] = data['Buy Price'] - data['Sell Price']
+    data['Percentage Spread'] = (data['Buy-Sell Spread'] / data['Buy Price']) * 100
+
+    return apply_schema(data, "bonds-analyzed")
+
+
+def update_analysis(data, previous, workers=1, chunk_size=None, as_of=AS_OF_DATE):
+    """
+    Incrementally update an analyzed dataset: only bonds whose row in bonds-data is new or changed (e.g. a new
+    quote) go through the bond_math computations again, all other rows are taken from the previous result.
+
+    The data has no ISIN column, so rows are matched on a hash of all their bonds-data columns. The analytics of
+    a bond only depend on its own row and the as-of date, so the result is the same as run_analysis() on the full
+    data. A previous result computed for another as-of date (or without one in its attrs) is not reused.
+
+    Parameters:
+    - data (DataFrame): The cleaned bonds data (processed_data/bonds-data.parquet).
+    - previous (DataFrame): The previous output of run_analysis() (processed_data/bonds-analyzed.parquet).
+    - workers (int, optional): Number of worker processes for the recomputed rows. Default is 1.
+    - chunk_size (int, optional): Number of bonds per chunk for the recomputed rows. Default is None.
+    - as_of (str, optional): The date the years to maturity are measured from. Default is AS_OF_DATE.
+
+    Returns:
+    - tuple: (DataFrame with the analytics columns added, number of recomputed rows)
+    """
+
+    input_columns = list(data.columns)
+    if not set(input_columns).issubset(previous.columns) or previous.attrs.get('as_of') != str(pd.Timestamp(as_of).date()):
+        return run_analysis(data, workers=workers, chunk_size=chunk_size, as_of=as_of), len(data)
+
+    with stage('match previous analysis') as record:
+        row_keys = pd.util.hash_pandas_object(data[input_columns], index=False).to_numpy()
+        previous_keys = pd.util.hash_pandas_object(previous[input_columns], index=False).to_numpy()
+        previous = previous.set_axis(previous_keys)
+        previous = previous[~previous.index.duplicated()]
+
+        known = np.isin(row_keys, previous.index)
+        n_changed = int((~known).sum())
+        record['rows_in'], record['rows_out'] = len(data), n_changed
+    if n_changed == len(data):
+        return run_analysis(data, workers=workers, chunk_size=chunk_size, as_of=as_of), n_changed
+
+    analyzed = previous.loc[row_keys[known]].set_axis(np.flatnonzero(known))
+    if n_changed:
+        changed = run_analysis(data[~known], workers=workers, chunk_size=chunk_size, as_of=as_of)
+        analyzed = pd.concat([analyzed[changed.columns], changed.set_axis(np.flatnonzero(~known))]).sort_index()
+
+    # concatenated categoricals with different categories fall back to strings
+    analyzed = apply_schema(analyzed.set_axis(data.index), "bonds-analyzed")
+    analyzed.attrs['as_of'] = str(pd.Timestamp(as_of).date())
+    return analyzed, n_changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calculate bond analytics for processed_data/bonds-data.parquet.")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes (default: 1)")
+    parser.add_argument("--chunk-size", type=int, default=None, help="number of bonds per chunk (default: split evenly across workers)")
+    parser.add_argument("--as-of", default=AS_OF_DATE, help=f"date the years to maturity are measured from (default: {AS_OF_DATE})")
+    parser.add_argument("--excel", action="store_true", help="also export processed_data/bonds-analyzed.xlsx")
+    parser.add_argument("--trace", action="store_true", help="time every step and write a trace to processed_data/traces/")
+    parser.add_argument("--profile", action="store_true", help="with --trace, also capture cProfile statistics per step")
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        enable_tracing(profile=args.profile)
+
+    # load the data
+    with stage('read bonds-data'):
+        data = read_table("bonds-data")
+
+    with stage('analysis') as record:
+        data = run_analysis(data, workers=args.workers, chunk_size=args.chunk_size, as_of=args.as_of)
+        record['rows_out'] = len(data)
+
+    # =============================================================================
+    # 7. Export data
+    # =============================================================================
+    # write the data to the columnar store, the Excel copy is only exported on request
+    with stage('write bonds-analyzed'):
+        write_table(data, "bonds-analyzed")
+    if args.excel:
+        with stage('export excel'):
+            export_excel(data, "bonds-analyzed")
+
+    finish_trace("bond_analysis")
+
+
+if __name__ == "__main__":
+    main()
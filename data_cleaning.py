@@ -1,100 +1,246 @@
+import argparse
+from functools import partial
 import pandas as pd
 import numpy as np
+import pyarrow.parquet as pq
 from pathlib import Path
-import pycountry
-import matplotlib.pyplot as plt
-import seaborn as sns
-from utils.get_country import get_country
+from utils.get_country import CountryResolver
 from utils.correct_avg_and_3m import correct_avg_and_3m
+from utils.storage import TableWriter, read_table, export_excel, cached_table
+from utils.schema import AS_OF_DATE, apply_schema
+from utils.history import QuoteStore
+from utils.instrumentation import enable_tracing, finish_trace, iterate, stage
 
 # set the project directory for easy access to the data
 PROJECT_DIR = Path().resolve()
 
-# load the data
-bonds   = pd.read_excel(PROJECT_DIR / 'original_data/bonds.xlsx')
-cds_10y = pd.read_excel(PROJECT_DIR / 'original_data/cds_by_countries.xlsx', sheet_name='10 years')
-cds_5y  = pd.read_excel(PROJECT_DIR / 'original_data/cds_by_countries.xlsx', sheet_name='5 years')
-cds_2y  = pd.read_excel(PROJECT_DIR / 'original_data/cds_by_countries.xlsx', sheet_name='2 years')
-
 # =============================================================================
 # CREDIT DEFAULT SWAPS SPREAD DATA CLEANING
 # =============================================================================
 
-# apply the function to fix the mistaken 'Avg' and '3M +/-' values
-cds_10y = correct_avg_and_3m(cds_10y)
-cds_5y = correct_avg_and_3m(cds_5y)
-cds_2y = correct_avg_and_3m(cds_2y)
+CDS_FILE = PROJECT_DIR / 'original_data/cds_by_countries.xlsx'
+
+def build_merged_cds():
+    """
+    Read the three CDS sheets, clean them and merge them into a single table with one row per country.
+    Cached in processed_data/cache/ and only rebuilt when cds_by_countries.xlsx or the code building it changes.
+    """
+
+    cds_10y = pd.read_excel(CDS_FILE, sheet_name='10 years')
+    cds_5y  = pd.read_excel(CDS_FILE, sheet_name='5 years')
+    cds_2y  = pd.read_excel(CDS_FILE, sheet_name='2 years')
+
+    # apply the function to fix the mistaken 'Avg' and '3M +/-' values
+    cds_10y = correct_avg_and_3m(cds_10y)
+    cds_5y = correct_avg_and_3m(cds_5y)
+    cds_2y = correct_avg_and_3m(cds_2y)
 
-# add relevant suffixes to the column names to make merged dataframe more readable
-cds_10y = cds_10y.add_suffix('_10y')
-cds_5y = cds_5y.add_suffix('_5y')
-cds_2y = cds_2y.add_suffix('_2y')
+    # add relevant suffixes to the column names to make merged dataframe more readable
+    cds_10y = cds_10y.add_suffix('_10y')
+    cds_5y = cds_5y.add_suffix('_5y')
+    cds_2y = cds_2y.add_suffix('_2y')
 
-# merge the CDS dataframes
-merged_cds = cds_10y.merge(cds_5y, left_on='Name_10y', right_on='Name_5y').merge(cds_2y, left_on='Name_10y', right_on='Name_2y')
+    # merge the CDS dataframes
+    merged_cds = cds_10y.merge(cds_5y, left_on='Name_10y', right_on='Name_5y').merge(cds_2y, left_on='Name_10y', right_on='Name_2y')
+
+    # remove the '*' character and convert to numeric
+    for col in ['Spread_10y', 'Spread_5y', 'Spread_2y']:
+        merged_cds[col] = pd.to_numeric(merged_cds[col].str.replace('*', ''), errors='coerce')
+
+    # remove the '+' character and convert to numeric
+    merged_cds['Change_5y'] = pd.to_numeric(merged_cds['Change_5y'].str.replace('+', ''), errors='coerce')
+
+    return merged_cds
 
 # =============================================================================
 # BONDS DATA CLEANING
 # =============================================================================
+# The raw bonds are read in batches and every cleaning rule below is applied to one batch at a time, so that the
+# memory used does not depend on the size of the input. The Excel export is read as a single batch; CSV and
+# Parquet exports (e.g. one file per day) are read in batches of --batch-size rows.
+
+BONDS_FILE = PROJECT_DIR / 'original_data/bonds.xlsx'
+PAIRINGS_FILE = PROJECT_DIR / 'original_data/missing_issuers_country_pairings.xlsx'
+BATCH_SIZE = 100_000
+
+def read_bond_batches(paths, batch_size=BATCH_SIZE):
+    """
+    Yield the raw bonds of one or more exports (xlsx, csv or parquet) in batches of at most batch_size rows.
+    """
+
+    for path in map(Path, paths):
+        if path.suffix == '.csv':
+            yield from pd.read_csv(path, chunksize=batch_size)
+        elif path.suffix == '.parquet':
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+                yield batch.to_pandas()
+        else:
+            yield pd.read_excel(path)
+
+
+def apply_rule(batches, rule, counts, name=None):
+    """
+    Apply a cleaning rule to every batch, counting the rows that go in and come out of it.
+    With tracing, the rule is timed as the stage name (see utils/instrumentation.py).
+    """
+
+    for batch in batches:
+        counts['rows in'] += len(batch)
+        with stage(name or rule.__name__) as record:
+            batch = rule(batch)
+            record['rows_in'], record['rows_out'] = counts['rows in'], counts['rows out'] + len(batch)
+        counts['rows out'] += len(batch)
+        yield batch
 
 ## Issues with Maturity:
-# delete bonds with maturity date is older than November 24, 2023
-bonds['Maturity'] = pd.to_datetime(bonds['Maturity'], format='%d.%m.%Y', errors='coerce')
-date = pd.to_datetime('2023-11-24')
-bonds = bonds[bonds['Maturity'] >= date]
+def filter_maturity(bonds, as_of=AS_OF_DATE):
+    # delete bonds with maturity date is older than the date of the data (November 24, 2023)
+    bonds = bonds.assign(Maturity=pd.to_datetime(bonds['Maturity'], format='%d.%m.%Y', errors='coerce'))
+    date = pd.to_datetime(as_of)
+    bonds = bonds[bonds['Maturity'] >= date]
 
-# Drop rows where the 'Maturity' year is greater than 2054
-# otherwise, it even extends to year 2122
-bonds = bonds[bonds['Maturity'].dt.year <= 2054]
+    # Drop rows where the 'Maturity' year is greater than 2054
+    # otherwise, it even extends to year 2122
+    return bonds[bonds['Maturity'].dt.year <= 2054]
 
 ## Issues with Empty Columns:
-# drop the empty columns
-bonds.drop(columns=['BVAL Ask Yld', 'BVAL Bid Yld'], inplace=True)
+def drop_empty_columns(bonds):
+    # drop the empty columns
+    return bonds.drop(columns=['BVAL Ask Yld', 'BVAL Bid Yld'], errors='ignore')
 
 ## Issues with Yld to Mty (Ask) and Yld to Mty (Bid):
-# Drop rows where either 'Yld to Mty (Ask)' or 'Yld to Mty (Bid)' is missing
-bonds = bonds.dropna(subset=['Yld to Mty (Ask)', 'Yld to Mty (Bid)'])
-
-# Drop the rows where 'Yld to Mty (Ask)' or 'Yld to Mty (Bid)' is "#N/A Field Not Applicable"
-values_to_drop = ['#N/A Field Not Applicable']
-bonds = bonds[~bonds[["Yld to Mty (Ask)", "Yld to Mty (Bid)"]].isin(values_to_drop).any(axis=1)]
+def drop_missing_yields(bonds):
+    # Drop rows where either 'Yld to Mty (Ask)' or 'Yld to Mty (Bid)' is missing
+    return bonds.dropna(subset=['Yld to Mty (Ask)', 'Yld to Mty (Bid)'])
 
-## Add Country Pairings to Merge with CDS Data:
-# apply the function to create the 'Country' column
-bonds['Country'] = bonds['Issuer Name'].apply(get_country)
-
-# read the missing pairings data to fill the missing values in the 'Country' column
-missing_issuers_country_pairings = pd.read_excel('original_data/missing_issuers_country_pairings.xlsx', index_col=0)
-
-# set 'Issuer Name' as the index in both dataframes for filling the missing values
-bonds.set_index('Issuer Name', inplace=True)
-missing_issuers_country_pairings.set_index('Issuer Name', inplace=True)
-
-# now fill the missing values in the 'Country' column and reset the index
-bonds['Country'] = bonds['Country'].fillna(missing_issuers_country_pairings['Country'])
-bonds.reset_index(inplace=True)
+def drop_not_applicable_yields(bonds):
+    # Drop the rows where 'Yld to Mty (Ask)' or 'Yld to Mty (Bid)' is "#N/A Field Not Applicable"
+    values_to_drop = ['#N/A Field Not Applicable']
+    bonds = bonds[~bonds[["Yld to Mty (Ask)", "Yld to Mty (Bid)"]].isin(values_to_drop).any(axis=1)]
 
-# don't need this dataframe anymore, so delete it to free up memory
-del missing_issuers_country_pairings
+    # the remaining yields are numbers, also in exports where the column was read as text
+    return bonds.assign(**{col: pd.to_numeric(bonds[col]) for col in ["Yld to Mty (Ask)", "Yld to Mty (Bid)"]})
 
-# finally, merge CDS data and bonds data into a single dataframe
-final_df = bonds.merge(merged_cds, left_on='Country', right_on='Name_10y', how='left')
+## Add Country Pairings to Merge with CDS Data:
+def add_country(bonds, country_resolver):
+    # create the 'Country' column, resolving each distinct issuer name only once
+    return bonds.assign(Country=country_resolver.resolve_series(bonds['Issuer Name']))
 
-# to check if there any trouble with the merge or data in general
-final_df.info()
+def merge_cds(bonds, merged_cds):
+    # finally, merge CDS data and bonds data into a single dataframe
+    return bonds.merge(merged_cds, left_on='Country', right_on='Name_10y', how='left')
 
 ## final cleaning
-# remove the '*' character and convert to numeric
-for col in ['Spread_10y', 'Spread_5y', 'Spread_2y']:
-    final_df[col] = pd.to_numeric(final_df[col].str.replace('*', ''), errors='coerce')
-
-# remove the '+' character and convert to numeric
-final_df['Change_5y'] = pd.to_numeric(final_df['Change_5y'].str.replace('+', ''), errors='coerce')
-
-# replace "not rated" and "NaN" to None
-final_df['BBG Composite'] = final_df['BBG Composite'].replace('NR', np.nan)
-final_df['Series'] = final_df['Series'].replace('#N/A Field Not Applicable', np.nan)
-
-# export the data to Excel and pickle files
-final_df.to_excel(PROJECT_DIR / "processed_data" / "bonds-data.xlsx", index=False)
-final_df.to_pickle(PROJECT_DIR / "processed_data" / "bonds-data.pkl")
\ No newline at end of file
+def final_cleaning(final_df):
+    # replace "not rated" and "NaN" to None
+    final_df['BBG Composite'] = final_df['BBG Composite'].replace('NR', np.nan)
+    final_df['Series'] = final_df['Series'].replace('#N/A Field Not Applicable', np.nan)
+
+    # coupons are numbers, also in exports where the column was read as text
+    final_df['Cpn'] = pd.to_numeric(final_df['Cpn'], errors='coerce')
+
+    # use the column names expected by bond_analysis.py and the notebooks
+    return final_df.rename(columns={'Issuer Name': 'Issuer', 'Yld to Mty (Ask)': 'YTM - Ask', 'Yld to Mty (Bid)': 'YTM - Bid'})
+
+def cleaning_rules(merged_cds, country_resolver, as_of=AS_OF_DATE):
+    """
+    The cleaning rules in the order they are applied, as (name, rule) pairs where rule(batch) returns the cleaned batch.
+    """
+
+    return [
+        ('maturity filter', partial(filter_maturity, as_of=as_of)),
+        ('empty columns', drop_empty_columns),
+        ('missing yields', drop_missing_yields),
+        ('not applicable yields', drop_not_applicable_yields),
+        ('country', partial(add_country, country_resolver=country_resolver)),
+        ('CDS merge', partial(merge_cds, merged_cds=merged_cds)),
+        ('final cleaning', final_cleaning),
+        # compact dtypes, without the CDS names that repeat 'Country'
+        ('schema', lambda final_df: apply_schema(final_df, "bonds-data")),
+    ]
+
+
+def clean_bonds(paths=None, batch_size=BATCH_SIZE, as_of=AS_OF_DATE, snapshot=False):
+    """
+    Clean raw bond exports and write them, merged with the CDS data, to processed_data/bonds-data.parquet.
+
+    Parameters:
+    - paths (list, optional): Raw bond exports (xlsx, csv or parquet). Default is None for original_data/bonds.xlsx.
+    - batch_size (int, optional): Rows per batch for csv and parquet exports. Default is BATCH_SIZE.
+    - as_of (str, optional): The date of the quotes; bonds that matured before it are dropped. Default is AS_OF_DATE.
+    - snapshot (bool, optional): Also append the cleaned bonds and CDS data to the history as the snapshot of as_of
+                                 (see utils/history.py). Default is False.
+
+    Returns:
+    - tuple: (dict of rule name -> {'rows in', 'rows out'} counts, number of rows written)
+    """
+
+    # the history is append-only, so fail before the cleaning rather than after it, and before either table of the
+    # snapshot is appended
+    if snapshot:
+        stored = [table for table in ("bonds-data", "merged-cds") if QuoteStore(table).dates(as_of, as_of)]
+        if stored:
+            raise ValueError(f"the history already has a snapshot of {' and '.join(stored)} for {as_of}")
+
+    # CDS quotes are refreshed less often than bond quotes, so reuse the merged table while the workbook and the code
+    # that builds it are unchanged
+    with stage('CDS'):
+        merged_cds = cached_table('merged-cds', sources=[CDS_FILE], build=build_merged_cds, code=[correct_avg_and_3m])
+
+    # the resolver folds in the manual pairings for issuers without a country in their name;
+    # it remembers every issuer it has seen, so each distinct issuer is resolved once across all batches
+    country_resolver = CountryResolver.from_pairings(PAIRINGS_FILE)
+
+    # chain the rules into one generator pipeline; nothing is read before the first batch is written
+    report = {}
+    batches = iterate('read bonds', read_bond_batches(paths or [BONDS_FILE], batch_size=batch_size))
+    for name, rule in cleaning_rules(merged_cds, country_resolver, as_of=as_of):
+        report[name] = {'rows in': 0, 'rows out': 0}
+        batches = apply_rule(batches, rule, report[name], name=name)
+
+    # write the data to the columnar store batch by batch
+    with TableWriter("bonds-data") as writer:
+        for batch in batches:
+            with stage('write bonds-data'):
+                writer.write(batch)
+
+    # the history keeps every day's cleaned data for backtests (see backtest.py)
+    if snapshot:
+        with stage('snapshot'):
+            QuoteStore("bonds-data").append(read_table("bonds-data"), as_of)
+            QuoteStore("merged-cds").append(merged_cds, as_of)
+
+    return report, writer.rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clean the raw bond and CDS data into processed_data/bonds-data.parquet.")
+    parser.add_argument("--excel", action="store_true", help="also export processed_data/bonds-data.xlsx")
+    parser.add_argument("--input", nargs="+", default=None, help="raw bond exports to clean (xlsx, csv or parquet; default: original_data/bonds.xlsx)")
+    parser.add_argument("--batch-size", type=int, default=None, help="rows per batch for csv and parquet exports (default: 100000)")
+    parser.add_argument("--as-of", default=AS_OF_DATE, help=f"date of the quotes (default: {AS_OF_DATE})")
+    parser.add_argument("--snapshot", action="store_true", help="also append the cleaned data to processed_data/history/ as the snapshot of --as-of")
+    parser.add_argument("--trace", action="store_true", help="time every step and write a trace to processed_data/traces/")
+    parser.add_argument("--profile", action="store_true", help="with --trace, also capture cProfile statistics per step")
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        enable_tracing(profile=args.profile)
+
+    report, rows_written = clean_bonds(args.input, batch_size=args.batch_size or BATCH_SIZE, as_of=args.as_of, snapshot=args.snapshot)
+
+    # to check if there any trouble with the data: rows dropped by every rule
+    for name, counts in report.items():
+        print(f"{name:<22} {counts['rows in']:>10} rows in, {counts['rows in'] - counts['rows out']:>10} dropped")
+    print(f"{'bonds-data':<22} {rows_written:>10} rows written")
+
+    # the Excel copy is only exported on request
+    if args.excel:
+        with stage('export excel'):
+            export_excel(read_table("bonds-data"), "bonds-data")
+
+    finish_trace("data_cleaning")
+
+
+if __name__ == "__main__":
+    main()
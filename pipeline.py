@@ -0,0 +1,185 @@
+import argparse
+import json
+from collections import namedtuple
+from pathlib import Path
+from utils.storage import CACHE_DIR, file_fingerprint, read_table, write_table, table_path
+from utils.instrumentation import enable_tracing, finish_trace, stage as trace_stage
+
+# Set the project directory for easy access to the data
+PROJECT_DIR = Path().resolve()
+
+# Fingerprints of the last successful run of every stage
+STATE_FILE = CACHE_DIR / "pipeline-state.json"
+
+# A stage of the pipeline:
+# - inputs: data files the stage reads (including the outputs of upstream stages)
+# - code: source files whose content is the stage's code version
+# - outputs: files the stage writes
+# - run: function(incremental, workers) that runs the stage; incremental is True when only the inputs changed
+Stage = namedtuple('Stage', ['name', 'inputs', 'code', 'outputs', 'run'])
+
+# =============================================================================
+# STAGES
+# =============================================================================
+
+def run_data_cleaning(incremental, workers):
+    # run in this process, without the startup cost of a fresh interpreter (the CDS part has its own cache)
+    from data_cleaning import clean_bonds
+
+    clean_bonds()
+
+
+def run_bond_analysis(incremental, workers):
+    from bond_analysis import run_analysis, update_analysis
+
+    with trace_stage('read bonds-data'):
+        data = read_table("bonds-data")
+
+    # with unchanged code, only new or re-quoted bonds need to go through bond_math again
+    if incremental and table_path("bonds-analyzed").exists():
+        analyzed, n_recomputed = update_analysis(data, read_table("bonds-analyzed"), workers=workers)
+    else:
+        analyzed, n_recomputed = run_analysis(data, workers=workers), len(data)
+
+    print(f"    {n_recomputed} of {len(data)} bonds recomputed")
+    with trace_stage('write bonds-analyzed'):
+        write_table(analyzed, "bonds-analyzed")
+
+
+def run_portfolio_metrics(incremental, workers):
+    import pandas as pd
+    from utils.portfolio_metrics import calculate_portfolio_metrics
+
+    # the portfolio itself is selected in portfolio_selection.ipynb and saved to portfolio.xlsx
+    with trace_stage('read portfolio.xlsx'):
+        portfolio = pd.read_excel(PROJECT_DIR / "portfolio.xlsx", index_col=0)
+    portfolio_metrics = calculate_portfolio_metrics(
+        portfolio_df=portfolio,
+        weight_col='Share per Bond',
+        num_bonds_col='Number of Bond',
+        price_col='Buy Price',
+        ytm_col='YTM - Ask',
+        maturity_col='Years to Maturity',
+        coupon_col='Cpn'
+    )
+    write_table(portfolio_metrics, "portfolio-metrics")
+
+
+STAGES = [
+    Stage(name="data_cleaning",
+          inputs=["original_data/bonds.xlsx",
+                  "original_data/cds_by_countries.xlsx",
+                  "original_data/missing_issuers_country_pairings.xlsx"],
+          code=["data_cleaning.py", "utils/get_country.py", "utils/correct_avg_and_3m.py", "utils/storage.py", "utils/schema.py",
+                "utils/curves.py", "utils/history.py"],
+          outputs=["processed_data/bonds-data.parquet"],
+          run=run_data_cleaning),
+    Stage(name="bond_analysis",
+          inputs=["processed_data/bonds-data.parquet"],
+          code=["bond_analysis.py", "utils/bond_math.py", "utils/storage.py", "utils/schema.py", "utils/curves.py"],
+          outputs=["processed_data/bonds-analyzed.parquet"],
+          run=run_bond_analysis),
+    Stage(name="portfolio_metrics",
+          inputs=["portfolio.xlsx"],
+          code=["utils/portfolio_metrics.py", "utils/bond_math.py", "utils/storage.py"],
+          outputs=["processed_data/portfolio-metrics.parquet"],
+          run=run_portfolio_metrics),
+]
+
+# =============================================================================
+# RUNNER
+# =============================================================================
+
+def _fingerprints(paths, previous):
+    """Content fingerprints of the given files (None for a missing file)."""
+    return {path: file_fingerprint(PROJECT_DIR / path, previous.get(path)) if (PROJECT_DIR / path).exists() else None
+            for path in paths}
+
+
+def _same_content(fingerprints, previous):
+    return all(fingerprint is not None and (previous.get(path) or {}).get('sha256') == fingerprint['sha256']
+               for path, fingerprint in fingerprints.items())
+
+
+def run_pipeline(stages=None, force=False, dry_run=False, workers=1):
+    """
+    Run the pipeline stages in order, skipping every stage whose inputs, code and outputs are unchanged since
+    its last successful run. Files are compared by content hash, so an upstream stage that rewrites identical
+    output does not trigger the stages downstream of it.
+
+    Parameters:
+    - stages (list, optional): Names of the stages to consider. Default is None for all stages.
+    - force (bool, optional): Run the stages even if they are up to date, without incremental updates. Default is False.
+    - dry_run (bool, optional): Only report which stages would run. Default is False.
+    - workers (int, optional): Number of worker processes for bond_analysis. Default is 1.
+
+    Returns:
+    - list: Names of the stages that were (or, with dry_run, would be) run.
+    """
+
+    state = json.loads(STATE_FILE.read_text()) if STATE_FILE.exists() else {}
+    executed = []
+
+    for stage in STAGES:
+        if stages and stage.name not in stages:
+            continue
+
+        previous = state.get(stage.name, {})
+        inputs = _fingerprints(stage.inputs, previous.get('inputs', {}))
+        code = _fingerprints(stage.code, previous.get('code', {}))
+        outputs = _fingerprints(stage.outputs, previous.get('outputs', {}))
+
+        missing = [path for path, fingerprint in inputs.items() if fingerprint is None]
+        if missing:
+            raise FileNotFoundError(f"{stage.name}: missing inputs {missing}")
+
+        code_unchanged = _same_content(code, previous.get('code', {}))
+        up_to_date = (code_unchanged
+                      and _same_content(inputs, previous.get('inputs', {}))
+                      and _same_content(outputs, previous.get('outputs', {})))
+
+        if up_to_date and not force:
+            print(f"{stage.name}: up to date, skipped")
+            continue
+
+        print(f"{stage.name}: running")
+        executed.append(stage.name)
+        if dry_run:
+            continue
+
+        with trace_stage(stage.name):
+            stage.run(incremental=code_unchanged and not force, workers=workers)
+
+        state[stage.name] = {'inputs': inputs, 'code': code, 'outputs': _fingerprints(stage.outputs, {})}
+        STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        STATE_FILE.write_text(json.dumps(state, indent=2))
+
+    return executed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the data_cleaning -> bond_analysis -> portfolio_metrics pipeline, "
+                                                 "skipping stages that are up to date.")
+    parser.add_argument("stages", nargs="*", help="stages to consider: "
+                                                  + ", ".join(stage.name for stage in STAGES) + " (default: all)")
+    parser.add_argument("--force", action="store_true", help="rerun the stages even if they are up to date")
+    parser.add_argument("--dry-run", action="store_true", help="only report which stages would run")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes for bond_analysis (default: 1)")
+    parser.add_argument("--trace", action="store_true", help="time every step and write traces to processed_data/traces/")
+    parser.add_argument("--profile", action="store_true", help="with --trace, also capture cProfile statistics per step")
+    args = parser.parse_args(argv)
+
+    # the stages run in this process, so their steps are part of the pipeline's trace
+    if args.trace:
+        enable_tracing(profile=args.profile)
+
+    unknown = set(args.stages) - {stage.name for stage in STAGES}
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    run_pipeline(stages=args.stages, force=args.force, dry_run=args.dry_run, workers=args.workers)
+    finish_trace("pipeline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,512 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import time
+from http import HTTPStatus
+from pathlib import Path
+
+import numpy as np
+
+from utils.bond_math import BondRisk, compute_bond_risk
+from utils.portfolio_metrics import PORTFOLIO_METRICS
+from utils.schema import FACE_VALUE
+from utils.storage import CACHE_DIR, file_fingerprint, table_path
+
+# Address of the service; it is meant for the local machine only
+HOST = "127.0.0.1"
+PORT = 8750
+
+# Memory-mapped columns of the analyzed universe, one directory per version of bonds-analyzed.parquet
+SERVICE_CACHE_DIR = CACHE_DIR / "service"
+
+# Columns of bonds-analyzed served from memory, by the name of their .npy file
+UNIVERSE_COLUMNS = {'years': 'Years to Maturity', 'coupon': 'Cpn', 'ytm_ask': 'YTM - Ask', 'ytm_bid': 'YTM - Bid'}
+
+# Requests that arrive within BATCH_WINDOW seconds of the first one of a batch are priced in the same
+# compute_bond_risk() call, up to MAX_BATCH_BONDS bonds (which bounds its padded period matrices). With a window of 0
+# a batch holds the requests read in the same turn of the event loop: many under concurrent load, while a lone request
+# is not delayed. A longer window trades latency for larger batches.
+BATCH_WINDOW = 0.0
+MAX_BATCH_BONDS = 20_000
+
+# Seconds between two checks of bonds-analyzed.parquet for a new version
+RELOAD_INTERVAL = 2.0
+
+# Largest accepted request body in bytes
+MAX_BODY_BYTES = 16 * 2**20
+
+# Longest maturity of an ad-hoc bond in years; bounds the period matrices of the batch it joins
+MAX_YEARS_TO_MATURITY = 100
+
+# =============================================================================
+# MEMORY-MAPPED UNIVERSE
+# =============================================================================
+
+class BondUniverse:
+    """
+    The analyzed bonds as read-only, memory-mapped NumPy columns.
+
+    The columns of UNIVERSE_COLUMNS and the per-bond contributions to the portfolio metrics (see
+    PortfolioRiskState.contributions) are written once per version of bonds-analyzed.parquet to
+    processed_data/cache/service/<version>/ as .npy files. Loading a version that is already there only maps the
+    files, so a restart does not decode the Parquet file again and several service processes share the same pages.
+
+    Bonds are addressed by their row number in bonds-analyzed.
+
+    Parameters:
+    - version (str): The version, the start of the SHA-256 hash of the Parquet file.
+    - directory (Path): The directory of the version's .npy files.
+    """
+
+    def __init__(self, version, directory):
+        self.version = version
+        self.directory = Path(directory)
+        self.columns = {name: np.load(self.directory / f"{name}.npy", mmap_mode='r')
+                        for name in list(UNIVERSE_COLUMNS) + ['contributions']}
+        self.n_bonds = len(self.columns['years'])
+        self.loaded_at = time.time()
+
+    @classmethod
+    def build(cls, analyzed, version, directory=None):
+        """
+        Write the columns of an analyzed frame (the output of bond_analysis.run_analysis()) as a new version.
+
+        Parameters:
+        - analyzed (DataFrame): The analyzed bonds.
+        - version (str): Name of the version.
+        - directory (Path, optional): Directory of the versions. Default is SERVICE_CACHE_DIR.
+
+        Returns:
+        - BondUniverse: The mapped version.
+        """
+
+        from utils.credit_risk import LOSS_SEVERITY
+        from utils.portfolio_metrics import PortfolioRiskState
+
+        target = Path(directory or SERVICE_CACHE_DIR) / version
+        if target.exists():
+            return cls(version, target)
+
+        # the portfolio metrics of a universe in which no bond is held yet; PD_5y_pct as in portfolio_selection.ipynb
+        universe = analyzed.reset_index(drop=True)
+        universe = universe.assign(**{'Share per Bond': 0.0, 'Number of Bond': 0.0},
+                                   **({} if 'PD_5y_pct' in universe else
+                                      {'PD_5y_pct': universe['Spread_5y'].astype(float) / LOSS_SEVERITY / 100}))
+        state = PortfolioRiskState(universe, weight_col='Share per Bond', num_bonds_col='Number of Bond',
+                                   price_col='Buy Price', ytm_col='YTM - Ask', maturity_col='Years to Maturity',
+                                   coupon_col='Cpn')
+
+        # written next to the target and renamed, so a version directory is always complete
+        staging = target.with_name(f"{version}.{os.getpid()}.tmp")
+        staging.mkdir(parents=True, exist_ok=True)
+        for name, col in UNIVERSE_COLUMNS.items():
+            np.save(staging / f"{name}.npy", universe[col].to_numpy(dtype=np.float64))
+        np.save(staging / "contributions.npy", np.ascontiguousarray(state.contributions))
+        try:
+            staging.rename(target)
+        except OSError:
+            # another process wrote the same version first
+            shutil.rmtree(staging, ignore_errors=True)
+
+        return cls(version, target)
+
+    @classmethod
+    def load(cls, name="bonds-analyzed", directory=None, previous=None):
+        """
+        Map the current version of a table of the columnar store, building it first if needed.
+
+        Parameters:
+        - name (str, optional): Name of the analyzed table. Default is "bonds-analyzed".
+        - directory (Path, optional): Directory of the versions. Default is SERVICE_CACHE_DIR.
+        - previous (dict, optional): An earlier fingerprint of the table, see file_fingerprint(). Default is None.
+
+        Returns:
+        - tuple: (BondUniverse, fingerprint of the table)
+        """
+
+        from utils.storage import read_table
+
+        fingerprint = file_fingerprint(table_path(name), previous)
+        version = fingerprint['sha256'][:16]
+        directory = Path(directory or SERVICE_CACHE_DIR)
+
+        if (directory / version).exists():
+            universe = cls(version, directory / version)
+        else:
+            universe = cls.build(read_table(name), version, directory=directory)
+
+            # older versions are no longer needed; processes that still map them keep their pages
+            for old in directory.iterdir():
+                if old.name != version and not old.name.endswith('.tmp'):
+                    shutil.rmtree(old, ignore_errors=True)
+
+        return universe, fingerprint
+
+    def rows(self, bonds):
+        """Row numbers of the given bonds as an int array; raises ValueError for unknown bonds."""
+
+        rows = np.asarray(bonds)
+        if rows.ndim != 1 or not len(rows) or not np.issubdtype(rows.dtype, np.integer):
+            raise ValueError("'bonds' must be a non-empty list of row numbers of bonds-analyzed")
+        if rows.min() < 0 or rows.max() >= self.n_bonds:
+            raise ValueError(f"bond row numbers must be between 0 and {self.n_bonds - 1}")
+        return rows
+
+# =============================================================================
+# MICROBATCHING
+# =============================================================================
+
+class MicroBatcher:
+    """
+    Collect the bonds of concurrent requests and price them in a single vectorized call.
+
+    The first request of a batch opens it for window seconds (with 0, until the event loop's next turn); every
+    request submitted in the meantime joins it, and the batch is computed as soon as the window ends or max_bonds
+    bonds are waiting. Each request gets back its own slice of the results, so the output is the same as computing
+    every request on its own. If the batch fails, its requests are computed one by one, so only the requests that
+    fail on their own get the error.
+
+    Parameters:
+    - compute (callable): Function of per-bond input arrays that returns a tuple of per-bond result arrays.
+    - window (float, optional): Seconds a batch stays open. Default is BATCH_WINDOW.
+    - max_bonds (int, optional): Bonds at which a batch is computed right away. Default is MAX_BATCH_BONDS.
+    """
+
+    def __init__(self, compute, window=BATCH_WINDOW, max_bonds=MAX_BATCH_BONDS):
+        self.compute = compute
+        self.window = window
+        self.max_bonds = max_bonds
+        self.batches = 0
+        self.requests = 0
+        self.bonds = 0
+        self._pending = []
+        self._pending_bonds = 0
+        self._timer = None
+
+    def submit(self, *inputs):
+        """
+        Add the per-bond inputs of one request to the open batch.
+
+        Returns:
+        - Future: Resolves to the tuple of result arrays of the request's bonds.
+        """
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((inputs, future))
+        self._pending_bonds += len(inputs[0])
+
+        if self._pending_bonds >= self.max_bonds:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self.flush)
+
+        return future
+
+    def flush(self):
+        """Compute the open batch and hand every request its results."""
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending, self._pending_bonds = self._pending, [], 0
+        if not pending:
+            return
+
+        try:
+            results = self.compute(*(np.concatenate(parts) for parts in zip(*(inputs for inputs, _ in pending))))
+        except Exception:
+            self._compute_each(pending)
+            return
+
+        start = 0
+        for inputs, future in pending:
+            stop = start + len(inputs[0])
+            if not future.done():
+                future.set_result(tuple(result[start:stop] for result in results))
+            start = stop
+
+        self.batches += 1
+        self.requests += len(pending)
+        self.bonds += start
+
+    def _compute_each(self, pending):
+        """Compute the requests of a failed batch one by one and hand every request its results or its error."""
+
+        for inputs, future in pending:
+            try:
+                results = self.compute(*inputs)
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(error)
+                continue
+
+            if not future.done():
+                future.set_result(tuple(results))
+            self.batches += 1
+            self.requests += 1
+            self.bonds += len(inputs[0])
+
+# =============================================================================
+# SERVICE
+# =============================================================================
+
+def _floats(values):
+    """An array as a JSON-ready list, with None for NaN."""
+    values = np.asarray(values, dtype=float)
+    if not np.isnan(values).any():
+        return values.tolist()
+    return [None if value != value else value for value in values.tolist()]
+
+
+def _request_array(request, key, n_bonds):
+    """A scalar or per-bond list of the request as a float array of n_bonds finite values."""
+    values = np.asarray(request[key], dtype=float)
+    if values.ndim > 1 or (values.ndim == 1 and len(values) != n_bonds):
+        raise ValueError(f"'{key}' must be a number or a list of {n_bonds} numbers")
+    if not np.isfinite(values).all():
+        raise ValueError(f"'{key}' must be finite")
+    return np.broadcast_to(values, n_bonds)
+
+
+class PricingService:
+    """
+    Local HTTP service that prices bonds, computes their risk and scores portfolios over the analyzed universe.
+
+    Endpoints (JSON in, JSON out):
+    - GET /health: version and size of the universe and the number of requests, batches and bonds priced.
+    - POST /price: {"bonds": [row, ...]} -> {"price": [...]}, priced at "side" "ask" (the buy price, default) or
+      "bid", or at the yields of "ytm" (a number or one per bond). Bonds that are not in the universe can be priced
+      from "years_to_maturity", "ytm" and "coupon" (numbers or lists) instead of "bonds", with an optional "face_value".
+    - POST /risk: the same request -> price, Macaulay duration, modified duration, convexity and DV01 per bond.
+    - POST /portfolio: {"bonds": [row, ...], "weights": [...]} -> {"metrics": {...}}, the metrics of
+      calculate_portfolio_metrics() for those weights.
+
+    Price and risk requests go through one MicroBatcher, so concurrent requests share compute_bond_risk() calls.
+    Portfolio requests are a single product with the precomputed contributions and are answered directly. Every
+    request uses one version of the universe from start to end; a new version of the table is loaded in the
+    background and swapped in between requests.
+
+    Parameters:
+    - universe (BondUniverse): The universe to serve.
+    - table (str, optional): Name of the table to watch for new versions. Default is None for no reloading.
+    - fingerprint (dict, optional): Fingerprint of the table the universe was loaded from. Default is None.
+    - reload_interval (float, optional): Seconds between two checks of the table. Default is RELOAD_INTERVAL.
+    - window (float, optional): Seconds a batch stays open. Default is BATCH_WINDOW.
+    - max_bonds (int, optional): Bonds at which a batch is computed right away. Default is MAX_BATCH_BONDS.
+    """
+
+    def __init__(self, universe, table=None, fingerprint=None, reload_interval=RELOAD_INTERVAL,
+                 window=BATCH_WINDOW, max_bonds=MAX_BATCH_BONDS):
+        self.universe = universe
+        self.table = table
+        self.fingerprint = fingerprint
+        self.reload_interval = reload_interval
+        self.reloads = 0
+        self.batcher = MicroBatcher(lambda *inputs: compute_bond_risk(*inputs), window=window, max_bonds=max_bonds)
+        self.routes = {'/health': ('GET', self.health), '/price': ('POST', self.price),
+                       '/risk': ('POST', self.risk), '/portfolio': ('POST', self.portfolio)}
+
+    # -------------------------------------------------------------------------
+    # endpoints
+    # -------------------------------------------------------------------------
+
+    async def health(self, request):
+        return {'version': self.universe.version, 'bonds': self.universe.n_bonds, 'loaded_at': self.universe.loaded_at,
+                'reloads': self.reloads, 'requests': self.batcher.requests, 'batches': self.batcher.batches,
+                'bonds_priced': self.batcher.bonds}
+
+    def _risk_inputs(self, request):
+        """(universe, face value, years to maturity, yield, coupon) arrays of the bonds of a price or risk request."""
+
+        universe = self.universe
+        if 'bonds' in request:
+            rows = universe.rows(request['bonds'])
+            n_bonds = len(rows)
+            years = universe.columns['years'][rows]
+            coupon = universe.columns['coupon'][rows]
+            if 'ytm' in request:
+                ytm = _request_array(request, 'ytm', n_bonds)
+            else:
+                side = request.get('side', 'ask')
+                if side not in ('ask', 'bid'):
+                    raise ValueError("'side' must be 'ask' or 'bid'")
+                ytm = universe.columns[f'ytm_{side}'][rows]
+        else:
+            missing = [key for key in ('years_to_maturity', 'ytm', 'coupon') if key not in request]
+            if missing:
+                raise ValueError(f"a request needs 'bonds' or {missing}")
+            n_bonds = max(np.size(request[key]) for key in ('years_to_maturity', 'ytm', 'coupon'))
+            years, ytm, coupon = (_request_array(request, key, n_bonds) for key in ('years_to_maturity', 'ytm', 'coupon'))
+            if not n_bonds or (years <= 0).any() or (years > MAX_YEARS_TO_MATURITY).any():
+                raise ValueError(f"'years_to_maturity' must be positive and at most {MAX_YEARS_TO_MATURITY}")
+
+        face_value = _request_array({'face_value': request.get('face_value', FACE_VALUE)}, 'face_value', n_bonds)
+        return universe, face_value, years, ytm, coupon
+
+    async def price(self, request):
+        universe, *inputs = self._risk_inputs(request)
+        risk = BondRisk(*await self.batcher.submit(*inputs))
+        return {'version': universe.version, 'price': _floats(risk.price)}
+
+    async def risk(self, request):
+        universe, *inputs = self._risk_inputs(request)
+        risk = BondRisk(*await self.batcher.submit(*inputs))
+        return {'version': universe.version, **{field: _floats(values) for field, values in risk._asdict().items()}}
+
+    async def portfolio(self, request):
+        universe = self.universe
+        rows = universe.rows(request['bonds'])
+        weights = _request_array(request, 'weights', len(rows))
+        totals = weights @ universe.columns['contributions'][rows]
+        return {'version': universe.version, 'metrics': dict(zip(PORTFOLIO_METRICS, _floats(totals)))}
+
+    # -------------------------------------------------------------------------
+    # HTTP
+    # -------------------------------------------------------------------------
+
+    async def dispatch(self, method, path, body):
+        """
+        Route one request to its endpoint.
+
+        Returns:
+        - tuple: (HTTPStatus, JSON-ready response)
+        """
+
+        if path not in self.routes:
+            return HTTPStatus.NOT_FOUND, {'error': f"unknown endpoint {path}, expected one of {sorted(self.routes)}"}
+        expected_method, endpoint = self.routes[path]
+        if method != expected_method:
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': f"{path} expects {expected_method}"}
+
+        try:
+            request = json.loads(body) if body else {}
+            if not isinstance(request, dict):
+                raise ValueError("the request body must be a JSON object")
+            return HTTPStatus.OK, await endpoint(request)
+        except (ValueError, TypeError, KeyError, IndexError) as error:
+            return HTTPStatus.BAD_REQUEST, {'error': str(error)}
+        except MemoryError:
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': "the request is too large to compute"}
+
+    async def handle_connection(self, reader, writer):
+        """Serve the HTTP/1.1 requests of one connection, keeping it open between requests."""
+
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode('latin-1').split()
+                length = headers.get('content-length') or '0'
+                length = int(length) if length.isdigit() else -1
+                keep_alive = (len(parts) == 3 and parts[2] == 'HTTP/1.1'
+                              and headers.get('connection', '').lower() != 'close')
+
+                if len(parts) != 3 or length < 0:
+                    status, response, keep_alive = HTTPStatus.BAD_REQUEST, {'error': "malformed request"}, False
+                elif length > MAX_BODY_BYTES:
+                    status, response, keep_alive = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': "request body too large"}, False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    status, response = await self.dispatch(parts[0], parts[1].split('?')[0], body)
+
+                payload = json.dumps(response).encode()
+                writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    # -------------------------------------------------------------------------
+    # hot reload
+    # -------------------------------------------------------------------------
+
+    async def watch(self):
+        """
+        Check the watched table every reload_interval seconds and swap in its new version once it is loaded. The
+        table is only hashed when its modification time or size changed; a version that fails to load (e.g. a file
+        that is still being written) is retried at the next check.
+        """
+
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                stat = table_path(self.table).stat()
+                if self.fingerprint and (stat.st_mtime_ns, stat.st_size) == (self.fingerprint['mtime_ns'], self.fingerprint['size']):
+                    continue
+                universe, fingerprint = await loop.run_in_executor(None, BondUniverse.load, self.table, None, self.fingerprint)
+            except Exception as error:
+                print(f"reload of {self.table} failed, still serving {self.universe.version}: {error}", file=sys.stderr)
+                continue
+
+            self.fingerprint = fingerprint
+            if universe.version != self.universe.version:
+                self.universe = universe
+                self.reloads += 1
+                print(f"reloaded {self.table}: version {universe.version}, {universe.n_bonds} bonds", file=sys.stderr)
+
+    async def serve(self, host=HOST, port=PORT, started=None):
+        """
+        Serve until cancelled.
+
+        Parameters:
+        - host (str, optional): Address to listen on. Default is HOST.
+        - port (int, optional): Port to listen on, 0 for any free port. Default is PORT.
+        - started (callable, optional): Called with the server's (host, port) once it is listening. Default is None.
+        """
+
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        watcher = asyncio.create_task(self.watch()) if self.table else None
+        try:
+            if started is not None:
+                started(server.sockets[0].getsockname()[:2])
+            async with server:
+                await server.serve_forever()
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve bond prices, risk and portfolio metrics of processed_data/bonds-analyzed.parquet over HTTP.")
+    parser.add_argument("--host", default=HOST, help=f"address to listen on (default: {HOST})")
+    parser.add_argument("--port", type=int, default=PORT, help=f"port to listen on (default: {PORT})")
+    parser.add_argument("--batch-window", type=float, default=BATCH_WINDOW, help=f"seconds a batch of requests stays open (default: {BATCH_WINDOW})")
+    parser.add_argument("--reload-interval", type=float, default=RELOAD_INTERVAL, help=f"seconds between checks for new data (default: {RELOAD_INTERVAL})")
+    args = parser.parse_args(argv)
+
+    universe, fingerprint = BondUniverse.load("bonds-analyzed")
+    service = PricingService(universe, table="bonds-analyzed", fingerprint=fingerprint,
+                             reload_interval=args.reload_interval, window=args.batch_window)
+
+    def started(address):
+        print(f"serving {universe.n_bonds} bonds (version {universe.version}) on http://{address[0]}:{address[1]}", file=sys.stderr)
+
+    try:
+        asyncio.run(service.serve(args.host, args.port, started=started))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
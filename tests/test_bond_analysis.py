@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+from benchmarks.synthetic import synthetic_bonds
+from bond_analysis import run_analysis, update_analysis
+from utils.storage import read_table, write_table
+
+
+@pytest.fixture(scope="module")
+def bonds():
+    return synthetic_bonds(300, seed=1)
+
+
+def test_new_quote_is_the_only_recomputed_row(bonds):
+    previous = run_analysis(bonds)
+    quoted = bonds.copy()
+    quoted.loc[5, 'YTM - Ask'] += 0.25
+
+    analyzed, n_recomputed = update_analysis(quoted, previous)
+
+    assert n_recomputed == 1
+    pd.testing.assert_frame_equal(analyzed, run_analysis(quoted))
+
+
+def test_previous_result_of_another_date_is_not_reused(tmp_path, bonds):
+    # the stored table remembers its as-of date
+    write_table(run_analysis(bonds, as_of='2023-11-24'), "bonds-analyzed", directory=tmp_path)
+    previous = read_table("bonds-analyzed", directory=tmp_path)
+
+    analyzed, n_recomputed = update_analysis(bonds, previous, as_of='2026-06-30')
+
+    assert n_recomputed == len(bonds)
+    pd.testing.assert_frame_equal(analyzed, run_analysis(bonds, as_of='2026-06-30'))
+
+
+def test_snapshot_is_refused_before_either_table_is_appended(tmp_path, monkeypatch):
+    import data_cleaning
+    from utils import history
+
+    monkeypatch.setattr(history, 'HISTORY_DIR', tmp_path)
+    history.QuoteStore("merged-cds").append(pd.DataFrame({'Name_10y': ['Alpha'], 'Spread_10y': [120.0]}), '2023-12-01')
+
+    with pytest.raises(ValueError, match="merged-cds"):
+        data_cleaning.clean_bonds(as_of='2023-12-01', snapshot=True)
+    assert not history.QuoteStore("bonds-data").dates()
@@ -0,0 +1,51 @@
+import numpy as np
+from utils.bond_math import (calculate_bond_analytics, calculate_bond_convexity, calculate_bond_price, calculate_dv01,
+                             calculate_macaulay_duration, calculate_modified_duration, compute_bond_risk,
+                             compute_sensitivities, solve_ytm)
+
+YEARS = np.array([0.5, 1, 2, 5, 7, 10, 30])
+YTM_BID = np.array([5.1, 4.9, 4.5, 4.2, 4.4, 4.6, 4.9])
+YTM_ASK = YTM_BID - 0.1
+CPN = np.array([0, 2.5, 3.0, 4.25, 0, 5.0, 6.5])
+
+
+def test_single_side_sensitivities():
+    both = compute_sensitivities(1000, YEARS, YTM_BID, YTM_ASK, CPN)
+    ask = compute_sensitivities(1000, YEARS, None, YTM_ASK, CPN)
+
+    assert ask.dv01_bid is None
+    np.testing.assert_allclose(ask.dv01_ask, both.dv01_ask)
+    np.testing.assert_allclose(ask.key_rate_durations, both.key_rate_durations)
+    np.testing.assert_allclose(ask.dv01_ask, compute_bond_risk(1000, YEARS, YTM_ASK, CPN).dv01)
+
+
+def test_batch_analytics_match_scalar_functions():
+    analytics = calculate_bond_analytics(1000, YEARS, YTM_BID, YTM_ASK, CPN)
+
+    for side, buying, ytm in (('Buy', True, YTM_ASK), ('Sell', False, YTM_BID)):
+        for i, bond in enumerate(zip(YEARS, YTM_BID, YTM_ASK, CPN)):
+            assert analytics[f'{side} Price'][i] == calculate_bond_price(1000, *bond, buying)
+            assert analytics[f'Macaulay Duration ({side})'][i] == calculate_macaulay_duration(1000, *bond, buying)
+            assert analytics[f'Modified Duration ({side})'][i] == calculate_modified_duration(1000, *bond, buying)
+            assert analytics[f'Convexity ({side})'][i] == calculate_bond_convexity(1000, *bond, buying)
+            assert analytics[f'DV01 ({side})'][i] == calculate_dv01(1000, CPN[i], YEARS[i], ytm[i])
+
+
+def test_solve_ytm_recovers_the_yield_of_the_price():
+    price = compute_bond_risk(1000, YEARS, YTM_ASK, CPN).price
+    solution = solve_ytm(price, 1000, YEARS, CPN)
+
+    assert solution.converged.all()
+    np.testing.assert_allclose(solution.ytm, YTM_ASK, atol=1e-6)
+    assert solve_ytm(price[3], 1000, YEARS[3], CPN[3]).ytm == solution.ytm[3]
+
+
+def test_solve_ytm_without_solution_is_nan():
+    # below the price of the coupons alone even at the top of the bracket (1000%)
+    solution = solve_ytm(1.0, 1000, 5, 4.0)
+    assert np.isnan(solution.ytm) and not solution.converged
+
+
+def test_key_rate_dv01_add_up_to_dv01():
+    sensitivities = compute_sensitivities(1000, YEARS, YTM_BID, YTM_ASK, CPN)
+    np.testing.assert_allclose(sensitivities.key_rate_dv01.sum(axis=1), sensitivities.dv01_ask)
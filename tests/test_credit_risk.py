@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.credit_risk import simulate_credit_losses
+
+PORTFOLIO = pd.DataFrame({
+    'Issuer': ['Alpha Republic', 'Alpha Development Bank', 'Beta Republic', 'Gamma Republic'],
+    'Country': ['Alpha', 'Alpha', 'Beta', 'Gamma'],
+    'Amount per Bond': [100.0, 50.0, 80.0, 30.0],
+    'Years to Maturity': [5, 3, 10, 2],
+    'Spread_2y': [300.0, 300.0, 80.0, 500.0],
+    'Spread_5y': [350.0, 350.0, 90.0, 550.0],
+    'Spread_10y': [400.0, 400.0, 100.0, 600.0],
+})
+
+
+def _simulate(portfolio):
+    return simulate_credit_losses(portfolio, n_paths=20_000, paths_per_chunk=5_000)
+
+
+def test_contributions_add_up_to_expected_shortfall():
+    result = _simulate(PORTFOLIO)
+    summary = result.summary.set_index('Metric')['Value']
+
+    assert np.isclose(result.contributions['ES Contribution'].sum(), summary['ES 99.9%'])
+
+    # the average of the worst n_paths * (1 - level) losses, with a fraction of the loss at the boundary
+    losses = np.sort(result.losses)[::-1]
+    tail = len(losses) * (1 - 0.99)
+    whole = int(tail)
+    assert np.isclose(summary['ES 99.0%'], (losses[:whole].sum() + (tail - whole) * losses[whole]) / tail)
+
+
+@pytest.mark.parametrize('column, row', [('Issuer', 1), ('Country', 2), ('Years to Maturity', 3)])
+def test_incomplete_bonds_are_named(column, row):
+    portfolio = PORTFOLIO.copy()
+    portfolio[column] = portfolio[column].astype(object)
+    portfolio.loc[row, column] = np.nan
+
+    with pytest.raises(ValueError, match=rf"\[{row}\]"):
+        _simulate(portfolio)
+
+
+def test_bonds_without_cds_quote_are_reported():
+    portfolio = PORTFOLIO.assign(Spread_2y=[300.0, 300.0, 80.0, np.nan], Spread_5y=[350.0, 350.0, 90.0, np.nan],
+                                 Spread_10y=[400.0, 400.0, 100.0, np.nan])
+
+    with pytest.warns(UserWarning, match=r"default-free: \[3\]"):
+        result = _simulate(portfolio)
+    assert result.contributions.set_index('Issuer').loc['Gamma Republic', 'ES Contribution'] == 0
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.synthetic import synthetic_bonds
+from bond_analysis import run_analysis
+from utils import curves
+from utils.curves import YieldCurve
+from utils.schema import AS_OF_DATE
+from utils.screening import fit_country_curves, screen_rich_cheap
+
+
+@pytest.fixture(scope="module")
+def synthetic_curves():
+    analyzed = run_analysis(synthetic_bonds(1000, seed=0))
+    bullets = analyzed[analyzed['Mty Type'].isin(['AT MATURITY', 'NORMAL'])]
+    fitted, in_fit = fit_country_curves(bullets)
+    return bullets[in_fit], fitted
+
+
+def test_curves_stay_near_the_fitted_yields(synthetic_curves):
+    # e.g. Belgium, whose unconstrained fit fell to -19562% at 5.25 years
+    bonds, fitted = synthetic_curves
+    for country, curve in fitted.items():
+        yields = bonds.loc[bonds['Country'] == country, 'YTM - Ask'].astype(float)
+        padding = max(0.5 * (yields.max() - yields.min()), 1.0)
+        rates = curve.zero_rate(np.linspace(*curve.tenor_range, 1000))
+        assert yields.min() - padding - 0.1 <= rates.min() and rates.max() <= yields.max() + padding + 0.1, country
+
+
+def test_nss_fit_without_sane_curve_falls_back_to_spline(monkeypatch):
+    tenors = np.array([1.0, 2.0, 3.0, 5.0, 7.0, 10.0])
+    yields = np.array([4.0, 4.2, 4.1, 4.5, 4.4, 4.8])
+    assert YieldCurve.fit(tenors, yields).method == 'nss'
+
+    monkeypatch.setattr(curves, 'NSS_BAND', -1.0)
+    monkeypatch.setattr(curves, 'NSS_BAND_MIN', -1.0)
+    curve = YieldCurve.fit(tenors, yields)
+    assert curve.method == 'spline'
+    np.testing.assert_allclose(curve.zero_rate(tenors), yields)
+
+
+def test_bucket_on_its_curve_has_finite_z_scores():
+    # every bond of the country yields 5%, so all residual spreads (and their median absolute deviation) are 0
+    maturities = pd.to_datetime(AS_OF_DATE) + pd.to_timedelta(np.arange(1, 9) * 365, unit='D')
+    data = pd.DataFrame({'Issuer': 'Flat Government Bond', 'Country': 'Flatland', 'Maturity': maturities,
+                         'YTM - Ask': 5.0})
+    screen = screen_rich_cheap(data, method='spline')
+
+    assert np.isfinite(screen['Z-Score']).all()
+    np.testing.assert_allclose(screen['Z-Score'], 0.0, atol=1e-6)
@@ -0,0 +1,41 @@
+import json
+import sys
+
+from utils import instrumentation
+from utils.instrumentation import _Stage, _Tracer, _max_rss, finish_trace
+
+
+def _nested_stages(tracer):
+    with _Stage(tracer, "pipeline"):
+        for _ in range(2):
+            with _Stage(tracer, "batch") as record:
+                record['rows_in'] = sum(range(1000))
+
+
+def test_nested_stages_with_profiling(tmp_path, monkeypatch):
+    # e.g. pipeline.py --trace --profile, whose stages run inside the stage of their pipeline step
+    tracer = _Tracer(tmp_path, profile=True)
+    _nested_stages(tracer)
+
+    assert list(tracer._profiles) == ["pipeline"]
+    assert tracer._profiling_record is None
+    assert tracer.records["batch"]['calls'] == 2 and tracer.records["batch"]['parent'] == "pipeline"
+
+    # the profiler is free again for the next top-level stage
+    with _Stage(tracer, "analysis"):
+        pass
+    assert "analysis" in tracer._profiles
+
+
+def test_trace_without_resource_module(tmp_path, monkeypatch):
+    # the resource module does not exist on Windows
+    monkeypatch.setitem(sys.modules, "resource", None)
+    assert _max_rss() is None
+
+    tracer = _Tracer(tmp_path, profile=False)
+    _nested_stages(tracer)
+    monkeypatch.setattr(instrumentation, "_tracer", tracer)
+
+    trace = json.loads(finish_trace("test").read_text())
+    assert trace['maxrss_mb'] is None
+    assert [stage['name'] for stage in trace['stages']] == ["pipeline", "batch"]
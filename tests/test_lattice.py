@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+from utils.bond_math import compute_bond_risk
+from utils.curves import YieldCurve
+from utils.lattice import price_embedded_options
+
+TENORS = np.array([0.5, 1, 2, 3, 5, 7, 10, 20, 30.0])
+
+
+def test_bullet_bond_on_a_flat_curve_has_zero_oas():
+    # callable only at maturity, where it is worth par anyway, so the bonds are bullets on the tree
+    curve = YieldCurve.fit(TENORS, np.full(len(TENORS), 5.0), method='spline', label='Flatland')
+    years, coupon_rate = np.array([3.0, 7.5, 10.0]), np.array([4.0, 0.0, 6.5])
+    data = pd.DataFrame({'Mty Type': 'CALLABLE', 'Country': 'Flatland', 'Years to Maturity': years,
+                         'Cpn': coupon_rate, 'YTM - Ask': 5.0,
+                         'Buy Price': compute_bond_risk(1000, years, 5.0, coupon_rate).price})
+
+    results = price_embedded_options(data, curves={'Flatland': curve},
+                                     first_exercise_years=pd.Series(years, index=data.index))
+
+    np.testing.assert_allclose(results['OAS'], 0.0, atol=1e-6)
+    np.testing.assert_allclose(results['Option Value'], 0.0, atol=1e-8)
+    np.testing.assert_allclose(results['Option-Adjusted Yield'], 5.0, atol=1e-6)
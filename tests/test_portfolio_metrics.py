@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+from utils.portfolio_metrics import PortfolioRiskState, calculate_portfolio_metrics
+
+PORTFOLIO = pd.DataFrame({
+    'Share per Bond': [0.5, 0.3, 0.2],
+    'Number of Bond': [10, 6, 4],
+    'Buy Price': [980.0, 1010.0, 870.0],
+    'YTM - Ask': [5.2, 4.1, 7.9],
+    'Years to Maturity': [5, 10, 3],
+    'Cpn': [4.75, 4.25, 3.0],
+    'Percentage Spread': [0.2, 0.1, 0.6],
+    'Spread_5y': [120.0, 45.0, 310.0],
+    'PD_5y_pct': [9.5, 3.7, 22.8],
+})
+
+COLUMNS = dict(weight_col='Share per Bond', num_bonds_col='Number of Bond', price_col='Buy Price',
+               ytm_col='YTM - Ask', maturity_col='Years to Maturity', coupon_col='Cpn')
+
+
+def test_bond_without_cds_quote_is_skipped():
+    portfolio = PORTFOLIO.assign(Spread_5y=[120.0, np.nan, 310.0], PD_5y_pct=[9.5, np.nan, 22.8])
+    metrics = calculate_portfolio_metrics(portfolio, **COLUMNS).set_index('Metric')['Value']
+
+    for metric, col in [('5-yr CDS Spread', 'Spread_5y'), ('PD_5y_pct', 'PD_5y_pct')]:
+        assert np.isclose(metrics[metric], (portfolio['Share per Bond'] * portfolio[col]).sum())
+    assert metrics.notna().all()
+
+
+def test_incremental_updates_skip_missing_values():
+    portfolio = PORTFOLIO.assign(Spread_5y=[120.0, np.nan, 310.0])
+    state = PortfolioRiskState(portfolio, **COLUMNS)
+    state.swap(0, 1)
+    state.reweight(2, 0.4)
+
+    expected = calculate_portfolio_metrics(portfolio.assign(**{'Share per Bond': [0.0, 0.8, 0.4]}), **COLUMNS)
+    np.testing.assert_allclose(list(state.totals().values()), expected['Value'])
+    assert np.isclose(state.totals()['5-yr CDS Spread'], 0.4 * 310.0)
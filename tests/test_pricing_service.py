@@ -0,0 +1,52 @@
+import asyncio
+import json
+from http import HTTPStatus
+
+import numpy as np
+import pytest
+from benchmarks.synthetic import synthetic_bonds
+from bond_analysis import run_analysis
+from pricing_service import BondUniverse, MicroBatcher, PricingService
+from utils.bond_math import compute_bond_risk
+
+
+@pytest.fixture(scope="module")
+def service(tmp_path_factory):
+    analyzed = run_analysis(synthetic_bonds(50, seed=0))
+    return PricingService(BondUniverse.build(analyzed, "synthetic", directory=tmp_path_factory.mktemp("service")))
+
+
+async def _post(service, *requests):
+    # sent in the same turn of the event loop, so they share one batch
+    return await asyncio.gather(*(service.dispatch('POST', '/risk', json.dumps(request)) for request in requests))
+
+
+def test_invalid_ad_hoc_bond_does_not_fail_the_batch(service):
+    valid, invalid = asyncio.run(_post(service, {'bonds': [0, 1, 2]},
+                                       {'years_to_maturity': float('nan'), 'ytm': 5, 'coupon': 4}))
+
+    assert valid[0] == HTTPStatus.OK and len(valid[1]['price']) == 3
+    assert invalid[0] == HTTPStatus.BAD_REQUEST and 'years_to_maturity' in invalid[1]['error']
+
+
+def test_ad_hoc_bond_beyond_max_maturity_is_refused(service):
+    (status, response), = asyncio.run(_post(service, {'years_to_maturity': 1e12, 'ytm': 5, 'coupon': 4}))
+    assert status == HTTPStatus.BAD_REQUEST
+
+
+def test_failed_batch_is_computed_request_by_request():
+    def compute(years, ytm):
+        if (years < 0).any():
+            raise ValueError("negative maturity")
+        return compute_bond_risk(1000, years, ytm, 5.0)
+
+    async def run():
+        batcher = MicroBatcher(compute)
+        futures = [batcher.submit(np.array([2.0, 10.0]), np.array([4.0, 5.0])),
+                   batcher.submit(np.array([-1.0]), np.array([4.0]))]
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    results, error = asyncio.run(run())
+
+    assert isinstance(error, ValueError)
+    np.testing.assert_allclose(results[0], compute_bond_risk(1000, [2.0, 10.0], [4.0, 5.0], 5.0).price)
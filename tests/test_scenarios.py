@@ -0,0 +1,40 @@
+import numpy as np
+from utils.bond_math import compute_bond_risk
+from utils.scenarios import parallel_shifts, reprice_scenarios, twists
+
+YEARS = np.array([2, 5, 10, 30.0])
+YTM = np.array([4.0, 4.5, 5.0, 5.5])
+CPN = np.array([3.0, 0, 5.0, 6.0])
+QUANTITY = np.array([1, 2, 3, 4])
+
+
+def _full_repricing(bumps_bp):
+    base = compute_bond_risk(1000, YEARS, YTM, CPN).price
+    pnl = [compute_bond_risk(1000, YEARS, YTM + bumps / 100, CPN).price - base for bumps in bumps_bp]
+    return np.array(pnl) * QUANTITY
+
+
+def test_scenarios_match_full_repricing():
+    bumps = np.vstack([parallel_shifts([-100, -1, 1, 100], YEARS), twists([-50, 50], YEARS)])
+    result = reprice_scenarios(1000, YEARS, YTM, CPN, bumps, quantity=QUANTITY)
+    pnl = _full_repricing(bumps)
+
+    np.testing.assert_allclose(result.pnl, pnl, atol=1e-8)
+    np.testing.assert_allclose(result.portfolio_pnl, pnl.sum(axis=1), atol=1e-8)
+    np.testing.assert_allclose(result.portfolio_approx_pnl, result.approx_pnl.sum(axis=1))
+
+
+def test_approximation_converges_for_small_bumps():
+    result = reprice_scenarios(1000, YEARS, YTM, CPN, parallel_shifts([-1, 1, 100], YEARS), quantity=QUANTITY)
+    error = np.abs(result.approx_pnl - result.pnl) / np.abs(result.pnl)
+
+    assert (error[:2] < 1e-6).all()
+    assert (error[2] < 1e-2).all()
+
+
+def test_portfolio_pnl_without_cube():
+    bumps = parallel_shifts([-100, 100], YEARS)
+    result = reprice_scenarios(1000, YEARS, YTM, CPN, bumps, quantity=QUANTITY, return_cube=False)
+
+    assert result.pnl is None and result.approx_pnl is None
+    np.testing.assert_allclose(result.portfolio_pnl, _full_repricing(bumps).sum(axis=1), atol=1e-8)
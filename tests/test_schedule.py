@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from utils.bond_math import compute_bond_risk
+from utils.schedule import build_schedules, coupon_schedule, price_with_schedules
+
+
+def test_coupon_dates_roll_back_from_maturity():
+    schedule = coupon_schedule('2030-01-15', settle='2024-03-15')
+
+    assert schedule.coupon_dates[0] == np.datetime64('2024-07-15')
+    assert schedule.coupon_dates[-1] == np.datetime64('2030-01-15')
+    assert len(schedule.coupon_dates) == 12 and schedule.previous_coupon == np.datetime64('2024-01-15')
+    # 60 of the 180 days of the period have accrued under 30/360
+    assert schedule.accrued_fraction == pytest.approx(1 / 3) and schedule.period_offset == pytest.approx(2 / 3)
+
+
+def test_month_end_maturity_pays_on_month_ends():
+    schedule = coupon_schedule('2030-02-28', settle='2024-03-15')
+    assert list(schedule.coupon_dates[:3].astype(str)) == ['2024-08-31', '2025-02-28', '2025-08-31']
+
+
+def test_matured_bond_has_no_coupons():
+    schedule = coupon_schedule('2020-06-30', settle='2024-03-15')
+    assert len(schedule.coupon_dates) == 0 and np.isnan(schedule.accrued_fraction)
+
+
+def test_invalid_schedule_arguments():
+    with pytest.raises(ValueError):
+        coupon_schedule('2030-01-15', convention='ACT/365')
+    with pytest.raises(ValueError):
+        coupon_schedule('2030-01-15', frequency=5)
+
+
+def test_price_on_a_coupon_date_matches_bond_math():
+    # settled on a coupon date, the schedules are whole periods like the period grid of bond_math
+    schedules = build_schedules(['2029-01-15', '2034-07-15', '2029-01-15'], settle='2024-01-15')
+    price = price_with_schedules(1000, [4.0, 6.0, 0.0], [5.0, 5.5, 5.0], schedules)
+
+    np.testing.assert_allclose(schedules.years_to_maturity, [5.0, 10.5, 5.0])
+    np.testing.assert_allclose(price.accrued, 0.0)
+    expected = compute_bond_risk(1000, [5.0, 10.5, 5.0], [5.0, 5.5, 5.0], [4.0, 6.0, 0.0]).price
+    np.testing.assert_allclose(price.dirty, expected)
+
+
+def test_accrued_interest_is_the_dirty_clean_difference():
+    schedules = build_schedules(['2030-01-15'], settle='2024-03-15')
+    price = price_with_schedules(1000, 6.0, 5.0, schedules)
+
+    assert price.accrued[0] == pytest.approx(30 / 3)
+    assert price.dirty[0] - price.clean[0] == pytest.approx(price.accrued[0])
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+from utils.schema import apply_schema
+from utils.storage import TableWriter, read_table
+
+BONDS = pd.DataFrame({
+    'Issuer': ['Romania Government Bond', 'Bpifrance SACA', 'Nigeria Government International Bond'],
+    'Country': ['Romania', 'France', None],
+    'Series': [np.nan, 'EMTN', np.nan],
+    'Cpn': [4.0, 2.5, 7.625],
+    'Maturity': pd.to_datetime(['2030-01-15', '2028-06-01', '2033-11-21']),
+    'YTM - Ask': [5.9, 3.1, 9.2],
+    'YTM - Bid': [6.0, 3.2, 9.4],
+})
+
+
+def _write_batches(batches, directory):
+    with TableWriter("bonds-data", directory=directory) as writer:
+        for batch in batches:
+            writer.write(apply_schema(batch, "bonds-data"))
+    return read_table("bonds-data", directory=directory)
+
+
+def test_empty_first_batch_keeps_text_columns(tmp_path):
+    # e.g. a maturity-sorted export whose first batch only holds matured bonds
+    stored = _write_batches([BONDS.iloc[:0], BONDS], tmp_path)
+
+    for col in ['Issuer', 'Country', 'Series']:
+        assert stored[col].astype(object).where(stored[col].notna(), None).tolist() == \
+            BONDS[col].astype(object).where(BONDS[col].notna(), None).tolist()
+
+
+def test_missing_text_column_in_first_batch(tmp_path):
+    # 'Series' is all missing in the first chunk of a CSV export, so pandas reads it as float there
+    stored = _write_batches([BONDS.iloc[:1].assign(Series=np.nan), BONDS.iloc[1:]], tmp_path)
+
+    assert stored['Series'].tolist()[1] == 'EMTN'
+    assert stored['Series'].isna().sum() == 2
+
+
+def test_batches_do_not_change_the_table(tmp_path):
+    whole = _write_batches([BONDS], tmp_path / "whole")
+    batched = _write_batches([BONDS.iloc[:1], BONDS.iloc[1:2], BONDS.iloc[:0], BONDS.iloc[2:]], tmp_path / "batched")
+
+    pd.testing.assert_frame_equal(whole.astype({col: object for col in ['Issuer', 'Country', 'Series']}),
+                                  batched.astype({col: object for col in ['Issuer', 'Country', 'Series']}))
+
+
+def test_no_batches_replace_the_previous_table(tmp_path):
+    # e.g. an input in which every bond is filtered out
+    _write_batches([BONDS], tmp_path)
+    stored = _write_batches([], tmp_path)
+
+    assert stored.empty
+    assert {'Issuer', 'Country', 'Maturity', 'YTM - Ask'} <= set(stored.columns)
+
+
+def test_filtered_read_has_no_unused_categories(tmp_path):
+    _write_batches([BONDS], tmp_path)
+    romania = read_table("bonds-data", filters=[('Country', '==', 'Romania')], directory=tmp_path)
+
+    assert romania['Issuer'].cat.categories.tolist() == ['Romania Government Bond']
+    assert (romania['Country'].value_counts() > 0).all()
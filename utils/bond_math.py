@@ -1,12 +1,202 @@
 # bond_math.py
+# |--- compute_bond_risk()
+# |--- calculate_bond_analytics()
 # |--- calculate_bond_price()
 # |--- calculate_macaulay_duration()
 # |--- calculate_modified_duration()
 # |--- calculate_bond_convexity()
 # |--- calculate_dv01()
+# |--- solve_ytm()
+# |--- compute_sensitivities()
+
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+# Key rate tenors (in years) of compute_sensitivities()
+KEY_RATES = (1, 2, 5, 10, 30)
 
 # ==============================================================================================================
-# 1. calculate_bond_price()
+# 0. Vectorized kernels shared by the batched and the scalar API
+# ==============================================================================================================
+
+def _as_arrays(*values):
+    """
+    Convert scalars, lists or Series to float arrays of a common (broadcast) shape.
+    A coupon rate of None is treated as 0, i.e. a zero coupon bond.
+    """
+    values = [np.zeros(1) if v is None else np.asarray(v, dtype=float) for v in values]
+    return [np.atleast_1d(v).astype(float, copy=False) for v in np.broadcast_arrays(*values)]
+
+
+def _period_grid(years_to_maturity, periods_per_year, max_periods=None):
+    """
+    Build the padded period index (1..N) used for every bond in the batch.
+    N is the longest schedule in the batch, or max_periods if that is larger.
+
+    Returns:
+    - periods (ndarray): Row vector of period indices 1..N, where N is the longest schedule in the batch.
+    - total_periods (ndarray): int(years_to_maturity * periods_per_year) for each bond.
+    - pricing_periods (ndarray): total_periods, plus one period for bonds with less than 1 year to maturity.
+    """
+
+    total_periods = np.trunc(years_to_maturity * periods_per_year).astype(int)
+    pricing_periods = np.where(years_to_maturity < 1, total_periods + 1, total_periods)
+    n_periods = max(int(pricing_periods.max(initial=0)), max_periods or 0, 1)
+    periods = np.arange(1, n_periods + 1)[np.newaxis, :]
+    return periods, total_periods, pricing_periods
+
+
+def _discount_matrix(discount_per_period, n_periods):
+    """
+    Discount factors d**0, d**1, ..., d**N for each bond, built by a running product so that only one power
+    per bond is evaluated. Column 0 holds d**0 = 1 so that the factor at maturity can be gathered as [:, n].
+    """
+
+    discount_per_period = np.broadcast_to(discount_per_period[:, np.newaxis], (len(discount_per_period), n_periods + 1)).copy()
+    discount_per_period[:, 0] = 1
+    return np.cumprod(discount_per_period, axis=1)
+
+
+def _bond_risk(face_value, years_to_maturity, ytm, coupon_rate, periods_per_year, max_periods=None):
+    """
+    Fused kernel behind compute_bond_risk(): price, Macaulay duration, modified duration, convexity and
+    analytic DV01 (per 1bp) for each bond, all derived from one discount matrix per bond.
+    """
+
+    periods, total_periods, pricing_periods = _period_grid(years_to_maturity, periods_per_year, max_periods)
+    rows = np.arange(len(ytm))
+
+    base = 1 + (ytm / (100 * periods_per_year))
+    is_coupon = coupon_rate != 0
+    coupon_payment = np.where(is_coupon, (face_value * coupon_rate / 100) / periods_per_year, 0)
+
+    # the only powers evaluated per bond: one for the coupon periods, one for the convexity time grid
+    discount_factors = _discount_matrix(1 / base, periods.shape[1])
+    time_discount_factors = _discount_matrix(base ** (-1 / periods_per_year), periods.shape[1])
+
+    # coupons paid up to the pricing horizon and up to the duration horizon (they differ for bonds under 1 year)
+    coupon_pv = coupon_payment[:, np.newaxis] * discount_factors[:, 1:]
+    priced_coupon_pv = np.where(periods <= pricing_periods[:, np.newaxis], coupon_pv, 0)
+    duration_coupon_pv = np.where(periods <= total_periods[:, np.newaxis], coupon_pv, 0)
+
+    # face value discounted from maturity
+    face_pv = face_value * discount_factors[rows, pricing_periods]
+    duration_face_pv = face_value * discount_factors[rows, total_periods]
+
+    # 1. price
+    price = priced_coupon_pv.sum(axis=1) + face_pv
+
+    # 2. Macaulay duration (zero coupon bonds keep the original years / (1 + y)**n convention)
+    numerator = (periods * duration_coupon_pv).sum(axis=1) + total_periods * duration_face_pv
+    present_value = duration_coupon_pv.sum(axis=1) + duration_face_pv
+    macaulay_duration = np.where(is_coupon,
+                                 numerator / present_value / periods_per_year,
+                                 years_to_maturity * discount_factors[rows, total_periods])
+
+    # 3. modified duration
+    modified_duration = macaulay_duration / base
+
+    # 4. convexity
+    times = periods / periods_per_year[:, np.newaxis]
+    weighted_cash_flows = np.where(periods <= pricing_periods[:, np.newaxis],
+                                   coupon_payment[:, np.newaxis] * times * (times + 1) * time_discount_factors[:, 1:], 0)
+    coupon_convexity = (weighted_cash_flows.sum(axis=1)
+                        + (years_to_maturity * (years_to_maturity + 1) * face_value) / base ** years_to_maturity) / base ** 2 / face_value
+    zero_convexity = pricing_periods * (pricing_periods + 1) * discount_factors[rows, pricing_periods]
+    convexity = np.where(is_coupon, coupon_convexity, zero_convexity)
+
+    # 5. DV01: analytic dP/dy for a 1bp (0.01 in YTM percent) increase, no bump-and-reprice needed
+    price_sensitivity = (periods * priced_coupon_pv).sum(axis=1) + pricing_periods * face_pv
+    dv01 = -price_sensitivity / base / (100 * periods_per_year) / 100
+
+    return price, macaulay_duration, modified_duration, convexity, dv01
+
+# ==============================================================================================================
+# 1. compute_bond_risk()
+# ==============================================================================================================
+
+BondRisk = namedtuple('BondRisk', ['price', 'macaulay_duration', 'modified_duration', 'convexity', 'dv01'])
+
+
+def compute_bond_risk(face_value, years_to_maturity, ytm, coupon_rate=None, periods_per_year=2):
+    """
+    Calculate the full risk set of one or many bonds at a single yield in one pass.
+
+    The discount factors are computed once per bond and every measure is derived from them. DV01 is the
+    analytic price change for a 1bp increase in yield, so the bond is not repriced. Values are not rounded.
+
+    Parameters:
+    - face_value (float or array-like): The face value of the bond(s).
+    - years_to_maturity (float or array-like): The number of years until the bond(s) mature.
+    - ytm (float or array-like): The Yield to Maturity (YTM) used for discounting, e.g. YTM Ask when buying.
+    - coupon_rate (float or array-like, optional): The annual coupon rate. Default is None for zero coupon bonds.
+    - periods_per_year (int or array-like, optional): Number of compounding periods per year. Default is 2 for semi-annual compounding.
+
+    Returns:
+    - BondRisk: Named tuple (price, macaulay_duration, modified_duration, convexity, dv01) of floats when all
+                inputs are scalars, of arrays otherwise.
+    """
+
+    scalar_input = all(np.ndim(v) == 0 for v in (face_value, years_to_maturity, ytm, coupon_rate, periods_per_year))
+
+    risk = _bond_risk(*_as_arrays(face_value, years_to_maturity, ytm, coupon_rate, periods_per_year))
+
+    if scalar_input:
+        return BondRisk(*(float(measure[0]) for measure in risk))
+    return BondRisk(*risk)
+
+# ==============================================================================================================
+# 2. calculate_bond_analytics()
+# ==============================================================================================================
+
+def calculate_bond_analytics(face_value, years_to_maturity, ytm_bid, ytm_ask, coupon_rate=None, periods_per_year=2, max_periods=None):
+    """
+    Calculate price, Macaulay duration, modified duration, convexity and DV01 for a whole universe of bonds
+    at once, for both the buying (YTM Ask) and the selling (YTM Bid) side.
+
+    All inputs may be scalars or array-likes (e.g. DataFrame columns) and are broadcast against each other.
+    The period grid is padded to the longest bond, so each measure is a single array operation instead of a
+    Python loop per bond. Values are rounded like the scalar functions below.
+
+    Parameters:
+    - face_value (array-like): The face value of each bond.
+    - years_to_maturity (array-like): The number of years until each bond matures.
+    - ytm_bid (array-like): The Yield to Maturity (YTM) for selling each bond.
+    - ytm_ask (array-like): The Yield to Maturity (YTM) for buying each bond.
+    - coupon_rate (array-like, optional): The annual coupon rate. Default is None for zero coupon bonds; a rate of 0
+                                          is treated as a zero coupon bond as well.
+    - periods_per_year (array-like, optional): Number of compounding periods per year. Default is 2 for semi-annual compounding.
+    - max_periods (int, optional): Pad the period grid to at least this many periods. Chunks of a universe padded to the
+                                   universe's longest schedule give bit-for-bit the same results as a single batch.
+
+    Returns:
+    - dict: Arrays keyed by column name: 'Buy Price', 'Sell Price', 'Macaulay Duration (Buy)', 'Macaulay Duration (Sell)',
+            'Modified Duration (Buy)', 'Modified Duration (Sell)', 'Convexity (Buy)', 'Convexity (Sell)',
+            'DV01 (Buy)' and 'DV01 (Sell)'.
+    """
+
+    face_value, years_to_maturity, ytm_bid, ytm_ask, coupon_rate, periods_per_year = _as_arrays(
+        face_value, years_to_maturity, ytm_bid, ytm_ask, coupon_rate, periods_per_year)
+
+    analytics = {}
+    for side, ytm in (('Buy', ytm_ask), ('Sell', ytm_bid)):
+        risk = BondRisk(*_bond_risk(face_value, years_to_maturity, ytm, coupon_rate, periods_per_year, max_periods))
+
+        # modified duration is derived from the rounded Macaulay duration, as in calculate_modified_duration()
+        macaulay_duration = np.round(risk.macaulay_duration, 3)
+
+        analytics[f'{side} Price'] = np.round(risk.price, 3)
+        analytics[f'Macaulay Duration ({side})'] = macaulay_duration
+        analytics[f'Modified Duration ({side})'] = np.round(macaulay_duration / (1 + (ytm / (100 * periods_per_year))), 3)
+        analytics[f'Convexity ({side})'] = np.round(risk.convexity, 2)
+        analytics[f'DV01 ({side})'] = np.round(risk.dv01, 3)
+
+    return analytics
+
+# ==============================================================================================================
+# 3. calculate_bond_price()
 # ==============================================================================================================
 
 def calculate_bond_price(face_value, years_to_maturity, ytm_bid, ytm_ask, coupon_rate=None, buying=True, periods_per_year=2):
@@ -19,7 +209,7 @@ def calculate_bond_price(face_value, years_to_maturity, ytm_bid, ytm_ask, coupon
     - ytm_bid (float): The Yield to Maturity (YTM) for selling the bond.
     - ytm_ask (float): The Yield to Maturity (YTM) for buying the bond.
     - coupon_rate (float, optional): The annual coupon rate. Default is None for zero coupon bonds.
-    - buying (bool, optional):  If True, calculate bond price for buying using YTM Ask; 
+    - buying (bool, optional):  If True, calculate bond price for buying using YTM Ask;
                                 If False, calculate for selling using YTM Bid. Default is True.
     - periods_per_year (int, optional): Number of compounding periods per year. Default is 2 for semi-annual compounding.
 
@@ -27,34 +217,15 @@ def calculate_bond_price(face_value, years_to_maturity, ytm_bid, ytm_ask, coupon
     - float: The calculated present value (price) of the bond.
     """
 
-    total_periods = int(years_to_maturity * periods_per_year)
-    
-    # Handle bonds with less than 1 year to maturity
-    if years_to_maturity < 1:
-        total_periods = int(years_to_maturity * periods_per_year) + 1
-    
     # Determine which yield-to-maturity to use based on buying or selling
     ytm = ytm_ask if buying else ytm_bid
-    
-    # For coupon-bearing bonds
-    if coupon_rate is not None and coupon_rate != 0:
-        coupon_payment = (face_value * coupon_rate / 100) / periods_per_year  # Adjust for compounding frequency
-        
-        # Calculate the discount factors for each period
-        discount_factors = [(1 + (ytm / (100 * periods_per_year)))**(-i) for i in range(1, total_periods + 1)]
-        
-        # Calculate the present value of coupon payments and face value
-        bond_price = sum([coupon_payment * discount_factors[i-1] for i in range(1, total_periods + 1)])
-        bond_price += face_value * discount_factors[-1]
-
-    # For zero-coupon bonds
-    else:
-        bond_price = face_value / (1 + (ytm / (100 * periods_per_year)))**total_periods  # Adjust for compounding frequency
+
+    bond_price = compute_bond_risk(face_value, years_to_maturity, ytm, coupon_rate, periods_per_year).price
 
     return round(bond_price, 3)
 
 # ==============================================================================================================
-# 2. calculate_macaulay_duration()
+# 4. calculate_macaulay_duration()
 # ==============================================================================================================
 
 def calculate_macaulay_duration(face_value, years_to_maturity, ytm_bid, ytm_ask, coupon_rate=None, buying=True, periods_per_year=2):
@@ -67,7 +238,7 @@ def calculate_macaulay_duration(face_value, years_to_maturity, ytm_bid, ytm_ask,
     - ytm_bid (float): The Yield to Maturity (YTM) for buying the bond.
     - ytm_ask (float): The Yield to Maturity (YTM) for selling the bond.
     - coupon_rate (float, optional): The annual coupon rate. Default is None for zero coupon bonds.
-    - buying (bool, optional):  If True, calculate bond duration for buying using YTM Ask; 
+    - buying (bool, optional):  If True, calculate bond duration for buying using YTM Ask;
                                 if False, calculate for selling using YTM Bid. Default is True.
     - periods_per_year (int, optional): Number of compounding periods per year. Default is 2 for semi-annual compounding.
 
@@ -78,29 +249,12 @@ def calculate_macaulay_duration(face_value, years_to_maturity, ytm_bid, ytm_ask,
     # Determine which YTM to use based on buying or selling
     ytm = ytm_ask if buying else ytm_bid
 
-    if coupon_rate is not None and coupon_rate != 0:
-        # Coupon-bearing bond
-        total_periods = int(years_to_maturity * periods_per_year)
-        coupon_payment = face_value * (coupon_rate / 100) / periods_per_year  # Adjust for compounding frequency
-        discount_factor = (1 + (ytm / (100 * periods_per_year)))
-
-        numerator = sum([(i * coupon_payment) / (discount_factor**i) for i in range(1, total_periods + 1)])
-        numerator += total_periods * face_value / (discount_factor**total_periods)
-
-        present_value = sum([coupon_payment / (discount_factor**i) for i in range(1, total_periods + 1)])
-        present_value += face_value / (discount_factor**total_periods)
-
-        macaulay_duration = numerator / present_value / periods_per_year
-
-    else:
-        # Zero coupon bond
-        total_periods = int(years_to_maturity * periods_per_year)
-        macaulay_duration = years_to_maturity / ((1 + (ytm / (100 * periods_per_year)))**total_periods)  # Adjust for compounding frequency
+    macaulay_duration = compute_bond_risk(face_value, years_to_maturity, ytm, coupon_rate, periods_per_year).macaulay_duration
 
     return round(macaulay_duration, 3)
 
 # ==============================================================================================================
-# 3. calculate_modified_duration()
+# 5. calculate_modified_duration()
 # ==============================================================================================================
 
 def calculate_modified_duration(face_value, years_to_maturity, ytm_bid, ytm_ask, coupon_rate=None, buying=True, periods_per_year=2):
@@ -113,7 +267,7 @@ def calculate_modified_duration(face_value, years_to_maturity, ytm_bid, ytm_ask,
     - ytm_bid (float): The Yield to Maturity (YTM) for buying the bond.
     - ytm_ask (float): The Yield to Maturity (YTM) for selling the bond.
     - coupon_rate (float, optional): The annual coupon rate. Default is None for zero coupon bonds.
-    - buying (bool, optional):  If True, calculate bond modified duration for buying using YTM Ask; 
+    - buying (bool, optional):  If True, calculate bond modified duration for buying using YTM Ask;
                                 If False, calculate for selling using YTM Bid. Default is True.
     - periods_per_year (int, optional): Number of compounding periods per year. Default is 2 for semi-annual compounding.
 
@@ -133,7 +287,7 @@ def calculate_modified_duration(face_value, years_to_maturity, ytm_bid, ytm_ask,
     return round(modified_duration, 3)
 
 # ==============================================================================================================
-# 4. calculate_bond_convexity()
+# 6. calculate_bond_convexity()
 # ==============================================================================================================
 
 def calculate_bond_convexity(face_value, years_to_maturity, ytm_bid, ytm_ask, coupon_rate=None, buying=True, periods_per_year=2):
@@ -146,7 +300,7 @@ def calculate_bond_convexity(face_value, years_to_maturity, ytm_bid, ytm_ask, co
     - ytm_bid (float): The Yield to Maturity (YTM) for buying the bond.
     - ytm_ask (float): The Yield to Maturity (YTM) for selling the bond.
     - coupon_rate (float, optional): The annual coupon rate. Default is None for zero coupon bonds.
-    - buying (bool, optional):  If True, calculate bond convexity for buying using YTM Ask; 
+    - buying (bool, optional):  If True, calculate bond convexity for buying using YTM Ask;
                                 If False, calculate for selling using YTM Bid. Default is True.
     - periods_per_year (int, optional): Number of compounding periods per year. Default is 2 for semi-annual compounding.
 
@@ -154,60 +308,222 @@ def calculate_bond_convexity(face_value, years_to_maturity, ytm_bid, ytm_ask, co
     - float: The calculated convexity of the bond.
     """
 
-    total_periods = int(years_to_maturity * periods_per_year)
-    
-    # Handle bonds with less than 1 year to maturity
-    if years_to_maturity < 1:
-        total_periods = int(years_to_maturity * periods_per_year) + 1
-    
     # Determine which YTM to use based on buying or selling
     ytm = ytm_ask if buying else ytm_bid
-    
-    if coupon_rate is not None and coupon_rate != 0:    
-        # Coupon-bearing bond
-        coupon_payment = (face_value * coupon_rate / 100) / periods_per_year  # Adjust for compounding frequency
-
-        convexity = sum([(coupon_payment * (i/periods_per_year) * ((i/periods_per_year) + 1)) / (1 + (ytm / (100 * periods_per_year)))**(i/periods_per_year) for i in range(1, total_periods + 1)])
-        convexity += (years_to_maturity * (years_to_maturity + 1) * face_value) / (1 + (ytm / (100 * periods_per_year)))**years_to_maturity
-        convexity /= (1 + (ytm / (100 * periods_per_year)))**2
-        convexity /= face_value
-    else:
-        # Zero coupon bond
-        convexity = (total_periods * (total_periods + 1)) / ((1 + (ytm / (100 * periods_per_year)))**total_periods)
+
+    convexity = compute_bond_risk(face_value, years_to_maturity, ytm, coupon_rate, periods_per_year).convexity
 
     return round(convexity, 2)
 
 # ==============================================================================================================
-# 5. calculate_dv01()
+# 7. calculate_dv01()
 # ==============================================================================================================
 
 def calculate_dv01(face_value, coupon_rate, years_to_maturity, ytm, basis_point_change=1, periods_per_year=2):
     """
     Calculate the DV01 (dollar value of 01) for a bond.
 
+    The price change is taken from the analytic price sensitivity in compute_bond_risk(), i.e. the bond is not
+    repriced at a bumped yield.
+
     Parameters:
     - face_value (float): The face value of the bond.
     - coupon_rate (float): The annual coupon rate.
     - years_to_maturity (float): The number of years until the bond matures.
     - ytm (float): The Yield to Maturity (YTM) for the bond.
-    - basis_point_change (int, optional): The change in yield in basis points. Default is 1.
+    - basis_point_change (int, optional): The change in yield in basis points. Default is 1. The analytic DV01 is a
+                                          per basis point sensitivity, so it does not depend on the size of the move.
     - periods_per_year (int, optional): Number of compounding periods per year. Default is 2 for semi-annual compounding.
 
     Returns:
-    - float: The calculated DV01 for the bond.
+    - float: The calculated DV01 for the bond (change in price per basis point).
+    """
+
+    # Price change for a 1 basis point increase in yield
+    dv01 = compute_bond_risk(face_value, years_to_maturity, ytm, coupon_rate, periods_per_year).dv01
+
+    return round(dv01, 3)
+
+# ==============================================================================================================
+# 8. solve_ytm()
+# ==============================================================================================================
+
+YtmSolution = namedtuple('YtmSolution', ['ytm', 'converged', 'iterations'])
+
+
+def solve_ytm(price, face_value, years_to_maturity, coupon_rate=None, periods_per_year=2, tol=1e-8, max_iter=50, bracket=(-90.0, 1000.0)):
+    """
+    Solve the Yield to Maturity (YTM) implied by the price of one or many bonds, i.e. the inverse of calculate_bond_price().
+
+    All bonds are solved together with Newton-Raphson steps, using the analytic price sensitivity (DV01) of
+    compute_bond_risk() as the derivative. The price is decreasing in the yield, so every evaluation also narrows a
+    [low, high] bracket per bond; a Newton step that leaves the bracket is replaced by a bisection step. Bonds drop
+    out of the batch as soon as they converge.
+
+    Parameters:
+    - price (float or array-like): The price of the bond(s), e.g. an ask price to get the buying YTM.
+    - face_value (float or array-like): The face value of the bond(s).
+    - years_to_maturity (float or array-like): The number of years until the bond(s) mature.
+    - coupon_rate (float or array-like, optional): The annual coupon rate. Default is None for zero coupon bonds.
+    - periods_per_year (int or array-like, optional): Number of compounding periods per year. Default is 2 for semi-annual compounding.
+    - tol (float, optional): A bond has converged when its price at the solved yield is within tol of the given price. Default is 1e-8.
+    - max_iter (int, optional): Maximum number of iterations. Default is 50.
+    - bracket (tuple, optional): The lowest and highest YTM (in percent) considered. Default is (-90.0, 1000.0).
+
+    Returns:
+    - YtmSolution: Named tuple (ytm, converged, iterations). ytm is in percent like the YTM columns, and NaN for every
+                   bond that did not converge within max_iter iterations, including a price outside the prices of the
+                   bracket (which is not iterated at all); converged flags the bonds within tol; iterations is the
+                   number of iterations each bond needed. Floats when all inputs are scalars, arrays otherwise.
+    """
+
+    scalar_input = all(np.ndim(v) == 0 for v in (price, face_value, years_to_maturity, coupon_rate, periods_per_year))
+
+    price, face_value, years_to_maturity, coupon_rate, periods_per_year = _as_arrays(
+        price, face_value, years_to_maturity, coupon_rate, periods_per_year)
+    inputs = (face_value, years_to_maturity, coupon_rate, periods_per_year)
+
+    low = np.full(len(price), float(bracket[0]))
+    high = np.full(len(price), float(bracket[1]))
+
+    # start from the usual approximation: (annual coupon + pull to par per year) / average of price and face value
+    annual_coupon = face_value * coupon_rate / 100
+    ytm = (annual_coupon + (face_value - price) / np.maximum(years_to_maturity, 1)) / ((face_value + price) / 2) * 100
+    ytm = np.clip(np.nan_to_num(ytm), low, high)
+
+    converged = np.zeros(len(price), dtype=bool)
+    iterations = np.zeros(len(price), dtype=int)
+
+    # prices outside [price(high), price(low)] have no solution in the bracket
+    lowest_price = _bond_risk(face_value, years_to_maturity, high, coupon_rate, periods_per_year)[0]
+    highest_price = _bond_risk(face_value, years_to_maturity, low, coupon_rate, periods_per_year)[0]
+    active = np.flatnonzero((price >= lowest_price - tol) & (price <= highest_price + tol))
+
+    for _ in range(max_iter):
+        if not len(active):
+            break
+
+        face, years, coupon, periods = (values[active] for values in inputs)
+        model_price, _, _, _, dv01 = _bond_risk(face, years, ytm[active], coupon, periods)
+        error = model_price - price[active]
+        iterations[active] += 1
+
+        done = np.abs(error) <= tol
+        converged[active[done]] = True
+
+        # a price above the target means the yield is too low, and vice versa
+        low[active] = np.where(error > 0, ytm[active], low[active])
+        high[active] = np.where(error < 0, ytm[active], high[active])
+
+        # Newton step with dP/dYTM = 100 * DV01, bisection when the step leaves the bracket
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = ytm[active] - error / (100 * dv01)
+        inside = (step > low[active]) & (step < high[active])
+        step = np.where(inside, step, (low[active] + high[active]) / 2)
+
+        ytm[active] = np.where(done, ytm[active], step)
+        active = active[~done]
+
+    ytm = np.where(converged, ytm, np.nan)
+
+    if scalar_input:
+        return YtmSolution(float(ytm[0]), bool(converged[0]), int(iterations[0]))
+    return YtmSolution(ytm, converged, iterations)
+
+# ==============================================================================================================
+# 9. compute_sensitivities()
+# ==============================================================================================================
+
+Sensitivities = namedtuple('Sensitivities', ['dv01_bid', 'dv01_ask', 'key_rate_dv01', 'key_rate_durations', 'key_rates'])
+
+
+def _key_rate_weights(times, key_rates):
+    """
+    Share of a yield move at each cash flow time that comes from each key rate: a triangle that is 1 at its key rate
+    and falls to 0 at the neighbouring ones, flat before the first and after the last. The shares add up to 1.
+
+    Returns:
+    - ndarray: Weights of shape times.shape + (number of key rates,).
+    """
+    key_rates = np.asarray(key_rates, dtype=float)
+    return np.stack([np.interp(times, key_rates, unit) for unit in np.eye(len(key_rates))], axis=-1)
+
+
+@lru_cache(maxsize=64)
+def _cached_key_rate_weights(n_periods, periods_per_year, key_rates):
+    """(periods x key rates) weights of the periods 1..n_periods, shared by every batch with the same grid."""
+    weights = _key_rate_weights(np.arange(1, n_periods + 1) / periods_per_year, key_rates)
+    weights.flags.writeable = False
+    return weights
+
+
+def _key_rate_risk(face_value, years_to_maturity, ytm, coupon_rate, periods_per_year, key_rates):
+    """
+    Price and key rate DV01s of each bond from one cash flow and one discount matrix, on the schedule of _bond_risk().
     """
 
-    # Calculate the initial bond price
-    initial_price = calculate_bond_price(face_value, years_to_maturity, ytm, ytm, coupon_rate=coupon_rate)
+    periods, _, pricing_periods = _period_grid(years_to_maturity, periods_per_year)
+    rows = np.arange(len(ytm))
+
+    base = 1 + (ytm / (100 * periods_per_year))
+    coupon_payment = np.where(coupon_rate != 0, (face_value * coupon_rate / 100) / periods_per_year, 0)
+
+    # cash flows per period: the coupons up to the pricing horizon and the face value at its end
+    cash_flows = np.where(periods <= pricing_periods[:, np.newaxis], coupon_payment[:, np.newaxis], 0)
+    cash_flows[rows, pricing_periods - 1] += face_value
+    cash_flow_pv = cash_flows * _discount_matrix(1 / base, periods.shape[1])[:, 1:]
+
+    # dP/dy of every cash flow, split over the key rates by the time it is paid
+    period_sensitivity = periods * cash_flow_pv
+    if np.all(periods_per_year == periods_per_year[0]):
+        sensitivity = period_sensitivity @ _cached_key_rate_weights(periods.shape[1], float(periods_per_year[0]), key_rates)
+    else:
+        weights = _key_rate_weights(periods / periods_per_year[:, np.newaxis], key_rates)
+        sensitivity = np.einsum('bp,bpk->bk', period_sensitivity, weights)
+
+    key_rate_dv01 = -sensitivity / (base * 100 * periods_per_year * 100)[:, np.newaxis]
+    return cash_flow_pv.sum(axis=1), key_rate_dv01
+
+
+def compute_sensitivities(face_value, years_to_maturity, ytm_bid, ytm_ask, coupon_rate=None, periods_per_year=2, key_rates=KEY_RATES):
+    """
+    Calculate bid and ask DV01s and the key rate durations of one or many bonds in one batched pass.
+
+    A key rate move shifts the yield of every cash flow by a triangular weight around the key rate's tenor (see
+    _key_rate_weights()), so the key rate DV01s of a bond add up to its DV01 and its key rate durations to its
+    analytic modified duration. The bid and ask sides are computed together in one batch, and the key rate weights of
+    the period grid are cached, so repricing a universe reuses them. With ytm_bid=None only the ask side is computed.
+
+    Parameters:
+    - face_value (float or array-like): The face value of the bond(s).
+    - years_to_maturity (float or array-like): The number of years until the bond(s) mature.
+    - ytm_bid (float or array-like): The Yield to Maturity (YTM) for selling the bond(s), or None for the ask side only.
+    - ytm_ask (float or array-like): The Yield to Maturity (YTM) for buying the bond(s).
+    - coupon_rate (float or array-like, optional): The annual coupon rate. Default is None for zero coupon bonds.
+    - periods_per_year (int or array-like, optional): Number of compounding periods per year. Default is 2 for semi-annual compounding.
+    - key_rates (tuple, optional): Key rate tenors in years, increasing. Default is KEY_RATES (1, 2, 5, 10 and 30 years).
+
+    Returns:
+    - Sensitivities: Named tuple (dv01_bid, dv01_ask, key_rate_dv01, key_rate_durations, key_rates). The DV01s are
+                     per bond (price change for a 1bp increase in yield), dv01_bid is None without ytm_bid;
+                     key_rate_dv01 and key_rate_durations are (bonds x key rates) arrays on the ask (buying) side, the
+                     durations in years.
+    """
 
-    # Calculate the bond price after a 1 basis point increase in yield
-    new_ytm = ytm + (basis_point_change / 100)
-    new_price = calculate_bond_price(face_value, years_to_maturity, ytm, new_ytm, coupon_rate=coupon_rate, periods_per_year=periods_per_year)
+    sides = [ytm_ask] if ytm_bid is None else [ytm_bid, ytm_ask]
+    face_value, years_to_maturity, coupon_rate, periods_per_year, *yields = _as_arrays(
+        face_value, years_to_maturity, coupon_rate, periods_per_year, *sides)
+    key_rates = tuple(float(key_rate) for key_rate in key_rates)
+    n_bonds = len(face_value)
 
-    # Calculate the change in bond price
-    price_change = new_price - initial_price
+    # both sides in one batch: the bid yields first, then the ask yields
+    stacked = [np.concatenate([values] * len(yields)) for values in (face_value, years_to_maturity, coupon_rate, periods_per_year)]
+    price, key_rate_dv01 = _key_rate_risk(stacked[0], stacked[1], np.concatenate(yields), stacked[2], stacked[3], key_rates)
 
-    # Calculate DV01
-    dv01 = price_change / basis_point_change
+    dv01 = key_rate_dv01.sum(axis=1)
+    ask_key_rate_dv01 = key_rate_dv01[-n_bonds:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        key_rate_durations = -ask_key_rate_dv01 * 10000 / price[-n_bonds:, np.newaxis]
 
-    return dv01
\ No newline at end of file
+    dv01_bid = None if ytm_bid is None else dv01[:n_bonds]
+    return Sensitivities(dv01_bid, dv01[-n_bonds:], ask_key_rate_dv01, key_rate_durations, key_rates)
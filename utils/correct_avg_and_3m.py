@@ -11,14 +11,14 @@ def correct_avg_and_3m(df):
     Returns:
     df (pandas.DataFrame): The corrected dataframe.
     """
-    
-    # to iterate over the rows
-    for i, row in df.iterrows():
-        # if everything is correct, continue
-        if row['Low'] <= row['Avg'] <= row['High']:
-            continue
-        # if values are incorrect
-        elif row['Low'] <= row['3M +/-'] <= row['High']:
-            df.loc[i, 'Avg'], df.loc[i, '3M +/-'] = row['3M +/-'], row['Avg']
-    
-    return df
\ No newline at end of file
+
+    # rows where everything is correct
+    avg_in_range = (df['Low'] <= df['Avg']) & (df['Avg'] <= df['High'])
+
+    # rows where the values are incorrect, but swapping them fixes it
+    swap = ~avg_in_range & (df['Low'] <= df['3M +/-']) & (df['3M +/-'] <= df['High'])
+
+    # swap both columns for all of these rows at once
+    df.loc[swap, ['Avg', '3M +/-']] = df.loc[swap, ['3M +/-', 'Avg']].to_numpy()
+
+    return df
@@ -0,0 +1,214 @@
+# credit_risk.py
+# |--- default_probabilities()
+# |--- simulate_credit_losses()
+
+import warnings
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtri
+
+# Loss given default, as in portfolio_selection.ipynb
+LOSS_SEVERITY = 0.6
+
+# CDS tenors (in years) of the merged CDS data and their spread columns (in bp)
+CDS_TENORS = {2: 'Spread_2y', 5: 'Spread_5y', 10: 'Spread_10y'}
+
+# Paths simulated per chunk; bounds the (paths x positions) arrays of a chunk to a few tens of MB
+PATHS_PER_CHUNK = 10_000
+
+CreditLossResult = namedtuple('CreditLossResult', ['losses', 'summary', 'contributions'])
+
+# ==============================================================================================================
+# 1. default_probabilities()
+# ==============================================================================================================
+
+def default_probabilities(portfolio_df, horizon=1, loss_severity=LOSS_SEVERITY, maturity_col='Years to Maturity'):
+    """
+    Probability that each bond defaults within the horizon (or before it matures, if that is earlier), from the CDS
+    term structure of its country.
+
+    The average hazard rate up to each CDS tenor is spread / loss_severity (the credit triangle, as for PD_5y_pct),
+    so the cumulative hazard is known at 2, 5 and 10 years. It is interpolated linearly in between (a constant
+    forward hazard per segment) and extended beyond 10 years with the last segment's hazard. A missing tenor takes the
+    average hazard of the nearest quoted tenor; bonds without any CDS quote are treated as default-free.
+
+    Parameters:
+    - portfolio_df (DataFrame): Bonds with the CDS_TENORS spread columns and maturity_col.
+    - horizon (float, optional): The loss horizon in years. Default is 1.
+    - loss_severity (float, optional): Loss given default. Default is 0.6.
+    - maturity_col (str, optional): Column name for years to maturity. Default is 'Years to Maturity'.
+
+    Returns:
+    - ndarray: The default probability of each bond.
+    """
+
+    tenors = np.array([0] + list(CDS_TENORS), dtype=float)
+    average_hazard = (portfolio_df[list(CDS_TENORS.values())].apply(pd.to_numeric, errors='coerce')
+                      / 10000 / loss_severity)
+    average_hazard = average_hazard.ffill(axis=1).bfill(axis=1).fillna(0).to_numpy()
+
+    # cumulative hazard at 0, 2, 5 and 10 years, never decreasing
+    cumulative_hazard = np.maximum.accumulate(np.column_stack([np.zeros(len(average_hazard)), average_hazard * tenors[1:]]), axis=1)
+
+    # horizon of each bond, and the segment of the tenor grid it falls in
+    t = np.minimum(float(horizon), portfolio_df[maturity_col].to_numpy(dtype=float))
+    upper = np.clip(np.searchsorted(tenors, t, side='right'), 1, len(tenors) - 1)
+    lower = upper - 1
+    rows = np.arange(len(t))
+    forward_hazard = (cumulative_hazard[rows, upper] - cumulative_hazard[rows, lower]) / (tenors[upper] - tenors[lower])
+    hazard = cumulative_hazard[rows, lower] + forward_hazard * (t - tenors[lower])
+
+    return -np.expm1(-np.maximum(hazard, 0))
+
+# ==============================================================================================================
+# 2. simulate_credit_losses()
+# ==============================================================================================================
+
+def _simulate_chunk(task):
+    """
+    Worker: simulate one chunk of paths from its own seed. Returns the portfolio loss of every path and, when a tail
+    threshold is given, the sums of each issuer's losses over the paths with a portfolio loss above it and over the
+    paths with a portfolio loss equal to it.
+    """
+
+    seed, n_paths, model, tail_threshold = task
+    country_of_issuer, issuer_of_position, thresholds, losses_given_default, n_issuers, asset_correlation, global_correlation = model
+    rng = np.random.default_rng(seed)
+
+    # latent variables: global factor -> country factors -> issuers
+    n_countries = country_of_issuer.max(initial=-1) + 1
+    global_factor = rng.standard_normal((n_paths, 1))
+    country_factors = np.sqrt(global_correlation) * global_factor + np.sqrt(1 - global_correlation) * rng.standard_normal((n_paths, n_countries))
+    issuer_latent = (np.sqrt(asset_correlation) * country_factors[:, country_of_issuer]
+                     + np.sqrt(1 - asset_correlation) * rng.standard_normal((n_paths, n_issuers)))
+
+    # the positions of an issuer share its latent variable; a position defaults when it falls below its threshold
+    defaults = issuer_latent[:, issuer_of_position] < thresholds
+    losses = defaults @ losses_given_default
+
+    if tail_threshold is None:
+        return losses, None
+
+    issuer_tail_losses = np.zeros((2, n_issuers))
+    for row, tail in enumerate([losses > tail_threshold, losses == tail_threshold]):
+        np.add.at(issuer_tail_losses[row], issuer_of_position, defaults[tail].sum(axis=0) * losses_given_default)
+    return losses, issuer_tail_losses
+
+
+def _tail(losses, level):
+    """
+    VaR at the confidence level and the weights of the paths in the tail beyond it: 1 for the paths with a loss above
+    VaR and a fraction for those with a loss equal to VaR, so the weights add up to n_paths * (1 - level) (Acerbi and
+    Tasche). Credit losses take few distinct values, so many paths can tie at VaR, and averaging all the paths at or
+    above VaR would bias the expected shortfall towards VaR.
+
+    Returns:
+    - tuple: (VaR, weight of the paths equal to VaR, total weight of the tail)
+    """
+
+    var = np.quantile(losses, level, method='inverted_cdf')
+    tail_size = len(losses) * (1 - level)
+    n_beyond, n_at = (losses > var).sum(), (losses == var).sum()
+
+    return var, (tail_size - n_beyond) / n_at, tail_size
+
+
+def simulate_credit_losses(portfolio_df, n_paths=1_000_000, horizon=1, loss_severity=LOSS_SEVERITY,
+                           asset_correlation=0.3, global_correlation=0.1, confidence_levels=(0.95, 0.99, 0.999),
+                           exposure_col='Amount per Bond', seed=0, workers=1, paths_per_chunk=PATHS_PER_CHUNK):
+    """
+    Simulate the credit loss distribution of a bond portfolio with a one-factor Gaussian copula by country.
+
+    Every issuer has a latent variable sqrt(asset_correlation) * Z_country + sqrt(1 - asset_correlation) * e_issuer, and the
+    country factors are correlated through a global factor with global_correlation. A bond defaults when its issuer's latent
+    variable is below the normal quantile of its default probability (see default_probabilities()), losing
+    exposure * loss_severity.
+
+    The paths are simulated in chunks of paths_per_chunk, each from its own child seed of seed, so memory stays bounded,
+    the result is reproducible and does not depend on the number of workers. Per-issuer contributions to the expected
+    shortfall at the highest confidence level are collected in a second pass that replays the same chunks.
+
+    Bonds without an issuer, a country or a default probability raise a ValueError that names them; bonds without any
+    CDS quote are simulated as default-free, with a warning that names them.
+
+    Parameters:
+    - portfolio_df (DataFrame): The portfolio (e.g. portfolio.xlsx) with 'Issuer', 'Country', exposure_col, 'Years to Maturity'
+                                and the CDS_TENORS spread columns.
+    - n_paths (int, optional): Number of simulated paths. Default is 1,000,000.
+    - horizon (float, optional): The loss horizon in years. Default is 1.
+    - loss_severity (float, optional): Loss given default. Default is 0.6.
+    - asset_correlation (float, optional): Correlation of issuers of the same country. Default is 0.3.
+    - global_correlation (float, optional): Correlation of the country factors. Default is 0.1.
+    - confidence_levels (tuple, optional): Confidence levels for VaR and ES. Default is (0.95, 0.99, 0.999).
+    - exposure_col (str, optional): Column name for the amount invested in each bond. Default is 'Amount per Bond'.
+    - seed (int, optional): Seed of the simulation. Default is 0.
+    - workers (int, optional): Number of worker processes. Default is 1, i.e. run in the current process.
+    - paths_per_chunk (int, optional): Number of paths per chunk. Default is PATHS_PER_CHUNK.
+
+    Returns:
+    - CreditLossResult: Named tuple (losses, summary, contributions): the loss of every path; a DataFrame with 'Metric' and
+                        'Value' columns (expected loss, VaR and ES per confidence level); and a DataFrame per issuer with
+                        'Country', 'Exposure', 'Expected Loss' and the 'ES Contribution' at the highest confidence level.
+    """
+
+    probability = default_probabilities(portfolio_df, horizon=horizon, loss_severity=loss_severity)
+
+    # every bond needs an issuer and a country for its factors, and a default probability (i.e. a maturity)
+    incomplete = portfolio_df['Issuer'].isna() | portfolio_df['Country'].isna() | ~np.isfinite(probability)
+    if incomplete.any():
+        raise ValueError(f"bonds without an issuer, a country or a default probability: {portfolio_df.index[incomplete].tolist()}")
+    no_cds = portfolio_df[list(CDS_TENORS.values())].apply(pd.to_numeric, errors='coerce').isna().all(axis=1)
+    if no_cds.any():
+        warnings.warn(f"bonds without a CDS quote are treated as default-free: {portfolio_df.index[no_cds].tolist()}")
+
+    issuer_codes, issuers = pd.factorize(portfolio_df['Issuer'])
+    issuer_country = portfolio_df.groupby(issuer_codes)['Country'].first()
+    country_of_issuer = pd.factorize(issuer_country)[0]
+
+    exposure = portfolio_df[exposure_col].to_numpy(dtype=float)
+
+    # bonds of the same issuer with the same default probability default together, so simulate them as one position
+    position_codes, positions = pd.factorize(pd.MultiIndex.from_arrays([issuer_codes, probability]))
+    position_issuer = positions.get_level_values(0).to_numpy()
+    position_thresholds = ndtri(positions.get_level_values(1).to_numpy())
+    position_losses = np.bincount(position_codes, weights=exposure * loss_severity, minlength=len(positions))
+
+    model = (country_of_issuer, position_issuer, position_thresholds, position_losses,
+             len(issuers), asset_correlation, global_correlation)
+
+    chunk_sizes = [min(paths_per_chunk, n_paths - start) for start in range(0, n_paths, paths_per_chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+    def run(tail_threshold):
+        tasks = [(chunk_seed, size, model, tail_threshold) for chunk_seed, size in zip(seeds, chunk_sizes)]
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(_simulate_chunk, tasks))
+        return [_simulate_chunk(task) for task in tasks]
+
+    losses = np.concatenate([chunk_losses for chunk_losses, _ in run(None)])
+
+    metrics, values = ['Expected Loss'], [losses.mean()]
+    for level in confidence_levels:
+        var, tie_weight, tail_size = _tail(losses, level)
+        metrics += [f'VaR {level:.1%}', f'ES {level:.1%}']
+        values += [var, (losses[losses > var].sum() + tie_weight * var * (losses == var).sum()) / tail_size]
+    summary = pd.DataFrame({'Metric': metrics, 'Value': values})
+
+    # replay the chunks to attribute the tail losses of the highest confidence level to the issuers, with the same
+    # weights as the expected shortfall so the contributions add up to it
+    tail_var, tie_weight, tail_size = _tail(losses, max(confidence_levels))
+    beyond, at = sum(chunk_tail for _, chunk_tail in run(tail_var))
+
+    contributions = pd.DataFrame({
+        'Issuer': issuers,
+        'Country': issuer_country.to_numpy(),
+        'Exposure': np.bincount(issuer_codes, weights=exposure, minlength=len(issuers)),
+        'Expected Loss': np.bincount(issuer_codes, weights=probability * exposure * loss_severity, minlength=len(issuers)),
+        'ES Contribution': (beyond + tie_weight * at) / tail_size,
+    }).sort_values('ES Contribution', ascending=False, ignore_index=True)
+
+    return CreditLossResult(losses, summary, contributions)
@@ -0,0 +1,303 @@
+# curves.py
+# |--- nss_basis()
+# |--- YieldCurve
+# |    |--- fit()
+# |    |--- zero_rate()
+# |    |--- discount_factor()
+# |    |--- forward_rate()
+# |    |--- price()
+# |--- fit_country_curve()
+# |--- get_curve()
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from utils.bond_math import _as_arrays, _period_grid
+from utils.schema import AS_OF_DATE
+from utils.storage import read_table, table_path
+
+# Number of fitted curves kept by get_curve()
+CURVE_CACHE_SIZE = 128
+
+# Decay parameters (in years) tried when fitting Nelson-Siegel-Svensson; the betas are linear for fixed decays
+NSS_TAU_GRID = np.geomspace(0.25, 30, 24)
+
+# A Nelson-Siegel-Svensson fit is only kept if its yields at NSS_BAND_POINTS tenors over the fitted range stay within
+# the range of the fitted yields widened by NSS_BAND times its width (at least NSS_BAND_MIN percentage points) on
+# each side; with nearly collinear factors the least squares betas can otherwise offset each other and bend the curve
+# to absurd rates between the bonds
+NSS_BAND = 0.5
+NSS_BAND_MIN = 1.0
+NSS_BAND_POINTS = 200
+
+# ==============================================================================================================
+# 1. nss_basis()
+# ==============================================================================================================
+
+def nss_basis(tenors, tau1, tau2):
+    """
+    Nelson-Siegel-Svensson factor loadings of the given tenors: level, slope, first and second curvature.
+
+    Parameters:
+    - tenors (array-like): Tenors in years.
+    - tau1 (float): Decay of the slope and first curvature factors, in years.
+    - tau2 (float): Decay of the second curvature factor, in years.
+
+    Returns:
+    - ndarray: The loadings, shape (len(tenors), 4). The yield is loadings @ [beta0, beta1, beta2, beta3].
+    """
+
+    # the loadings tend to 1, 1, 0, 0 at tenor 0; keep the tenors away from 0 to avoid 0 / 0
+    tenors = np.maximum(np.asarray(tenors, dtype=float), 1e-6)
+
+    x1, x2 = tenors / tau1, tenors / tau2
+    slope1 = -np.expm1(-x1) / x1
+    slope2 = -np.expm1(-x2) / x2
+
+    return np.column_stack([np.ones_like(tenors), slope1, slope1 - np.exp(-x1), slope2 - np.exp(-x2)])
+
+# ==============================================================================================================
+# 2. YieldCurve
+# ==============================================================================================================
+
+class YieldCurve:
+    """
+    A fitted yield curve: yields in percent as a function of the tenor in years, with the compounding of
+    bond_math (periods_per_year times per year), so that curve.price() and calculate_bond_price() agree for a
+    flat curve at the bond's YTM.
+
+    The curve is fitted to the YTMs of a group of bonds (e.g. one country) with one of two methods:
+    - 'nss': Nelson-Siegel-Svensson, by least squares over a grid of decays (see NSS_TAU_GRID), keeping only curves
+      that stay near the fitted yields (see NSS_BAND). If no decays give such a curve, the spline is fitted instead.
+    - 'spline': cubic interpolating spline through the mean yield per rounded tenor, as plotted in yield_curve.py.
+      It is held flat outside the fitted tenors.
+
+    The fitted parameters are kept on the object (params for 'nss', spline for 'spline'); every evaluation is
+    vectorized over arbitrary arrays of tenors.
+
+    Parameters:
+    - method (str): 'nss' or 'spline'.
+    - params (ndarray, optional): [beta0, beta1, beta2, beta3, tau1, tau2] for 'nss'.
+    - spline (BSpline, optional): The fitted spline for 'spline'.
+    - tenor_range (tuple): Lowest and highest tenor of the bonds the curve was fitted to.
+    - periods_per_year (int, optional): Compounding periods per year. Default is 2.
+    - label (str, optional): What the curve was fitted to, e.g. 'United States'.
+    """
+
+    METHODS = ('nss', 'spline')
+
+    def __init__(self, method, tenor_range, params=None, spline=None, periods_per_year=2, label=None):
+        if method not in self.METHODS:
+            raise ValueError(f"method must be one of {self.METHODS}, got {method!r}")
+        self.method = method
+        self.tenor_range = tuple(tenor_range)
+        self.params = params
+        self.spline = spline
+        self.periods_per_year = periods_per_year
+        self.label = label
+
+    def __repr__(self):
+        return f"YieldCurve(method={self.method!r}, label={self.label!r}, tenor_range={self.tenor_range})"
+
+    @classmethod
+    def fit(cls, tenors, yields, method='nss', periods_per_year=2, label=None):
+        """
+        Fit a curve to the yields of a group of bonds. An 'nss' fit without a curve within NSS_BAND of the yields
+        returns a 'spline' curve.
+
+        Parameters:
+        - tenors (array-like): Years to maturity of the bonds (unrounded).
+        - yields (array-like): Their YTMs in percent. Bonds with a missing tenor or yield are ignored.
+        - method (str, optional): 'nss' or 'spline'. Default is 'nss'.
+        - periods_per_year (int, optional): Compounding periods per year. Default is 2.
+        - label (str, optional): What the curve is fitted to, e.g. 'United States'.
+
+        Returns:
+        - YieldCurve: The fitted curve.
+        """
+
+        tenors = np.asarray(tenors, dtype=float)
+        yields = np.asarray(yields, dtype=float)
+        valid = np.isfinite(tenors) & np.isfinite(yields) & (tenors > 0)
+        tenors, yields = tenors[valid], yields[valid]
+        if not len(tenors):
+            raise ValueError(f"no bonds to fit the curve{' of ' + label if label else ''} to")
+
+        tenor_range = (float(tenors.min()), float(tenors.max()))
+
+        if method == 'nss':
+            params = _fit_nss(tenors, yields)
+            if params is not None:
+                return cls(method, tenor_range, params=params, periods_per_year=periods_per_year, label=label)
+            method = 'spline'
+
+        if method == 'spline':
+            # scipy is only imported for a spline fit, so importing the curves does not pay for it
+            from scipy.interpolate import make_interp_spline
+
+            # mean yield per rounded tenor, then a spline of the highest degree (up to cubic) the points allow
+            means = pd.Series(yields).groupby(np.round(tenors)).mean().sort_index()
+            spline = make_interp_spline(means.index.to_numpy(), means.to_numpy(), k=min(3, len(means) - 1))
+            tenor_range = (float(means.index.min()), float(means.index.max()))
+            return cls(method, tenor_range, spline=spline, periods_per_year=periods_per_year, label=label)
+
+        raise ValueError(f"method must be one of {cls.METHODS}, got {method!r}")
+
+    def zero_rate(self, tenors):
+        """
+        Yield of the curve at the given tenors, in percent.
+
+        Parameters:
+        - tenors (float or array-like): Tenors in years.
+
+        Returns:
+        - ndarray: The yields, same shape as tenors.
+        """
+
+        tenors = np.asarray(tenors, dtype=float)
+
+        if self.method == 'nss':
+            beta, (tau1, tau2) = self.params[:4], self.params[4:]
+            return (nss_basis(tenors.ravel(), tau1, tau2) @ beta).reshape(tenors.shape)
+
+        return self.spline(np.clip(tenors, *self.tenor_range))
+
+    def discount_factor(self, tenors):
+        """
+        Discount factors of the curve at the given tenors, (1 + y / (100 * m)) ** -(m * t).
+
+        Parameters:
+        - tenors (float or array-like): Tenors in years.
+
+        Returns:
+        - ndarray: The discount factors, same shape as tenors.
+        """
+
+        tenors = np.asarray(tenors, dtype=float)
+        m = self.periods_per_year
+        return np.exp(-m * tenors * np.log1p(self.zero_rate(tenors) / (100 * m)))
+
+    def forward_rate(self, start, end):
+        """
+        Forward yields between two sets of tenors, in percent with the curve's compounding.
+
+        Parameters:
+        - start (float or array-like): Start tenors in years.
+        - end (float or array-like): End tenors in years, greater than start.
+
+        Returns:
+        - ndarray: The forward yields, broadcast shape of start and end.
+        """
+
+        start, end = np.broadcast_arrays(np.asarray(start, dtype=float), np.asarray(end, dtype=float))
+        m = self.periods_per_year
+        growth = np.log(self.discount_factor(start) / self.discount_factor(end))
+        return np.expm1(growth / (m * (end - start))) * 100 * m
+
+    def price(self, face_value, years_to_maturity, coupon_rate=None):
+        """
+        Price bonds by discounting every cash flow at the curve, on the coupon schedule of bond_math.
+
+        Parameters:
+        - face_value (float or array-like): The face value of the bond(s).
+        - years_to_maturity (float or array-like): The number of years until the bond(s) mature.
+        - coupon_rate (float or array-like, optional): The annual coupon rate. Default is None for zero coupon bonds.
+
+        Returns:
+        - ndarray: The prices.
+        """
+
+        face_value, years_to_maturity, coupon_rate = _as_arrays(face_value, years_to_maturity, coupon_rate)
+        m = self.periods_per_year
+        periods, _, pricing_periods = _period_grid(years_to_maturity, m)
+
+        discount_factors = self.discount_factor(periods / m)[0]
+        coupon_payment = (face_value * coupon_rate / 100) / m
+
+        paid = periods <= pricing_periods[:, np.newaxis]
+        coupons = (coupon_payment[:, np.newaxis] * np.where(paid, discount_factors, 0)).sum(axis=1)
+
+        return coupons + face_value * discount_factors[pricing_periods - 1]
+
+
+def _fit_nss(tenors, yields):
+    """
+    Least squares Nelson-Siegel-Svensson fit: the betas are solved exactly for every pair of decays in
+    NSS_TAU_GRID (tau1 < tau2) and, of the pairs whose curve stays within NSS_BAND of the yields, the one with the
+    smallest squared error is kept. None if no pair does.
+    """
+
+    width = yields.max() - yields.min()
+    padding = max(NSS_BAND * width, NSS_BAND_MIN)
+    low, high = yields.min() - padding, yields.max() + padding
+    grid = np.linspace(tenors.min(), tenors.max(), NSS_BAND_POINTS)
+
+    best_params, best_error = None, np.inf
+    for i, tau1 in enumerate(NSS_TAU_GRID):
+        for tau2 in NSS_TAU_GRID[i + 1:]:
+            basis = nss_basis(tenors, tau1, tau2)
+            beta = np.linalg.lstsq(basis, yields, rcond=None)[0]
+            error = np.sum((basis @ beta - yields) ** 2)
+            if error >= best_error:
+                continue
+
+            curve = nss_basis(grid, tau1, tau2) @ beta
+            if curve.min() >= low and curve.max() <= high:
+                best_params, best_error = np.append(beta, [tau1, tau2]), error
+
+    return best_params
+
+# ==============================================================================================================
+# 3. fit_country_curve()
+# ==============================================================================================================
+
+def fit_country_curve(data, country, as_of=AS_OF_DATE, method='nss', ytm_col='YTM - Ask'):
+    """
+    Fit the yield curve of one country from bonds data.
+
+    Parameters:
+    - data (DataFrame): Bonds data with 'Country', 'Maturity' and ytm_col columns (e.g. processed_data/bonds-data.parquet).
+    - country (str): The country to fit the curve of.
+    - as_of (str, optional): The pricing date the tenors are measured from. Default is AS_OF_DATE.
+    - method (str, optional): 'nss' or 'spline'. Default is 'nss'.
+    - ytm_col (str, optional): The yield column to fit, 'YTM - Ask' or 'YTM - Bid'. Default is 'YTM - Ask'.
+
+    Returns:
+    - YieldCurve: The fitted curve.
+    """
+
+    bonds = data[data['Country'] == country]
+    tenors = (pd.to_datetime(bonds['Maturity']) - pd.to_datetime(as_of)).dt.days / 365
+
+    return YieldCurve.fit(tenors, pd.to_numeric(bonds[ytm_col], errors='coerce'), method=method, label=country)
+
+# ==============================================================================================================
+# 4. get_curve()
+# ==============================================================================================================
+
+def get_curve(country, as_of=AS_OF_DATE, method='nss', ytm_col='YTM - Ask'):
+    """
+    Return the fitted yield curve of a country from processed_data/bonds-data.parquet.
+
+    Curves are memoized per (country, as-of date, method, yield column) with LRU eviction (CURVE_CACHE_SIZE curves),
+    so pricing and rich/cheap analysis can share them without refitting. The memo is keyed on the modification time
+    of the table as well, so a rewritten bonds-data table is refitted.
+
+    Parameters:
+    - country (str): The country to fit the curve of.
+    - as_of (str, optional): The pricing date the tenors are measured from. Default is AS_OF_DATE.
+    - method (str, optional): 'nss' or 'spline'. Default is 'nss'.
+    - ytm_col (str, optional): The yield column to fit, 'YTM - Ask' or 'YTM - Bid'. Default is 'YTM - Ask'.
+
+    Returns:
+    - YieldCurve: The fitted curve.
+    """
+
+    return _cached_curve(country, str(pd.Timestamp(as_of).date()), method, ytm_col, table_path("bonds-data").stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=CURVE_CACHE_SIZE)
+def _cached_curve(country, as_of, method, ytm_col, table_version):
+    data = read_table("bonds-data", columns=['Country', 'Maturity', ytm_col], filters=[('Country', '==', country)])
+    return fit_country_curve(data, country, as_of=as_of, method=method, ytm_col=ytm_col)
@@ -1,10 +1,166 @@
-import pycountry
+import re
+import unicodedata
 import pandas as pd
 
+
+# adjective endings accepted on the last word of a country name, e.g. "Brazilian", "Peruvian", "Congolese"
+DEMONYM_SUFFIXES = ('n', 'an', 'ian', 'vian', 'ese', 'lese', 'i')
+
+# issuers whose country is not a whole word of their name, e.g. the French public investment bank; the manual
+# pairings take precedence over them
+ISSUER_OVERRIDES = {'Bpifrance SACA': 'France'}
+
+
+def _tokenize(name):
+    """
+    Split a name into lowercase, accent-free word tokens, e.g. "Côte d'Ivoire" -> ('cote', 'd', 'ivoire').
+    """
+
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    return tuple(re.findall(r'[a-z0-9]+', name.lower()))
+
+
+class CountryResolver:
+    """
+    Resolve issuer names to country names with a precomputed word index.
+
+    The index holds the name, official name and common name of every country in pycountry (plus optional extra
+    aliases), keyed by the first word. An issuer name is matched on whole words, where the last word may also be
+    the adjective form (e.g. "Brazilian"). The leftmost match wins and, among the matches starting at the same
+    word, the longest one. So "Nigeria" is never read as "Niger", "Romania" as "Oman" or "Papua New Guinea" as
+    "Guinea". Exact issuer overrides take precedence over the index, and every issuer name is resolved only once.
+
+    Parameters:
+    - overrides (dict, optional): Issuer name -> country name (or None) pairs that bypass the index.
+    - aliases (dict, optional): Extra alias -> country name pairs. An alias replaces a pycountry name with the
+                                same words, e.g. {'Turkey': 'Turkey'}.
+    """
+
+    def __init__(self, overrides=None, aliases=None):
+        self.overrides = dict(overrides or {})
+        self._index = {}
+        self._cache = {}
+
+        # pycountry loads its country database on import, so it is only imported when an index is built
+        import pycountry
+
+        for country in pycountry.countries:
+            # report the everyday name where pycountry has one, e.g. 'South Korea' for 'Korea, Republic of'
+            label = getattr(country, 'common_name', None) or country.name
+            for attr in ('name', 'official_name', 'common_name'):
+                alias = getattr(country, attr, None)
+                if alias:
+                    self._add_alias(alias, label)
+
+        for alias, country_name in (aliases or {}).items():
+            self._add_alias(alias, country_name)
+
+    @classmethod
+    def from_pairings(cls, path):
+        """
+        Build a resolver that folds in the manual issuer -> country pairings
+        (e.g. original_data/missing_issuers_country_pairings.xlsx).
+
+        The pairings are used as exact issuer overrides on top of ISSUER_OVERRIDES, and their country names as aliases,
+        so that new issuers of the same countries get the same spelling (e.g. 'Turkey', 'South Korea') as the CDS data.
+
+        Parameters:
+        - path (str or Path): Excel file with 'Issuer Name' and 'Country' columns.
+
+        Returns:
+        - CountryResolver: The resolver.
+        """
+
+        pairings = pd.read_excel(path, index_col=0)
+        countries = pairings['Country'].where(pairings['Country'].notna(), None)
+
+        overrides = {**ISSUER_OVERRIDES, **dict(zip(pairings['Issuer Name'], countries))}
+        aliases = {country_name: country_name for country_name in countries.dropna().unique()}
+
+        return cls(overrides=overrides, aliases=aliases)
+
+    def _add_alias(self, alias, country_name):
+        tokens = _tokenize(alias)
+        if not tokens:
+            return
+        candidates = self._index.setdefault(tokens[0], [])
+        # a later alias with the same words replaces the earlier one
+        candidates[:] = [candidate for candidate in candidates if candidate[0] != tokens]
+        candidates.append((tokens, country_name))
+
+    def resolve(self, issuer_name):
+        """
+        Return the country of an issuer, or None if no country name is found in the issuer name.
+
+        Parameters:
+        - issuer_name (str): The name of the issuer.
+
+        Returns:
+        - str: The name of the country, None otherwise.
+        """
+
+        if not isinstance(issuer_name, str):
+            return None
+        if issuer_name in self.overrides:
+            return self.overrides[issuer_name]
+        if issuer_name in self._cache:
+            return self._cache[issuer_name]
+
+        tokens = _tokenize(issuer_name)
+        country = None
+        for position in range(len(tokens)):
+            matches = self._matches_at(tokens, position)
+            if matches:
+                # longest alias (in characters) starting at the leftmost matching word
+                country = max(matches)[1]
+                break
+
+        self._cache[issuer_name] = country
+        return country
+
+    def _matches_at(self, tokens, position):
+        """Return (alias length, country name) for every alias that matches the issuer words at position."""
+
+        # the alias may start with the word itself or, for one-word aliases, with its stem (e.g. "brazil" for "brazilian")
+        first = tokens[position]
+        keys = [first] + [first[:-len(suffix)] for suffix in DEMONYM_SUFFIXES if first.endswith(suffix) and len(first) > len(suffix)]
+
+        matches = []
+        for key in keys:
+            for alias_tokens, country_name in self._index.get(key, ()):
+                end = position + len(alias_tokens)
+                if end > len(tokens) or tokens[position:end - 1] != alias_tokens[:-1]:
+                    continue
+                last, alias_last = tokens[end - 1], alias_tokens[-1]
+                if last == alias_last or (last.startswith(alias_last) and last[len(alias_last):] in DEMONYM_SUFFIXES):
+                    matches.append((len(''.join(alias_tokens)), country_name))
+        return matches
+
+    def resolve_series(self, issuer_names):
+        """
+        Resolve a column of issuer names. Each distinct name is resolved once and the result is broadcast.
+
+        Parameters:
+        - issuer_names (Series): The issuer names.
+
+        Returns:
+        - Series: The country names, aligned with issuer_names (None where no country is found).
+        """
+
+        codes, unique_names = pd.factorize(issuer_names)
+        countries = pd.Series([self.resolve(name) for name in unique_names], dtype=object)
+        resolved = countries.reindex(codes).to_numpy()
+        return pd.Series(resolved, index=issuer_names.index, dtype=object, name='Country')
+
+
+_default_resolver = None
+
+
 def get_country(issuer_name):
     """
     This function takes an issuer name as input and returns the country name if it is found in the issuer name.
-    It uses the pycountry module to get a list of all countries.
+    It uses the pycountry module to get a list of all countries, matched on whole words with the leftmost,
+    longest match winning (see CountryResolver).
 
     Parameters:
     issuer_name (str): The name of the issuer.
@@ -12,17 +168,11 @@ def get_country(issuer_name):
     Returns:
     str: The name of the country if found in the issuer name, None otherwise.
     """
-    
-    # convert the issuer name to lowercase for case insensitive comparison
-    issuer_name = issuer_name.lower()
-    
-    # iterate over all countries provided by the pycountry module
-    for country in pycountry.countries:
-        # convert the country name to lowercase before checking for a match
-        # this ensures that the comparison is case insensitive
-        if country.name.lower() in issuer_name:
-            # if a match is found, return the name of the country
-            return country.name
-    
-    # if no match is found, return None
-    return None
\ No newline at end of file
+
+    global _default_resolver
+
+    # build the index once, on first use
+    if _default_resolver is None:
+        _default_resolver = CountryResolver()
+
+    return _default_resolver.resolve(issuer_name)
@@ -0,0 +1,219 @@
+# history.py
+# |--- bond_keys()
+# |--- QuoteStore
+
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from utils.storage import PROCESSED_DIR
+
+# Root of the history: one directory per table and one partition per snapshot date below it
+HISTORY_DIR = PROCESSED_DIR / "history"
+
+# Columns that identify a row across snapshots, per table. bonds-data has no ISIN column, so a bond is identified by
+# its issuer and terms; a table with an 'ISIN' column is keyed on it instead.
+KEY_COLUMNS = {
+    'bonds-data': ['Issuer', 'Ticker', 'Cpn', 'Maturity', 'Series', 'Currency'],
+    'merged-cds': ['Name_10y'],
+}
+
+# Name of the index of the frames read from the store
+KEY_NAME = 'Bond Key'
+
+# ==============================================================================================================
+# 1. bond_keys()
+# ==============================================================================================================
+
+def bond_keys(df, key_columns):
+    """
+    Stable 64-bit keys of the rows of a table, e.g. of the bonds of a snapshot of bonds-data.
+
+    The key only depends on the values of the key columns, not on their dtypes, so a bond gets the same key in every
+    snapshot whether its issuer is stored as a string or a categorical and its coupon as float32 or float64.
+
+    Parameters:
+    - df (DataFrame): The rows to key.
+    - key_columns (list): Columns that identify a row. An 'ISIN' column of df takes precedence over them.
+
+    Returns:
+    - ndarray: One uint64 key per row.
+    """
+
+    if 'ISIN' in df.columns:
+        key_columns = ['ISIN']
+
+    normalized = {}
+    for col in key_columns:
+        values = df[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            normalized[col] = values.astype('datetime64[ns]')
+        elif pd.api.types.is_numeric_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype):
+            normalized[col] = values.astype(np.float64)
+        else:
+            normalized[col] = values.astype(object)
+
+    return pd.util.hash_pandas_object(pd.DataFrame(normalized), index=False).to_numpy()
+
+# ==============================================================================================================
+# 2. QuoteStore
+# ==============================================================================================================
+
+class QuoteStore:
+    """
+    Append-only history of the daily snapshots of a table (e.g. bonds-data or merged-cds), partitioned by date.
+
+    Every snapshot is a directory processed_data/history/<table>/<YYYY-MM-DD>/ with one .npy file per column, the row
+    keys (see bond_keys()) and a meta.json with the column kinds and categories. Rows are sorted by key, so the rows of
+    given bonds are found by binary search. Columns are memory-mapped when read: only the partitions, columns and
+    rows asked for are loaded, never the full history. Text and categorical columns are stored as integer codes with
+    their categories, dates as datetime64 and numbers in their own dtype.
+
+    Parameters:
+    - table (str, optional): Name of the table. Default is "bonds-data".
+    - directory (Path, optional): Root of the history. Default is HISTORY_DIR.
+    - key_columns (list, optional): Columns that identify a row. Default is None for the KEY_COLUMNS of the table.
+    """
+
+    def __init__(self, table="bonds-data", directory=None, key_columns=None):
+        self.table = table
+        self.directory = Path(directory or HISTORY_DIR) / table
+        self.key_columns = list(key_columns or KEY_COLUMNS[table])
+
+    def _partition(self, date):
+        return self.directory / pd.Timestamp(date).strftime('%Y-%m-%d')
+
+    def dates(self, start=None, end=None):
+        """
+        Dates of the stored snapshots, oldest first.
+
+        Parameters:
+        - start (date-like, optional): First date to list. Default is None for the oldest snapshot.
+        - end (date-like, optional): Last date to list. Default is None for the latest snapshot.
+
+        Returns:
+        - list: Dates as 'YYYY-MM-DD' strings.
+        """
+
+        if not self.directory.exists():
+            return []
+
+        dates = sorted(path.name for path in self.directory.iterdir() if (path / "meta.json").exists())
+        if start is not None:
+            dates = [date for date in dates if date >= pd.Timestamp(start).strftime('%Y-%m-%d')]
+        if end is not None:
+            dates = [date for date in dates if date <= pd.Timestamp(end).strftime('%Y-%m-%d')]
+
+        return dates
+
+    def append(self, df, date):
+        """
+        Store the snapshot of a date. Snapshots are never overwritten: appending a date that is already stored raises
+        a ValueError.
+
+        Parameters:
+        - df (DataFrame): The snapshot, e.g. the cleaned bonds-data of the date. The index is not stored.
+        - date (date-like): The date of the snapshot.
+
+        Returns:
+        - Path: The directory of the new partition.
+        """
+
+        target = self._partition(date)
+        if target.exists():
+            raise ValueError(f"{self.table} already has a snapshot for {target.name}; the history is append-only")
+
+        keys = bond_keys(df, self.key_columns)
+        order = np.argsort(keys, kind='stable')
+
+        # written next to the partition and renamed, so readers never see a partial snapshot
+        staging = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+        staging.mkdir(parents=True, exist_ok=True)
+        try:
+            np.save(staging / "_key.npy", keys[order])
+
+            columns = {}
+            for i, col in enumerate(df.columns):
+                values = df[col].iloc[order]
+                if isinstance(values.dtype, pd.CategoricalDtype) or not (pd.api.types.is_numeric_dtype(values)
+                                                                         or pd.api.types.is_datetime64_any_dtype(values)):
+                    categorical = pd.Categorical(values)
+                    np.save(staging / f"{i}.npy", categorical.codes.astype(np.int32))
+                    columns[col] = {'file': f"{i}.npy", 'kind': 'category', 'categories': categorical.categories.tolist()}
+                elif pd.api.types.is_datetime64_any_dtype(values):
+                    np.save(staging / f"{i}.npy", values.to_numpy(dtype='datetime64[ns]'))
+                    columns[col] = {'file': f"{i}.npy", 'kind': 'datetime'}
+                else:
+                    np.save(staging / f"{i}.npy", values.to_numpy(dtype=values.dtype if isinstance(values.dtype, np.dtype) else np.float64))
+                    columns[col] = {'file': f"{i}.npy", 'kind': 'numeric'}
+
+            meta = {'table': self.table, 'date': target.name, 'rows': len(df), 'key_columns': self.key_columns, 'columns': columns}
+            (staging / "meta.json").write_text(json.dumps(meta, indent=2, default=str))
+            staging.rename(target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        return target
+
+    def read(self, date, columns=None, keys=None):
+        """
+        Read the snapshot of a date, optionally only some columns and the rows of some bonds.
+
+        Parameters:
+        - date (date-like): The date of the snapshot.
+        - columns (list, optional): Columns to read. Default is None for all columns.
+        - keys (array-like, optional): Keys of the rows to read (see bond_keys()); keys without a row in the snapshot
+                                       are left out. Default is None for all rows.
+
+        Returns:
+        - DataFrame: The snapshot, indexed by the row keys (KEY_NAME).
+        """
+
+        partition = self._partition(date)
+        if not (partition / "meta.json").exists():
+            raise FileNotFoundError(f"{self.table} has no snapshot for {partition.name}")
+        meta = json.loads((partition / "meta.json").read_text())
+
+        stored_keys = np.load(partition / "_key.npy", mmap_mode='r')
+        if keys is None:
+            rows = slice(None)
+        else:
+            keys = np.asarray(keys, dtype=np.uint64)
+            positions = np.searchsorted(stored_keys, keys)
+            found = positions < len(stored_keys)
+            found[found] = stored_keys[positions[found]] == keys[found]
+            rows = positions[found]
+
+        missing = [col for col in (columns or []) if col not in meta['columns']]
+        if missing:
+            raise KeyError(f"{self.table} has no columns {missing}")
+
+        data = {}
+        for col in (columns or meta['columns']):
+            spec = meta['columns'][col]
+            values = np.array(np.load(partition / spec['file'], mmap_mode='r')[rows])
+            if spec['kind'] == 'category':
+                values = pd.Categorical.from_codes(values, categories=spec['categories'])
+            data[col] = values
+
+        return pd.DataFrame(data, index=pd.Index(np.array(stored_keys[rows]), name=KEY_NAME))
+
+    def snapshots(self, start=None, end=None, columns=None):
+        """
+        Read the snapshots of a date range one at a time.
+
+        Parameters:
+        - start (date-like, optional): First date. Default is None for the oldest snapshot.
+        - end (date-like, optional): Last date. Default is None for the latest snapshot.
+        - columns (list, optional): Columns to read. Default is None for all columns.
+
+        Returns:
+        - generator: (date, DataFrame) pairs, oldest first.
+        """
+
+        for date in self.dates(start, end):
+            yield date, self.read(date, columns=columns)
@@ -0,0 +1,320 @@
+# instrumentation.py
+# |--- enable_tracing()
+# |--- stage()
+# |--- iterate()
+# |--- finish_trace()
+
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Tracing is opt-in: set BOND_TRACE to 1 (or to a directory for the traces) and BOND_PROFILE to 1 to also capture
+# cProfile statistics per stage. enable_tracing() sets them, so scripts started from a traced process are traced too.
+TRACE_ENV = "BOND_TRACE"
+PROFILE_ENV = "BOND_PROFILE"
+TRACE_DIR = Path().resolve() / "processed_data" / "traces"
+
+# Interval of the resident memory sampler in seconds, and functions per stage kept from the cProfile statistics
+RSS_SAMPLE_INTERVAL = 0.02
+PROFILE_TOP_FUNCTIONS = 15
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# ==============================================================================================================
+# 1. enable_tracing()
+# ==============================================================================================================
+
+def _current_rss():
+    """Resident memory of this process in bytes, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return None
+
+
+def _max_rss():
+    """
+    Peak resident memory of this process so far in bytes (ru_maxrss is in kB on Linux, in bytes on macOS), or None
+    where the resource module is not available (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class _Tracer:
+    """
+    Collects the records of the named stages of one process and samples its resident memory in the background
+    while a stage is running. Re-entering a stage of the same name (e.g. once per batch) adds to its record.
+    """
+
+    def __init__(self, trace_dir, profile):
+        self.trace_dir = Path(trace_dir)
+        self.profile = profile
+        self.started = time.perf_counter()
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.records = {}
+        self._active = []
+        self._profiles = {}
+        self._profiling_record = None
+        self._sampler = None
+        self._lock = threading.Lock()
+
+    def record(self, name):
+        if name not in self.records:
+            self.records[name] = {'name': name, 'parent': self._active[-1]['name'] if self._active else None,
+                                  'calls': 0, 'seconds': 0.0, 'rows_in': None, 'rows_out': None,
+                                  'rss_start_mb': None, 'rss_peak_mb': None, 'rss_end_mb': None}
+        return self.records[name]
+
+    def _sample(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                rss = _current_rss()
+                if rss is not None:
+                    for record in self._active:
+                        record['rss_peak_mb'] = max(record['rss_peak_mb'] or 0, rss / 2**20)
+            time.sleep(RSS_SAMPLE_INTERVAL)
+
+    def enter(self, record):
+        rss = _current_rss()
+        with self._lock:
+            if record['rss_start_mb'] is None and rss is not None:
+                record['rss_start_mb'] = rss / 2**20
+            if rss is not None:
+                record['rss_peak_mb'] = max(record['rss_peak_mb'] or 0, rss / 2**20)
+            self._active.append(record)
+            if self._sampler is None and rss is not None:
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+
+        # only one profiler can be active, so a stage nested in a profiled stage is counted in its parent's profile. The
+        # tracer keeps track of its own profiler: since Python 3.12 cProfile does not show in sys.getprofile()
+        if self.profile and self._profiling_record is None:
+            import cProfile
+            profiler = self._profiles.get(record['name']) or cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # another profiler of the process is active, e.g. python -m cProfile
+                pass
+            else:
+                self._profiles[record['name']] = profiler
+                self._profiling_record = record
+        return time.perf_counter()
+
+    def exit(self, record, started):
+        elapsed = time.perf_counter() - started
+        if self._profiling_record is record:
+            self._profiles[record['name']].disable()
+            self._profiling_record = None
+
+        rss = _current_rss()
+        with self._lock:
+            self._active.remove(record)
+            record['calls'] += 1
+            record['seconds'] += elapsed
+            if rss is not None:
+                record['rss_end_mb'] = rss / 2**20
+                record['rss_peak_mb'] = max(record['rss_peak_mb'] or 0, rss / 2**20)
+
+
+class _NullRecord(dict):
+    """Stage record of a disabled tracer: row counts set on it are dropped and every field reads as None."""
+    def __setitem__(self, key, value):
+        pass
+
+    def __missing__(self, key):
+        return None
+
+
+class _Stage:
+    __slots__ = ('tracer', 'record', 'started')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.record = tracer.record(name)
+
+    def __enter__(self):
+        self.started = self.tracer.enter(self.record)
+        return self.record
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.exit(self.record, self.started)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return _NullRecord()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+
+_NULL_STAGE = _NullStage()
+_tracer = None
+
+
+def enable_tracing(trace_dir=None, profile=False):
+    """
+    Turn on tracing for this process and the scripts it starts.
+
+    Parameters:
+    - trace_dir (Path, optional): Directory of the JSON traces. Default is None for processed_data/traces/.
+    - profile (bool, optional): Also capture cProfile statistics per stage. Default is False.
+    """
+
+    global _tracer
+
+    trace_dir = Path(trace_dir or TRACE_DIR)
+    os.environ[TRACE_ENV] = str(trace_dir)
+    if profile:
+        os.environ[PROFILE_ENV] = "1"
+    if _tracer is None:
+        _tracer = _Tracer(trace_dir, profile)
+    else:
+        _tracer.trace_dir, _tracer.profile = trace_dir, _tracer.profile or profile
+
+
+# traced from the start when the environment asks for it, e.g. in a script started by a traced pipeline
+if os.environ.get(TRACE_ENV, "0") not in ("", "0"):
+    enable_tracing(None if os.environ[TRACE_ENV] == "1" else os.environ[TRACE_ENV],
+                   profile=os.environ.get(PROFILE_ENV, "0") not in ("", "0"))
+
+# ==============================================================================================================
+# 2. stage()
+# ==============================================================================================================
+
+def stage(name):
+    """
+    Context manager that times a named stage and samples the process memory while it runs. It yields the stage's
+    record, on which 'rows_in' and 'rows_out' can be set. Without tracing it does nothing and costs one function call.
+
+    Parameters:
+    - name (str): Name of the stage. Stages entered several times (e.g. per batch) are added up.
+
+    Returns:
+    - context manager: Yields a dict with the stage's record.
+    """
+
+    if _tracer is None:
+        return _NULL_STAGE
+    return _Stage(_tracer, name)
+
+# ==============================================================================================================
+# 3. iterate()
+# ==============================================================================================================
+
+def iterate(name, iterable):
+    """
+    Time the production of every item of an iterable (e.g. batches read from a file) as a named stage, without the
+    time the consumer spends on the items. Without tracing the iterable is returned as it is.
+
+    Parameters:
+    - name (str): Name of the stage.
+    - iterable (iterable): The items to produce.
+
+    Returns:
+    - iterable: The same items.
+    """
+
+    if _tracer is None:
+        return iterable
+    return _timed_iteration(name, iter(iterable))
+
+
+def _timed_iteration(name, iterator):
+    while True:
+        with stage(name) as record:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            record['rows_out'] = (record['rows_out'] or 0) + (len(item) if hasattr(item, '__len__') else 1)
+        yield item
+
+# ==============================================================================================================
+# 4. finish_trace()
+# ==============================================================================================================
+
+def _profile_summary(profiler):
+    """The PROFILE_TOP_FUNCTIONS functions with the most cumulative time."""
+    import io
+    import pstats
+
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP_FUNCTIONS]
+    return [{'function': f"{Path(filename).name}:{line}({function})", 'calls': calls, 'total_s': total, 'cumulative_s': cumulative}
+            for (filename, line, function), (_, calls, total, cumulative, _) in rows]
+
+
+def finish_trace(script):
+    """
+    Write the trace of this process to a JSON file and print a summary of its stages to stderr. Does nothing
+    without tracing.
+
+    The trace holds the wall time and peak memory of the process and per stage the number of calls, seconds, rows
+    in and out, resident memory at the start, peak and end (in MB) and, with profiling, the functions with the most
+    cumulative time; the full cProfile statistics are written next to the trace as <trace>.<stage>.prof.
+
+    Parameters:
+    - script (str): Name of the script or run, used in the file name, e.g. 'data_cleaning'.
+
+    Returns:
+    - Path: The path of the trace, or None without tracing.
+    """
+
+    if _tracer is None:
+        return None
+
+    # only needed with tracing, so they are not imported with the pipeline modules
+    import json
+
+    wall = time.perf_counter() - _tracer.started
+    path = _tracer.trace_dir / f"{script}-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    stages = []
+    for record in _tracer.records.values():
+        record = dict(record)
+        if record['name'] in _tracer._profiles:
+            profiler = _tracer._profiles[record['name']]
+            profile_path = path.with_suffix(f".{record['name'].replace(' ', '-').replace('/', '-')}.prof")
+            profiler.dump_stats(profile_path)
+            record['profile'] = _profile_summary(profiler)
+            record['profile_file'] = profile_path.name
+        stages.append(record)
+
+    max_rss = _max_rss()
+    trace = {'script': script, 'started': _tracer.started_at, 'argv': sys.argv, 'pid': os.getpid(),
+             'wall_s': wall, 'maxrss_mb': None if max_rss is None else max_rss / 2**20, 'stages': stages}
+    path.write_text(json.dumps(trace, indent=2))
+
+    # human-readable summary; nested stages are indented under their parent
+    depth = {}
+    peak_rss = "n/a" if max_rss is None else f"{trace['maxrss_mb']:.0f} MB"
+    lines = [f"{script}: {wall:.2f} s, peak RSS {peak_rss}, trace {path}",
+             f"  {'stage':<34} {'calls':>6} {'seconds':>9} {'share':>6} {'rows in':>10} {'rows out':>10} {'peak MB':>8}"]
+    for record in stages:
+        depth[record['name']] = depth.get(record['parent'], -1) + 1
+        name = "  " * depth[record['name']] + record['name']
+        rows_in = "" if record['rows_in'] is None else record['rows_in']
+        rows_out = "" if record['rows_out'] is None else record['rows_out']
+        peak = "" if record['rss_peak_mb'] is None else f"{record['rss_peak_mb']:.0f}"
+        lines.append(f"  {name:<34} {record['calls']:>6} {record['seconds']:>9.3f} {record['seconds'] / wall:>6.1%} "
+                     f"{rows_in:>10} {rows_out:>10} {peak:>8}")
+    print("\n".join(lines), file=sys.stderr)
+
+    return path
@@ -0,0 +1,404 @@
+# lattice.py
+# |--- ShortRateTree
+# |    |--- calibrate()
+# |    |--- price()
+# |--- price_embedded_options()
+
+import warnings
+
+import numpy as np
+import pandas as pd
+from utils.bond_math import _as_arrays, _period_grid, solve_ytm
+from utils.schema import AS_OF_DATE, FACE_VALUE
+from utils.screening import fit_country_curves
+
+# Maturity types with an embedded option, as (callable, putable). The sinking fund of CALL/SINK bonds is not modelled.
+OPTION_MTY_TYPES = {'CALLABLE': (True, False), 'PUTABLE': (False, True), 'CALL/SINK': (True, False), 'CALL/PUT': (True, True)}
+
+# Maturity types of the bullet bonds the country curves of the lattice are fitted to
+BULLET_MTY_TYPES = ['AT MATURITY', 'NORMAL']
+
+# Normal (Ho-Lee) volatility of the short rate, in percent per year
+SHORT_RATE_VOLATILITY = 1.0
+
+# Lattice steps per coupon period; every coupon date is a node of the tree
+STEPS_PER_PERIOD = 2
+
+# bonds-data has no call or put schedule: the options are assumed exercisable at par on every coupon date of the
+# last FIRST_EXERCISE_FRACTION of the remaining life, like the par call of a 10NC5 bond
+EXERCISE_PRICE = FACE_VALUE
+FIRST_EXERCISE_FRACTION = 0.5
+
+# Parallel shift of the curve (in basis points) for the effective duration and convexity
+EFFECTIVE_SHIFT_BP = 10
+
+# The option-adjusted spread is solved until the lattice price is within OAS_TOLERANCE of the market price
+# (relative to the face value), within OAS_BRACKET (in basis points)
+OAS_TOLERANCE = 1e-6
+OAS_MAX_ITER = 50
+OAS_BRACKET = (-1000.0, 5000.0)
+
+# Columns of price_embedded_options()
+OPTION_COLUMNS = ['OAS', 'Option-Adjusted Price', 'Option-Free Price', 'Option Value', 'Option-Adjusted Yield',
+                  'Effective Duration', 'Effective Convexity', 'Option-Free Convexity', 'Effective DV01']
+
+# ==============================================================================================================
+# 0. Kernels shared by ShortRateTree and price_embedded_options()
+# ==============================================================================================================
+
+def _log_discount(curve, tenors):
+    """
+    Log discount factors of a curve, with the curve held flat outside the tenors it was fitted to, so a curve fitted
+    to short bonds does not extrapolate to extreme rates over the horizon of a tree. Raises a ValueError if the curve
+    falls to -100% (per compounding period) or below, where it has no discount factor.
+    """
+    tenors = np.asarray(tenors, dtype=float)
+    m = curve.periods_per_year
+    zero_rates = curve.zero_rate(np.clip(tenors, *curve.tenor_range))
+
+    invalid = ~(zero_rates > -100 * m)
+    if invalid.any():
+        raise ValueError(f"the curve{' of ' + curve.label if curve.label else ''} has no discount factor at "
+                         f"{tenors[invalid][0]:.2f} years (zero rate {zero_rates[invalid][0]:.1f}%)")
+
+    return -m * tenors * np.log1p(zero_rates / (100 * m))
+
+
+def _backward_induction(rates, dt, tree_index, maturity_steps, coupons, face_value, spreads, callable, putable,
+                        exercise_price, first_exercise_steps, steps_per_period):
+    """
+    Roll a batch of bonds back through stacked trees of the same step length: bond k is priced on the tree
+    rates[tree_index[k]], so the bonds of several curves share one pass over the steps.
+
+    Coupons are paid every steps_per_period steps and the face value at maturity. On the coupon dates from
+    first_exercise_steps on (maturity excluded) the value of a callable bond is capped at the exercise price and the
+    value of a putable bond is floored at it, both ex-coupon.
+    """
+
+    # longest maturity first, so the bonds alive at a step are the first alive[i] rows and the others are skipped
+    order = np.argsort(-np.asarray(maturity_steps), kind='stable')
+    n_bonds = len(order)
+    callable, putable, maturity_steps, tree_index = (np.asarray(values)[order][:, np.newaxis]
+                                                     for values in (callable, putable, maturity_steps, tree_index))
+    coupons, face_value, spreads, exercise_price, first_exercise_steps = (
+        np.broadcast_to(np.asarray(values, dtype=float), n_bonds)[order][:, np.newaxis]
+        for values in (coupons, face_value, spreads, exercise_price, first_exercise_steps))
+
+    n_steps = int(maturity_steps.max(initial=0))
+    if n_steps > rates.shape[1]:
+        raise ValueError(f"the tree covers {rates.shape[1]} steps, the bonds need {n_steps}")
+    alive = np.searchsorted(-maturity_steps[:, 0], -np.arange(n_steps + 1), side='right')
+
+    # discount factors of the nodes with the probability 1/2 of each move folded in, and of the spreads
+    tree_discount = np.exp(-rates * dt) / 2
+    spread_discount = np.exp(-spreads * dt)
+
+    # values at the nodes of step i, before the cash flows of step i; bonds that matured before i are worth 0
+    values = np.zeros((n_bonds, n_steps + 1))
+    for i in range(n_steps, 0, -1):
+        k = alive[i]
+        step_values = values[:k, :i + 1]
+        if i % steps_per_period == 0:
+            exercisable = (i < maturity_steps[:k]) & (i >= first_exercise_steps[:k])
+            np.minimum(step_values, exercise_price[:k], out=step_values, where=exercisable & callable[:k])
+            np.maximum(step_values, exercise_price[:k], out=step_values, where=exercisable & putable[:k])
+            step_values += coupons[:k] + np.where(i == maturity_steps[:k], face_value[:k], 0)
+
+        # expected value over the up and down moves, discounted at the short rate of every node of step i - 1
+        rolled = step_values[:, :i] + step_values[:, 1:]
+        rolled *= tree_discount[tree_index[:k, 0], i - 1, :i]
+        rolled *= spread_discount[:k]
+        values[:k, :i] = rolled
+
+    prices = np.empty(n_bonds)
+    prices[order] = values[:, 0]
+    return prices
+
+# ==============================================================================================================
+# 1. ShortRateTree
+# ==============================================================================================================
+
+class ShortRateTree:
+    """
+    Recombining binomial Ho-Lee tree of the short rate, calibrated to a fitted yield curve.
+
+    The rate of node j at step i is theta_i + volatility * sqrt(dt) * (2j - i), with probability 1/2 of moving up or
+    down. The drifts theta_i are solved by forward induction on the Arrow-Debreu prices, so the tree reprices the
+    discount factors of the curve exactly at every step (the curve is held flat outside the tenors it was fitted to).
+    The tree only depends on the curve, so it is built once and every bond on the curve is priced on it; price()
+    rolls a whole batch of bonds back through the tree at once.
+
+    Parameters:
+    - rates (ndarray): Continuously compounded short rates (decimal), shape (n_steps, n_steps); row i holds the
+                       i + 1 nodes of step i, the rest is NaN.
+    - dt (float): Length of a step in years.
+    - label (str, optional): What the curve was fitted to, e.g. 'United States'.
+    """
+
+    def __init__(self, rates, dt, label=None):
+        self.rates = rates
+        self.dt = dt
+        self.label = label
+
+    def __repr__(self):
+        return f"ShortRateTree(label={self.label!r}, n_steps={self.n_steps}, dt={self.dt})"
+
+    @property
+    def n_steps(self):
+        return len(self.rates)
+
+    @classmethod
+    def calibrate(cls, curve, horizon, steps_per_year, volatility=SHORT_RATE_VOLATILITY):
+        """
+        Build the tree of a curve. Raises a ValueError if the curve has no discount factor over the horizon.
+
+        Parameters:
+        - curve (YieldCurve): The fitted curve, e.g. of a country's bullet bonds.
+        - horizon (float): Years covered by the tree, i.e. the longest maturity to price.
+        - steps_per_year (int): Number of steps per year.
+        - volatility (float, optional): Normal volatility of the short rate in percent per year. Default is SHORT_RATE_VOLATILITY.
+
+        Returns:
+        - ShortRateTree: The calibrated tree.
+        """
+
+        dt = 1 / steps_per_year
+        n_steps = max(int(np.ceil(horizon * steps_per_year - 1e-9)), 1)
+        log_discount = _log_discount(curve, np.arange(1, n_steps + 1) * dt)
+
+        sigma = volatility / 100 * np.sqrt(dt)
+        rates = np.full((n_steps, n_steps), np.nan)
+        state_prices = np.ones(1)
+        for i in range(n_steps):
+            deviation = sigma * (2 * np.arange(i + 1) - i)
+
+            # theta_i so that the Arrow-Debreu prices of step i discount to the curve's discount factor of step i + 1
+            theta = (np.log(state_prices @ np.exp(-deviation * dt)) - log_discount[i]) / dt
+            rates[i, :i + 1] = theta + deviation
+
+            discounted = state_prices * np.exp(-rates[i, :i + 1] * dt) / 2
+            state_prices = np.append(discounted, 0) + np.append(0, discounted)
+
+        return cls(rates, dt, label=curve.label)
+
+    def price(self, maturity_steps, coupons, face_value, spreads, callable=None, putable=None,
+              exercise_price=EXERCISE_PRICE, first_exercise_steps=0, steps_per_period=STEPS_PER_PERIOD):
+        """
+        Price a batch of bonds by backward induction through the tree.
+
+        Coupons are paid every steps_per_period steps from the first period on and the face value at maturity. On the
+        coupon dates from first_exercise_steps until maturity the value of a callable bond is capped at the exercise
+        price and the value of a putable bond is floored at it, after the coupon of the date is paid.
+
+        Parameters:
+        - maturity_steps (array-like): Step of the maturity of each bond, a multiple of steps_per_period.
+        - coupons (float or array-like): Coupon paid every period (not annual).
+        - face_value (float or array-like): Face value paid at maturity.
+        - spreads (float or array-like): Spread added to every short rate (decimal, continuously compounded), e.g. the OAS.
+        - callable (array-like, optional): Flags the callable bonds. Default is None for none.
+        - putable (array-like, optional): Flags the putable bonds. Default is None for none.
+        - exercise_price (float or array-like, optional): Price of a call or put. Default is EXERCISE_PRICE.
+        - first_exercise_steps (float or array-like, optional): First step the options can be exercised at. Default is 0.
+        - steps_per_period (int, optional): Steps between two coupons. Default is STEPS_PER_PERIOD.
+
+        Returns:
+        - ndarray: The prices.
+        """
+
+        maturity_steps = np.atleast_1d(np.asarray(maturity_steps, dtype=int))
+        no_option = np.zeros(len(maturity_steps), dtype=bool)
+        callable = no_option if callable is None else np.broadcast_to(np.asarray(callable, dtype=bool), no_option.shape)
+        putable = no_option if putable is None else np.broadcast_to(np.asarray(putable, dtype=bool), no_option.shape)
+
+        return _backward_induction(self.rates[np.newaxis], self.dt, np.zeros(len(maturity_steps), dtype=int),
+                                   maturity_steps, coupons, face_value, spreads, callable, putable,
+                                   exercise_price, first_exercise_steps, steps_per_period)
+
+# ==============================================================================================================
+# 2. price_embedded_options()
+# ==============================================================================================================
+
+def _solve_oas(lattice_price, market_price, guess):
+    """
+    Spread over the trees (decimal) at which the lattice prices equal the market prices, for all bonds at once.
+
+    lattice_price(spreads, rows) prices the given rows of the batch. The price is decreasing in the spread, so every
+    evaluation narrows a [low, high] bracket per bond within OAS_BRACKET; a secant step that leaves the bracket is
+    replaced by a bisection step, like solve_ytm(). NaN for market prices outside the prices of OAS_BRACKET and for
+    bonds that do not converge.
+    """
+
+    n_bonds = len(market_price)
+    low = np.full(n_bonds, OAS_BRACKET[0] / 10_000)
+    high = np.full(n_bonds, OAS_BRACKET[1] / 10_000)
+    spreads = np.clip(np.nan_to_num(guess), low, high)
+    tol = OAS_TOLERANCE * FACE_VALUE
+
+    # market prices outside [price(high), price(low)] have no OAS in the bracket
+    rows = np.arange(n_bonds)
+    highest_price, lowest_price = lattice_price(low, rows), lattice_price(high, rows)
+    active = np.flatnonzero((market_price >= lowest_price - tol) & (market_price <= highest_price + tol))
+
+    # the upper end of the bracket is the first previous point of the secant steps
+    previous_spreads, previous_error = high[active], lowest_price[active] - market_price[active]
+    converged = np.zeros(n_bonds, dtype=bool)
+
+    for _ in range(OAS_MAX_ITER):
+        if not len(active):
+            break
+
+        error = lattice_price(spreads[active], active) - market_price[active]
+        done = np.abs(error) <= tol
+        converged[active[done]] = True
+
+        # a price above the market price means the spread is too low, and vice versa
+        low[active] = np.where(error > 0, spreads[active], low[active])
+        high[active] = np.where(error < 0, spreads[active], high[active])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = spreads[active] - error * (spreads[active] - previous_spreads) / (error - previous_error)
+        inside = (step > low[active]) & (step < high[active])
+        step = np.where(inside, step, (low[active] + high[active]) / 2)
+
+        previous_spreads, previous_error = spreads[active][~done], error[~done]
+        spreads[active] = np.where(done, spreads[active], step)
+        active = active[~done]
+
+    return np.where(converged, spreads, np.nan)
+
+
+def price_embedded_options(data, market_price=None, oas=None, curves=None, method='nss', ytm_col='YTM - Ask', price_col='Buy Price',
+                           as_of=AS_OF_DATE, volatility=SHORT_RATE_VOLATILITY, periods_per_year=2,
+                           steps_per_period=STEPS_PER_PERIOD, first_exercise_years=None, shift_bp=EFFECTIVE_SHIFT_BP):
+    """
+    Price the callable and putable bonds (OPTION_MTY_TYPES) of the analyzed bonds on short-rate trees calibrated to
+    the yield curves of their countries' bullet bonds.
+
+    One ShortRateTree is built per country curve, and the option bonds of all countries are rolled back through the
+    stacked trees in one backward induction per evaluation. The option-adjusted spread (OAS) is the spread over the
+    tree at which a bond's lattice price equals its market price. The effective duration and convexity are measured
+    by shifting the curve by +/- shift_bp at a constant OAS, so they include the change of the option's value; the
+    option-free figures are those of the same bond without its option on the same tree. The Option-Adjusted Yield is
+    the YTM of the option-free price, i.e. the yield of the bond net of the option it is short (callable) or long
+    (putable).
+
+    The coupon schedule is the one of bond_math (periods_per_year coupons a year up to 'Years to Maturity'), so a
+    bullet bond on a flat curve at its YTM has an OAS of 0. bonds-data has no call or put schedule: the options are
+    assumed exercisable at par (EXERCISE_PRICE) on every coupon date from first_exercise_years on.
+
+    Parameters:
+    - data (DataFrame): The analyzed bonds (processed_data/bonds-analyzed.parquet), with the bullet bonds the curves
+                        are fitted to; only the option bonds are priced.
+    - market_price (Series, optional): Market prices of the bonds. Default is None for price_col.
+    - oas (float or Series, optional): OAS in basis points to price at instead of solving it from the market price,
+                                       e.g. 0 for the value on the country curve. Default is None.
+    - curves (dict, optional): Country -> YieldCurve to calibrate the trees to. Default is None to fit the curves of
+                               the countries with option bonds to their bullet bonds (BULLET_MTY_TYPES).
+    - method (str, optional): Curve method, 'nss' or 'spline'. Default is 'nss'.
+    - ytm_col (str, optional): The yield column the curves are fitted to. Default is 'YTM - Ask'.
+    - price_col (str, optional): The market price column. Default is 'Buy Price'.
+    - as_of (str, optional): The pricing date the tenors of the curves are measured from. Default is AS_OF_DATE.
+    - volatility (float, optional): Normal volatility of the short rate in percent per year. Default is SHORT_RATE_VOLATILITY.
+    - periods_per_year (int, optional): Coupons per year. Default is 2.
+    - steps_per_period (int, optional): Lattice steps per coupon period. Default is STEPS_PER_PERIOD.
+    - first_exercise_years (float or Series, optional): Years until the options can be exercised. Default is None for
+                                                        the last FIRST_EXERCISE_FRACTION of each bond's remaining life.
+    - shift_bp (float, optional): Curve shift for the effective duration and convexity in basis points. Default is EFFECTIVE_SHIFT_BP.
+
+    Returns:
+    - DataFrame: OPTION_COLUMNS for the option bonds of data (same index). OAS is in basis points, prices per
+                 FACE_VALUE, Effective DV01 per 1bp with the sign of 'DV01'. NaN for bonds of a country without a
+                 curve, of a country whose curve has no discount factor over the tree (with a warning naming the
+                 countries) or without an OAS in OAS_BRACKET.
+    """
+
+    options = data[data['Mty Type'].isin(list(OPTION_MTY_TYPES))]
+    results = pd.DataFrame(np.nan, index=options.index, columns=OPTION_COLUMNS)
+
+    if curves is None:
+        bullets = data[data['Mty Type'].isin(BULLET_MTY_TYPES) & data['Country'].isin(options['Country'].unique())]
+        curves, _ = fit_country_curves(bullets, method=method, ytm_col=ytm_col, as_of=as_of)
+    options = options[options['Country'].isin(list(curves))]
+    if options.empty:
+        return results
+
+    years, coupon_rate = _as_arrays(options['Years to Maturity'], options['Cpn'].fillna(0))
+    _, _, pricing_periods = _period_grid(years, periods_per_year)
+    steps_per_year = periods_per_year * steps_per_period
+    maturity_steps = pricing_periods * steps_per_period
+
+    # one tree per country curve, all over the longest maturity so they stack into one array; a curve fitted to a few
+    # distressed bonds can fall to -100% or below, and the bonds of its country are left out
+    horizon = maturity_steps.max() / steps_per_year
+    trees, failed = {}, []
+    for country in sorted(options['Country'].astype(str).unique()):
+        try:
+            trees[country] = ShortRateTree.calibrate(curves[country], horizon, steps_per_year, volatility)
+        except ValueError as error:
+            failed.append(str(error))
+    if failed:
+        warnings.warn(f"no tree for {len(failed)} countries, their option bonds are not priced: {'; '.join(failed)}")
+
+    priced = options['Country'].astype(str).isin(list(trees)).to_numpy()
+    options, years, coupon_rate, maturity_steps = options[priced], years[priced], coupon_rate[priced], maturity_steps[priced]
+    if options.empty:
+        return results
+
+    if first_exercise_years is None:
+        first_exercise_years = years * (1 - FIRST_EXERCISE_FRACTION)
+    elif np.ndim(first_exercise_years):
+        first_exercise_years = first_exercise_years.reindex(options.index).to_numpy(dtype=float)
+
+    countries = pd.Categorical(options['Country'].astype(str), categories=list(trees))
+    rates = np.stack([trees[country].rates for country in countries.categories])
+
+    bond = {'tree_index': countries.codes.astype(int), 'maturity_steps': maturity_steps,
+            'coupons': FACE_VALUE * coupon_rate / 100 / periods_per_year, 'face_value': np.full(len(options), float(FACE_VALUE)),
+            'callable': options['Mty Type'].isin([mty_type for mty_type, (call, _) in OPTION_MTY_TYPES.items() if call]).to_numpy(),
+            'putable': options['Mty Type'].isin([mty_type for mty_type, (_, put) in OPTION_MTY_TYPES.items() if put]).to_numpy(),
+            'exercise_price': EXERCISE_PRICE, 'first_exercise_steps': np.broadcast_to(first_exercise_years * steps_per_year, len(options))}
+
+    def lattice_price(spreads, rows, **overrides):
+        inputs = {name: (values[rows] if np.ndim(values) else values) for name, values in bond.items()}
+        return _backward_induction(rates, 1 / steps_per_year, spreads=spreads, steps_per_period=steps_per_period,
+                                   **{**inputs, **overrides})
+
+    if oas is None:
+        # start from the spread of the bond's yield over the curve at its maturity, exact for a bullet bond
+        ytm = pd.to_numeric(options[ytm_col], errors='coerce').to_numpy(dtype=float)
+        curve_log_discount = np.zeros(len(options))
+        for code, country in enumerate(countries.categories):
+            on_curve = countries.codes == code
+            curve_log_discount[on_curve] = _log_discount(curves[country], years[on_curve])
+        guess = periods_per_year * np.log1p(ytm / (100 * periods_per_year)) + curve_log_discount / np.maximum(years, 1e-6)
+        market_price = (data[price_col] if market_price is None else market_price).reindex(options.index)
+        spreads = _solve_oas(lattice_price, market_price.to_numpy(dtype=float), guess)
+    else:
+        oas = oas.reindex(options.index).to_numpy(dtype=float) if np.ndim(oas) else oas
+        spreads = np.broadcast_to(np.asarray(oas, dtype=float) / 10_000, len(options))
+
+    # with and without the option, at the OAS and with the curve shifted down and up, in one backward induction
+    n_bonds = len(options)
+    shift = shift_bp / 10_000
+    rows = np.tile(np.arange(n_bonds), 6)
+    stacked_spreads = np.tile(np.concatenate([spreads, spreads - shift, spreads + shift]), 2)
+    with_option = np.repeat([True, False], 3 * n_bonds)
+    valid = np.isfinite(stacked_spreads)
+
+    prices = np.full(6 * n_bonds, np.nan)
+    prices[valid] = lattice_price(stacked_spreads[valid], rows[valid],
+                                  callable=(bond['callable'][rows] & with_option)[valid],
+                                  putable=(bond['putable'][rows] & with_option)[valid])
+    price, down, up, free_price, free_down, free_up = prices.reshape(6, n_bonds)
+
+    results.loc[options.index, 'OAS'] = spreads * 10_000
+    results.loc[options.index, 'Option-Adjusted Price'] = price
+    results.loc[options.index, 'Option-Free Price'] = free_price
+    results.loc[options.index, 'Option Value'] = free_price - price
+    results.loc[options.index, 'Option-Adjusted Yield'] = solve_ytm(free_price, FACE_VALUE, years, coupon_rate, periods_per_year).ytm
+    results.loc[options.index, 'Effective Duration'] = (down - up) / (2 * price * shift)
+    results.loc[options.index, 'Effective Convexity'] = (down + up - 2 * price) / (price * shift ** 2)
+    results.loc[options.index, 'Option-Free Convexity'] = (free_down + free_up - 2 * free_price) / (free_price * shift ** 2)
+    results.loc[options.index, 'Effective DV01'] = (up - down) / (2 * shift_bp)
+
+    return results
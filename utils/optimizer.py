@@ -0,0 +1,233 @@
+# optimizer.py
+# |--- candidate_universe()
+# |--- optimize_portfolio()
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.optimize import Bounds, LinearConstraint, milp
+
+# Assumptions of portfolio_selection.ipynb
+LOSS_SEVERITY = 0.6
+MAX_PD_5Y_PCT = 10
+EXCLUDED_COUNTRIES = ['Lebanon', 'Armenia', 'Russia', 'Israel', 'Ukraine', 'Belarus', 'Venezuela']
+EXCLUDED_MTY_TYPES = ['CALLABLE', 'PUTABLE', 'CALL/SINK', 'CALL/PUT']
+TOTAL_PORTFOLIO_VALUE = 10_000_000
+
+# Columns of bonds-analyzed the optimizer needs for every candidate
+OPTIMIZER_COLUMNS = ['YTM - Ask', 'Buy Price', 'Modified Duration (Buy)', 'Convexity (Buy)', 'DV01', 'Percentage Spread']
+
+OptimizationResult = namedtuple('OptimizationResult', ['portfolio', 'objective', 'status', 'message'])
+
+# ==============================================================================================================
+# 1. candidate_universe()
+# ==============================================================================================================
+
+def candidate_universe(data, loss_severity=LOSS_SEVERITY, max_pd=MAX_PD_5Y_PCT, excluded_countries=EXCLUDED_COUNTRIES,
+                       excluded_mty_types=EXCLUDED_MTY_TYPES, ytm_range=None, price_options=False):
+    """
+    Apply the screening rules of portfolio_selection.ipynb to the analyzed bonds and add the default probability.
+
+    With price_options, callable and putable bonds are kept even if their maturity type is excluded: they are priced
+    on short-rate trees (see utils/lattice.py) and their 'YTM - Ask', 'Modified Duration (Buy)' and 'DV01' are
+    replaced by their option-adjusted yield, effective duration and effective DV01. Their 'Convexity (Buy)' is scaled
+    by the ratio of their effective to their option-free convexity, so it stays in the units of bond_math. Option
+    bonds that cannot be priced (e.g. of a country without a curve) are dropped.
+
+    Parameters:
+    - data (DataFrame): The analyzed bonds (processed_data/bonds-analyzed.parquet).
+    - loss_severity (float, optional): Loss given default used to turn the 5-yr CDS spread into a default probability. Default is 0.6.
+    - max_pd (float, optional): Bonds with a PD_5y_pct above this (in percent) are dropped; bonds without a CDS quote are kept. Default is 10.
+    - excluded_countries (list, optional): Countries that are not invested in. Default is EXCLUDED_COUNTRIES.
+    - excluded_mty_types (list, optional): Maturity types that are not invested in. Default is EXCLUDED_MTY_TYPES.
+    - ytm_range (tuple, optional): (lowest, highest) YTM - Ask in percent to keep, e.g. (0, 15). Default is None for all.
+    - price_options (bool, optional): Keep the callable and putable bonds with option-adjusted figures. Default is False.
+
+    Returns:
+    - DataFrame: The candidate bonds with a 'PD_5y_pct' column, and finite values in all OPTIMIZER_COLUMNS.
+    """
+
+    data = data.copy()
+
+    # probability of default using 5-yr CDS spreads
+    data['PD_5y_pct'] = data['Spread_5y'] / loss_severity / 100
+
+    if price_options:
+        # the lattice is only imported when option bonds are priced, so importing the optimizer stays fast
+        from utils.lattice import OPTION_MTY_TYPES, price_embedded_options
+
+        excluded_mty_types = [mty_type for mty_type in excluded_mty_types if mty_type not in OPTION_MTY_TYPES]
+        options = price_embedded_options(data)
+        replaced = ['YTM - Ask', 'Modified Duration (Buy)', 'DV01', 'Convexity (Buy)']
+        data[replaced] = data[replaced].astype(float)
+        data.loc[options.index, 'YTM - Ask'] = options['Option-Adjusted Yield']
+        data.loc[options.index, 'Modified Duration (Buy)'] = options['Effective Duration']
+        data.loc[options.index, 'DV01'] = options['Effective DV01']
+        data.loc[options.index, 'Convexity (Buy)'] *= options['Effective Convexity'] / options['Option-Free Convexity']
+
+    keep = ~(data['PD_5y_pct'] > max_pd)
+    keep &= ~data['Country'].isin(excluded_countries)
+    keep &= ~data['Mty Type'].isin(excluded_mty_types)
+    keep &= np.isfinite(data[OPTIMIZER_COLUMNS].apply(pd.to_numeric, errors='coerce')).all(axis=1)
+    keep &= data['Buy Price'] > 0
+    if ytm_range is not None:
+        keep &= data['YTM - Ask'].between(*ytm_range)
+
+    return data[keep]
+
+# ==============================================================================================================
+# 2. optimize_portfolio()
+# ==============================================================================================================
+
+def _group_matrix(labels):
+    """Sparse (groups x bonds) 0/1 matrix with a row per distinct label, and the labels of the rows."""
+    codes, groups = pd.factorize(labels)
+    valid = codes >= 0
+    matrix = sparse.csr_array((np.ones(valid.sum()), (codes[valid], np.flatnonzero(valid))), shape=(len(groups), len(labels)))
+    return matrix, groups
+
+
+def _match_holdings(candidates, current):
+    """Weights of the current portfolio on the candidates, matching bonds on issuer, maturity and coupon."""
+    keys = ['Issuer', 'Maturity', 'Cpn']
+    weights = current.assign(Maturity=pd.to_datetime(current['Maturity'])).groupby(keys, observed=True)['Share per Bond'].sum()
+    rows = candidates[keys].assign(Maturity=pd.to_datetime(candidates['Maturity']))
+
+    # a bond quoted on several rows of the universe has its weight split between them
+    duplicates = rows.groupby(keys, observed=True)['Cpn'].transform('size').to_numpy()
+    return weights.reindex(pd.MultiIndex.from_frame(rows)).fillna(0).to_numpy() / duplicates
+
+
+def optimize_portfolio(candidates, total_value=TOTAL_PORTFOLIO_VALUE, loss_severity=LOSS_SEVERITY,
+                       duration_range=None, convexity_range=None, max_dv01=None,
+                       max_country_weight=None, max_issuer_weight=None, max_bond_weight=None,
+                       max_percentage_spread=None, max_avg_percentage_spread=None,
+                       lot_size=None, min_invested=0.99, current=None, max_turnover=None, time_limit=60):
+    """
+    Select the portfolio that maximizes the weighted YTM net of expected loss under risk, concentration and
+    liquidity constraints, as one sparse linear program over the whole candidate universe.
+
+    The expected loss of a bond is PD_5y_pct * loss_severity (in percent per year, 0 for bonds without a CDS quote).
+    The decision variables are the number of lots of every bond; with a lot_size they are integers and the problem
+    is solved as a mixed integer program (HiGHS through scipy.optimize.milp). All portfolio figures are weighted by
+    the share of total_value invested in each bond, like calculate_portfolio_metrics().
+
+    With a current portfolio (e.g. portfolio.xlsx) the optimization is a rebalance: the current holdings are matched
+    to the candidates and max_turnover limits the sum of absolute weight changes. The current portfolio's objective
+    is reported alongside, so the gain of every rebalance is visible.
+
+    Parameters:
+    - candidates (DataFrame): The candidate bonds, e.g. from candidate_universe().
+    - total_value (float, optional): The amount to invest. Default is TOTAL_PORTFOLIO_VALUE.
+    - loss_severity (float, optional): Loss given default. Default is 0.6.
+    - duration_range (tuple, optional): (lowest, highest) portfolio modified duration. Default is None for no limit.
+    - convexity_range (tuple, optional): (lowest, highest) portfolio convexity. Default is None for no limit.
+    - max_dv01 (float, optional): Budget for the portfolio DV01 (sum of |DV01| x number of bonds). Default is None for no limit.
+    - max_country_weight (float, optional): Largest share of the portfolio per country. Default is None for no limit.
+    - max_issuer_weight (float, optional): Largest share of the portfolio per issuer. Default is None for no limit.
+    - max_bond_weight (float, optional): Largest share of the portfolio per bond. Default is None for no limit.
+    - max_percentage_spread (float, optional): Bonds with a larger 'Percentage Spread' are not bought. Default is None.
+    - max_avg_percentage_spread (float, optional): Largest weighted 'Percentage Spread' of the portfolio. Default is None.
+    - lot_size (int, optional): Bonds are bought in whole lots of this many bonds. Default is None for fractional holdings.
+    - min_invested (float, optional): Smallest share of total_value to invest (at most all of it). Default is 0.99.
+    - current (DataFrame, optional): The current portfolio, with 'Issuer', 'Maturity', 'Cpn' and 'Share per Bond' columns.
+    - max_turnover (float, optional): Largest sum of absolute weight changes against current. Default is None for no limit.
+    - time_limit (float, optional): Time limit for the solver in seconds. Default is 60.
+
+    Returns:
+    - OptimizationResult: Named tuple (portfolio, objective, status, message). portfolio holds the selected candidates
+                          with 'Share per Bond', 'Amount per Bond' and 'Number of Bond' columns (None if no solution
+                          was found); objective is a dict with the net yield of the selection and, with current, of
+                          the current portfolio; status and message are the solver's.
+    """
+
+    n_bonds = len(candidates)
+    price = candidates['Buy Price'].to_numpy(dtype=float)
+    net_yield = (candidates['YTM - Ask'] - candidates['PD_5y_pct'].fillna(0) * loss_severity).to_numpy(dtype=float)
+
+    # weight of one unit of each variable: one lot, or one bond for fractional holdings
+    bonds_per_unit = lot_size or 1
+    unit_weight = bonds_per_unit * price / total_value
+
+    # every constraint is linear in the weights, i.e. in the variables scaled by unit_weight
+    rows, lower, upper = [], [], []
+
+    def add(coefficients, low=-np.inf, high=np.inf):
+        rows.append(sparse.csr_array(coefficients) if sparse.issparse(coefficients) else sparse.csr_array(np.atleast_2d(coefficients)))
+        lower.extend(np.broadcast_to(low, rows[-1].shape[0]))
+        upper.extend(np.broadcast_to(high, rows[-1].shape[0]))
+
+    add(np.ones(n_bonds), min_invested, 1)
+    if duration_range is not None:
+        add(candidates['Modified Duration (Buy)'].to_numpy(dtype=float), *duration_range)
+    if convexity_range is not None:
+        add(candidates['Convexity (Buy)'].to_numpy(dtype=float), *convexity_range)
+    if max_dv01 is not None:
+        # DV01 per bond times the number of bonds held, the weight being (number of bonds x price) / total_value
+        add(np.abs(candidates['DV01'].to_numpy(dtype=float)) * total_value / price, high=max_dv01)
+    if max_avg_percentage_spread is not None:
+        add(candidates['Percentage Spread'].to_numpy(dtype=float), high=max_avg_percentage_spread)
+    if max_country_weight is not None:
+        add(_group_matrix(candidates['Country'].to_numpy())[0], high=max_country_weight)
+    if max_issuer_weight is not None:
+        add(_group_matrix(candidates['Issuer'].to_numpy())[0], high=max_issuer_weight)
+
+    weight_matrix = sparse.vstack(rows, format='csr') @ sparse.diags_array(unit_weight)
+    objective = -net_yield * unit_weight
+
+    # largest holding of each bond, in units
+    max_weight = np.full(n_bonds, 1.0 if max_bond_weight is None else max_bond_weight)
+    if max_percentage_spread is not None:
+        max_weight[candidates['Percentage Spread'].to_numpy(dtype=float) > max_percentage_spread] = 0
+    max_units = max_weight / unit_weight
+    if lot_size:
+        max_units = np.floor(max_units + 1e-9)
+    integrality = np.full(n_bonds, 1 if lot_size else 0)
+
+    current_weight = None
+    if current is not None:
+        current_weight = _match_holdings(candidates, current)
+
+    if current is not None and max_turnover is not None:
+        # |w - w0| <= t for every bond through auxiliary variables t, and sum(t) <= max_turnover
+        identity = sparse.eye_array(n_bonds, format='csr')
+        weight_matrix = sparse.block_array([
+            [weight_matrix, None],
+            [sparse.diags_array(unit_weight), -identity],
+            [sparse.diags_array(unit_weight), identity],
+            [None, sparse.csr_array(np.ones((1, n_bonds)))],
+        ], format='csr')
+        lower = np.concatenate([lower, np.full(n_bonds, -np.inf), current_weight, [-np.inf]])
+        upper = np.concatenate([upper, current_weight, np.full(n_bonds, np.inf), [max_turnover]])
+        objective = np.concatenate([objective, np.zeros(n_bonds)])
+        max_units = np.concatenate([max_units, np.full(n_bonds, np.inf)])
+        integrality = np.concatenate([integrality, np.zeros(n_bonds, dtype=int)])
+
+    result = milp(objective,
+                  constraints=LinearConstraint(weight_matrix, lower, upper),
+                  bounds=Bounds(0, max_units),
+                  integrality=integrality,
+                  options={'time_limit': time_limit})
+
+    objective_values = {}
+    if current_weight is not None:
+        objective_values['Current Net Yield'] = float(net_yield @ current_weight / current_weight.sum()) if current_weight.sum() else np.nan
+
+    if result.x is None:
+        return OptimizationResult(None, objective_values, result.status, result.message)
+
+    units = result.x[:n_bonds]
+    if lot_size:
+        units = np.round(units)
+    weights = units * unit_weight
+    selected = weights > 1e-9
+
+    portfolio = candidates[selected].copy()
+    portfolio['Share per Bond'] = weights[selected]
+    portfolio['Amount per Bond'] = portfolio['Share per Bond'] * total_value
+    portfolio['Number of Bond'] = units[selected] * bonds_per_unit
+    objective_values['Net Yield'] = float(net_yield[selected] @ weights[selected] / weights[selected].sum())
+
+    return OptimizationResult(portfolio, objective_values, result.status, result.message)
@@ -1,9 +1,172 @@
-import pandas as pd
-from utils.bond_math import *
+import numpy as np
+from utils.bond_math import KEY_RATES, compute_sensitivities
+from utils.instrumentation import stage
+
+# Key rate durations reported by calculate_portfolio_metrics(), one per key rate of compute_sensitivities()
+KEY_RATE_METRICS = [f'KRD {key_rate}y' for key_rate in KEY_RATES]
+
+# Metrics reported by calculate_portfolio_metrics(), in order; each is the weighted sum of a per-bond contribution
+PORTFOLIO_METRICS = ['YTM', 'Price', 'Coupon', 'Time-to-Maturity', 'Duration', 'Modified Duration', 'Convexity', 'DV01', 'Pct Bid-Ask Spread', '5-yr CDS Spread', 'PD_5y_pct'] + KEY_RATE_METRICS
+
+
+class PortfolioRiskState:
+    """
+    Portfolio metrics that can be updated trade by trade.
+
+    Every metric of calculate_portfolio_metrics() is a weighted sum over the bonds, so the per-bond contributions are
+    computed once and the portfolio totals are kept up to date on every add, remove or reweight: each update touches
+    one bond's contributions (O(number of metrics)) instead of rescanning the book. The input DataFrame is only read.
+    Missing values contribute 0 to their metric, so a bond without a CDS quote does not make the CDS metrics NaN.
+
+    To explore trades into bonds that are not held yet, build the state over a universe in which those bonds have a
+    weight of 0.
+
+    Parameters:
+    - portfolio_df (DataFrame): DataFrame containing bond portfolio data.
+    - weight_col (str): Column name for bond weight (% of invested portfolio).
+    - num_bonds_col (str): Column name for number of bonds.
+    - price_col (str): Column name for bond price.
+    - ytm_col (str): Column name for bond yield to maturity.
+    - maturity_col (str): Column name for years to maturity.
+    - coupon_col (str): Column name for coupon rate.
+    """
+
+    def __init__(self, portfolio_df, weight_col, num_bonds_col, price_col, ytm_col, maturity_col, coupon_col):
+        # Ensure required columns are present
+        required_columns = [weight_col, num_bonds_col, price_col, ytm_col, maturity_col, coupon_col]
+        if not set(required_columns).issubset(portfolio_df.columns):
+            raise ValueError("Missing required columns in the portfolio DataFrame.")
+
+        ytm = portfolio_df[ytm_col].to_numpy(dtype=float)
+        maturity = portfolio_df[maturity_col].to_numpy(dtype=float)
+
+        # DV01 and key rate durations of each bond in one pass over the cash flows, at the one yield of ytm_col
+        with stage('portfolio DV01') as record:
+            record['rows_in'] = len(portfolio_df)
+            sensitivities = compute_sensitivities(face_value=portfolio_df[price_col],
+                                                  years_to_maturity=maturity,
+                                                  ytm_bid=None,
+                                                  ytm_ask=ytm,
+                                                  coupon_rate=portfolio_df[coupon_col])
+            dv01 = np.round(sensitivities.dv01_ask, 3)
+            key_rate_durations = sensitivities.key_rate_durations
+
+        # per-bond contribution to each metric, one column per entry of PORTFOLIO_METRICS
+        contributions = np.column_stack([
+            ytm,
+            portfolio_df['Buy Price'].to_numpy(dtype=float),
+            portfolio_df['Cpn'].to_numpy(dtype=float),
+            portfolio_df['Years to Maturity'].to_numpy(dtype=float),
+            maturity,
+            maturity / (1 + (ytm / 100)),
+            maturity * (maturity + 1) / (1 + (ytm / 100))**2,
+            dv01,
+            portfolio_df['Percentage Spread'].to_numpy(dtype=float),
+            portfolio_df['Spread_5y'].to_numpy(dtype=float),
+            portfolio_df['PD_5y_pct'].to_numpy(dtype=float),
+            key_rate_durations,
+        ])
+
+        # a missing value (e.g. the CDS spread of a bond without a CDS quote) adds nothing to its metric, as the
+        # weighted pandas sums skipped it, instead of making the portfolio total NaN
+        self._contributions = np.where(np.isnan(contributions), 0.0, contributions)
+
+        self.index = portfolio_df.index
+        self._positions = {label: position for position, label in enumerate(portfolio_df.index)}
+        self.weights = portfolio_df[weight_col].to_numpy(dtype=float).copy()
+        self._totals = self.weights @ self._contributions
+
+    def _position(self, bond):
+        return self._positions[bond]
+
+    @property
+    def contributions(self):
+        """
+        The per-bond contributions, one row per bond of portfolio_df and one column per entry of PORTFOLIO_METRICS.
+        The metrics of any weights w over the same bonds are w @ contributions. The array is read-only.
+        """
+
+        contributions = self._contributions.view()
+        contributions.flags.writeable = False
+        return contributions
+
+    def add(self, bond, weight):
+        """
+        Buy more of a bond.
+
+        Parameters:
+        - bond: Index label of the bond in portfolio_df.
+        - weight (float): Weight to add (negative to sell part of the holding).
+        """
+
+        position = self._position(bond)
+        self.weights[position] += weight
+        self._totals += weight * self._contributions[position]
+
+    def remove(self, bond):
+        """
+        Sell a bond entirely.
+
+        Parameters:
+        - bond: Index label of the bond in portfolio_df.
+
+        Returns:
+        - float: The weight the bond had.
+        """
+
+        weight = self.weights[self._position(bond)]
+        self.add(bond, -weight)
+        return weight
+
+    def reweight(self, bond, weight):
+        """
+        Set the weight of a bond.
+
+        Parameters:
+        - bond: Index label of the bond in portfolio_df.
+        - weight (float): The new weight.
+        """
+
+        self.add(bond, weight - self.weights[self._position(bond)])
+
+    def swap(self, sold, bought):
+        """
+        Sell a bond entirely and put its weight into another one.
+
+        Parameters:
+        - sold: Index label of the bond to sell.
+        - bought: Index label of the bond to buy.
+        """
+
+        self.add(bought, self.remove(sold))
+
+    def totals(self):
+        """
+        Return the current portfolio metrics as a dict, in the units of the 'Value' column of calculate_portfolio_metrics().
+
+        Returns:
+        - dict: Metric name -> value.
+        """
+
+        return dict(zip(PORTFOLIO_METRICS, self._totals))
+
+    def metrics(self):
+        """
+        Return the current portfolio metrics as the DataFrame of calculate_portfolio_metrics().
+
+        Returns:
+        - DataFrame: 'Metric' and 'Value' columns.
+        """
+
+        # pandas is only imported once a frame is built, so that importing the module stays fast
+        import pandas as pd
+
+        return pd.DataFrame({'Metric': PORTFOLIO_METRICS, 'Value': self._totals.copy()})
+
 
 def calculate_portfolio_metrics(portfolio_df, weight_col, num_bonds_col, price_col, ytm_col, maturity_col, coupon_col):
     """
-    Calculate portfolio metrics for a bond portfolio.
+    Calculate portfolio metrics for a bond portfolio. The input DataFrame is not modified.
 
     Parameters:
     - portfolio_df (DataFrame): DataFrame containing bond portfolio data.
@@ -15,40 +178,8 @@ def calculate_portfolio_metrics(portfolio_df, weight_col, num_bonds_col, price_c
     - coupon_col (str): Column name for coupon rate.
 
     Returns:
-    - dict: Dictionary containing portfolio metrics (YTM, duration, modified duration, convexity, dv01).
+    - DataFrame: Portfolio metrics (YTM, price, coupon, time-to-maturity, duration, modified duration, convexity, dv01,
+                 bid-ask spread, CDS spread, PD and the key rate durations of KEY_RATE_METRICS) in 'Metric' and 'Value' columns.
     """
 
-    # Ensure required columns are present
-    required_columns = [weight_col, num_bonds_col, price_col, ytm_col, maturity_col, coupon_col]
-    if not set(required_columns).issubset(portfolio_df.columns):
-        raise ValueError("Missing required columns in the portfolio DataFrame.")
-
-    # Calculate weighted averages for portfolio metrics
-    weighted_ytm = (portfolio_df[weight_col] / 100 * portfolio_df[ytm_col]).sum()
-    weighted_duration = (portfolio_df[weight_col] / 100 * portfolio_df[maturity_col]).sum()
-    weighted_modified_duration   =  (portfolio_df[weight_col] / 100 * portfolio_df[maturity_col] /
-                                    (1 + (portfolio_df[ytm_col] / 100))).sum()
-    weighted_convexity = (portfolio_df[weight_col] / 100 * (portfolio_df[maturity_col] * (portfolio_df[maturity_col] + 1) /
-                                (1 + (portfolio_df[ytm_col] / 100))**2)).sum()
-
-    # Calculate dv01 for each bond and sum for the portfolio
-    portfolio_df['dv01'] = portfolio_df.apply(lambda row:    calculate_dv01(row[price_col], row[coupon_col],
-                                                                            row[maturity_col], row[ytm_col]), axis=1)
-    total_dv01 = (portfolio_df[weight_col] / 100 * portfolio_df['dv01']).sum()
-
-    # Calculate weighted averages for additional metrics
-    weighted_buy_price = (portfolio_df[weight_col] / 100 * portfolio_df['Buy Price']).sum()
-    weighted_years_to_maturity = (portfolio_df[weight_col] / 100 * portfolio_df['Years to Maturity']).sum()
-    weighted_percentage_spread = (portfolio_df[weight_col] / 100 * portfolio_df['Percentage Spread']).sum()
-    weighted_cpn = (portfolio_df[weight_col] / 100 * portfolio_df['Cpn']).sum() 
-    weighted_spread_5y = (portfolio_df[weight_col] / 100 * portfolio_df['Spread_5y']).sum()
-    weighted_pd_5y_pct = (portfolio_df[weight_col] / 100 * portfolio_df['PD_5y_pct']).sum()
-
-    # Add the new metric to the DataFrame
-    portfolio_metrics_df = pd.DataFrame({
-        'Metric': ['YTM', 'Price', 'Coupon', 'Time-to-Maturity', 'Duration', 'Modified Duration', 'Convexity', 'DV01', 'Pct Bid-Ask Spread', '5-yr CDS Spread', 'PD_5y_pct'],
-        'Value': [weighted_ytm, weighted_buy_price, weighted_cpn, weighted_years_to_maturity, weighted_duration, weighted_modified_duration, weighted_convexity, total_dv01, weighted_percentage_spread, weighted_spread_5y, weighted_pd_5y_pct]
-    })
-    portfolio_metrics_df['Value'] = portfolio_metrics_df['Value'] * 100
-
-    return portfolio_metrics_df
\ No newline at end of file
+    return PortfolioRiskState(portfolio_df, weight_col, num_bonds_col, price_col, ytm_col, maturity_col, coupon_col).metrics()
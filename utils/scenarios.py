@@ -0,0 +1,279 @@
+# scenarios.py
+# |--- parallel_shifts()
+# |--- twists()
+# |--- butterflies()
+# |--- historical_replay()
+# |--- reprice_scenarios()
+# |--- summarize_pnl()
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from utils.bond_math import compute_bond_risk, _as_arrays, _discount_matrix, _period_grid
+
+# Number of scenarios repriced at once; bounds the size of the temporary (scenarios x bonds) arrays
+SCENARIO_CHUNK = 256
+
+# ==============================================================================================================
+# 1. parallel_shifts()
+# ==============================================================================================================
+
+def parallel_shifts(shifts_bp, years_to_maturity):
+    """
+    Build a (scenarios x bonds) matrix of yield bumps where every bond moves by the same amount.
+
+    Parameters:
+    - shifts_bp (array-like): The shift of each scenario in basis points, e.g. [-100, -50, 50, 100].
+    - years_to_maturity (array-like): The years to maturity of each bond.
+
+    Returns:
+    - ndarray: The yield bumps in basis points, shape (len(shifts_bp), len(years_to_maturity)).
+    """
+
+    shifts_bp = np.asarray(shifts_bp, dtype=float)
+    return np.repeat(shifts_bp[:, np.newaxis], len(np.atleast_1d(years_to_maturity)), axis=1)
+
+# ==============================================================================================================
+# 2. twists()
+# ==============================================================================================================
+
+def twists(amounts_bp, years_to_maturity, pivot=5, span=10):
+    """
+    Build a (scenarios x bonds) matrix of yield bumps that rotate the curve around a pivot maturity.
+    A positive amount steepens the curve: bonds span years beyond the pivot move up by the amount, bonds
+    span years before it move down by the amount, and maturities in between are interpolated linearly.
+
+    Parameters:
+    - amounts_bp (array-like): The size of each twist in basis points.
+    - years_to_maturity (array-like): The years to maturity of each bond.
+    - pivot (float, optional): The maturity that does not move. Default is 5 years.
+    - span (float, optional): The distance from the pivot at which the full amount is reached. Default is 10 years.
+
+    Returns:
+    - ndarray: The yield bumps in basis points, shape (len(amounts_bp), len(years_to_maturity)).
+    """
+
+    amounts_bp = np.asarray(amounts_bp, dtype=float)
+    shape = np.clip((np.asarray(years_to_maturity, dtype=float) - pivot) / span, -1, 1)
+    return amounts_bp[:, np.newaxis] * shape[np.newaxis, :]
+
+# ==============================================================================================================
+# 3. butterflies()
+# ==============================================================================================================
+
+def butterflies(amounts_bp, years_to_maturity, belly=5, span=5):
+    """
+    Build a (scenarios x bonds) matrix of yield bumps that move the belly of the curve against the wings.
+    A positive amount moves the belly down by the amount and the wings (span years or more away from the
+    belly) up by the amount, linearly in between.
+
+    Parameters:
+    - amounts_bp (array-like): The size of each butterfly in basis points.
+    - years_to_maturity (array-like): The years to maturity of each bond.
+    - belly (float, optional): The maturity at the center of the belly. Default is 5 years.
+    - span (float, optional): The distance from the belly at which the wings start. Default is 5 years.
+
+    Returns:
+    - ndarray: The yield bumps in basis points, shape (len(amounts_bp), len(years_to_maturity)).
+    """
+
+    amounts_bp = np.asarray(amounts_bp, dtype=float)
+    shape = 2 * np.clip(np.abs(np.asarray(years_to_maturity, dtype=float) - belly) / span, 0, 1) - 1
+    return amounts_bp[:, np.newaxis] * shape[np.newaxis, :]
+
+# ==============================================================================================================
+# 4. historical_replay()
+# ==============================================================================================================
+
+def historical_replay(yield_changes, years_to_maturity):
+    """
+    Build a (scenarios x bonds) matrix of yield bumps by replaying historical yield curve changes.
+    Each row of yield_changes is one scenario (e.g. one day); its changes at the tenors are interpolated
+    linearly to the maturity of every bond (flat beyond the first and last tenor).
+
+    Parameters:
+    - yield_changes (DataFrame): Yield changes in basis points, one row per scenario and one column per tenor
+                                 in years, e.g. columns [1, 2, 5, 10, 30].
+    - years_to_maturity (array-like): The years to maturity of each bond.
+
+    Returns:
+    - ndarray: The yield bumps in basis points, shape (len(yield_changes), len(years_to_maturity)).
+    """
+
+    tenors = np.asarray(yield_changes.columns, dtype=float)
+    order = np.argsort(tenors)
+    tenors = tenors[order]
+    changes = yield_changes.to_numpy(dtype=float)[:, order]
+
+    # the interpolation weights only depend on the maturities, so compute them once as a (tenors x bonds) matrix
+    years_to_maturity = np.clip(np.asarray(years_to_maturity, dtype=float), tenors[0], tenors[-1])
+    upper = np.clip(np.searchsorted(tenors, years_to_maturity, side='right'), 1, len(tenors) - 1)
+    lower = upper - 1
+    width = tenors[upper] - tenors[lower]
+    upper_weight = np.where(width > 0, (years_to_maturity - tenors[lower]) / np.where(width > 0, width, 1), 0)
+
+    weights = np.zeros((len(tenors), len(years_to_maturity)))
+    bonds = np.arange(len(years_to_maturity))
+    np.add.at(weights, (lower, bonds), 1 - upper_weight)
+    np.add.at(weights, (upper, bonds), upper_weight)
+
+    return changes @ weights
+
+# ==============================================================================================================
+# 5. reprice_scenarios()
+# ==============================================================================================================
+
+ScenarioResult = namedtuple('ScenarioResult', ['base_price', 'pnl', 'portfolio_pnl', 'approx_pnl', 'portfolio_approx_pnl'])
+
+
+def _annuity_price(face_value, coupon_payment, rate, n_periods, out=None):
+    """
+    Price of level coupon bonds from the closed form of the coupon annuity, face_value * v**n + coupon_payment *
+    (1 - v**n) / rate with v = 1 / (1 + rate), for a (scenarios x bonds) matrix of per-period yields. Equal to
+    summing the discounted cash flows as in bond_math, but O(1) per bond and scenario. The work is done in place
+    in rate and out.
+    """
+
+    zero_rate = ~rate.astype(bool)
+
+    # out = v**n
+    out = np.log1p(rate, out=out)
+    out *= -n_periods
+    np.exp(out, out=out)
+
+    # rate = coupon_payment / rate, then out = rate + v**n * (face_value - rate)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(coupon_payment, rate, out=rate)
+        out *= face_value - rate
+        out += rate
+
+    # without discounting the price is the sum of the cash flows
+    if zero_rate.any():
+        undiscounted = np.broadcast_to(face_value + coupon_payment * n_periods, out.shape)
+        out[zero_rate] = undiscounted[zero_rate]
+
+    return out
+
+
+def _price_curvature(face_value, coupon_payment, rate, periods, pricing_periods, periods_per_year):
+    """
+    Second derivative of the price in the yield (in decimals) for the periods and compounding of _annuity_price(),
+    sum(k * (k + 1) * CF_k * v**(k + 2)) / periods_per_year**2 with v = 1 / (1 + rate), per bond.
+    """
+
+    discount_factors = _discount_matrix(1 / (1 + rate), periods.shape[1])
+    rows = np.arange(len(rate))
+
+    coupon_term = np.where(periods <= pricing_periods[:, np.newaxis],
+                           periods * (periods + 1) * discount_factors[:, 1:], 0).sum(axis=1) * coupon_payment
+    face_term = pricing_periods * (pricing_periods + 1) * discount_factors[rows, pricing_periods] * face_value
+
+    return (coupon_term + face_term) / (1 + rate) ** 2 / periods_per_year ** 2
+
+
+def reprice_scenarios(face_value, years_to_maturity, ytm, coupon_rate, bumps_bp, quantity=1, periods_per_year=2, return_cube=True):
+    """
+    Reprice every bond under every yield scenario and compare with the duration/convexity approximation.
+
+    The bonds are priced as in calculate_bond_price() (same periods and compounding), using the closed form of
+    the coupon annuity, so a scenario costs a handful of array operations over the bonds instead of a loop over
+    cash flows. Scenarios are processed in chunks of SCENARIO_CHUNK, reusing the same buffers, to bound memory.
+
+    The approximation is the second order expansion dP = dP/dy * dy + 0.5 * d2P/dy2 * dy**2, with dy in decimals,
+    the first derivative from the DV01 of compute_bond_risk() and the second from the same cash flows as the
+    repricing. The modified duration and convexity of compute_bond_risk() are not used: for zero coupon bonds they
+    keep the notebook's conventions and do not match the repricing.
+
+    Parameters:
+    - face_value (array-like): The face value of each bond.
+    - years_to_maturity (array-like): The years to maturity of each bond.
+    - ytm (array-like): The Yield to Maturity (YTM) of each bond in percent, e.g. 'YTM - Bid' to mark holdings.
+    - coupon_rate (array-like): The annual coupon rate of each bond (0 for zero coupon bonds).
+    - bumps_bp (array-like): Yield bumps in basis points, shape (scenarios x bonds), e.g. from parallel_shifts().
+    - quantity (array-like, optional): Number of bonds held of each bond. Default is 1.
+    - periods_per_year (array-like, optional): Number of compounding periods per year. Default is 2.
+    - return_cube (bool, optional): If False, the (scenarios x bonds) P&L matrices are not kept, only the
+                                    portfolio P&L. Default is True.
+
+    Returns:
+    - ScenarioResult: Named tuple with base_price (bonds), pnl and approx_pnl (scenarios x bonds, None if
+                      return_cube is False) and portfolio_pnl and portfolio_approx_pnl (scenarios).
+    """
+
+    face_value, years_to_maturity, ytm, coupon_rate, quantity, periods_per_year = _as_arrays(
+        face_value, years_to_maturity, ytm, coupon_rate, quantity, periods_per_year)
+    bumps_bp = np.atleast_2d(np.asarray(bumps_bp, dtype=float))
+    n_scenarios, n_bonds = bumps_bp.shape
+
+    periods, _, pricing_periods = _period_grid(years_to_maturity, periods_per_year)
+    coupon_payment = (face_value * coupon_rate / 100) / periods_per_year
+
+    # per-period yields, and the change of the per-period yield for a 1 basis point (0.01 YTM percent) bump
+    base_rate = ytm / (100 * periods_per_year)
+    rate_per_bp = 1 / (100 * 100 * periods_per_year)
+
+    base_price = _annuity_price(face_value, coupon_payment, base_rate.copy(), pricing_periods)
+    base_value = base_price @ quantity
+
+    # the approximation is linear in dy and dy**2, so the portfolio figure is two matrix-vector products
+    risk = compute_bond_risk(face_value, years_to_maturity, ytm, coupon_rate, periods_per_year)
+    dollar_duration = -quantity * risk.dv01 * 10000
+    half_dollar_convexity = 0.5 * quantity * _price_curvature(face_value, coupon_payment, base_rate, periods,
+                                                               pricing_periods, periods_per_year)
+
+    pnl = np.empty((n_scenarios, n_bonds)) if return_cube else None
+    approx_pnl = np.empty((n_scenarios, n_bonds)) if return_cube else None
+    portfolio_pnl = np.empty(n_scenarios)
+    portfolio_approx_pnl = np.empty(n_scenarios)
+
+    rate_buffer = np.empty((min(SCENARIO_CHUNK, n_scenarios), n_bonds))
+    price_buffer = np.empty_like(rate_buffer)
+
+    for start in range(0, n_scenarios, SCENARIO_CHUNK):
+        stop = min(start + SCENARIO_CHUNK, n_scenarios)
+        bumps = bumps_bp[start:stop]
+        rate, price = rate_buffer[:stop - start], price_buffer[:stop - start]
+
+        np.multiply(bumps, rate_per_bp, out=rate)
+        rate += base_rate
+        _annuity_price(face_value, coupon_payment, rate, pricing_periods, out=price)
+        portfolio_pnl[start:stop] = price @ quantity - base_value
+
+        dy = np.multiply(bumps, 1 / 10000, out=rate)
+        portfolio_approx_pnl[start:stop] = dy**2 @ half_dollar_convexity - dy @ dollar_duration
+
+        if return_cube:
+            np.subtract(price, base_price, out=pnl[start:stop])
+            pnl[start:stop] *= quantity
+            np.multiply(dy, half_dollar_convexity, out=approx_pnl[start:stop])
+            approx_pnl[start:stop] -= dollar_duration
+            approx_pnl[start:stop] *= dy
+
+    return ScenarioResult(base_price, pnl, portfolio_pnl, approx_pnl, portfolio_approx_pnl)
+
+# ==============================================================================================================
+# 6. summarize_pnl()
+# ==============================================================================================================
+
+def summarize_pnl(result, percentiles=(95, 99)):
+    """
+    Summarize the portfolio P&L distribution of reprice_scenarios() and the error of the approximation.
+
+    Parameters:
+    - result (ScenarioResult): The output of reprice_scenarios().
+    - percentiles (tuple, optional): Loss percentiles to report. Default is (95, 99).
+
+    Returns:
+    - DataFrame: Metric / Full Repricing / Duration-Convexity columns; losses are reported as positive numbers.
+    """
+
+    metrics = ['Mean P&L', 'Worst Loss'] + [f'{p}th Percentile Loss' for p in percentiles] + ['Max Abs Error vs Full Repricing']
+    columns = {}
+    for label, portfolio_pnl in (('Full Repricing', result.portfolio_pnl), ('Duration-Convexity', result.portfolio_approx_pnl)):
+        losses = -portfolio_pnl
+        columns[label] = ([portfolio_pnl.mean(), losses.max()]
+                          + [np.percentile(losses, p) for p in percentiles]
+                          + [np.abs(portfolio_pnl - result.portfolio_pnl).max()])
+
+    return pd.DataFrame({'Metric': metrics, **columns})
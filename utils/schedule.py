@@ -0,0 +1,225 @@
+# schedule.py
+# |--- coupon_schedule()
+# |--- build_schedules()
+# |--- accrued_interest()
+# |--- price_with_schedules()
+
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from utils.schema import AS_OF_DATE
+
+# Supported day count conventions
+DAY_COUNTS = ('30/360', 'ACT/ACT', 'ACT/360')
+
+# Number of (maturity, frequency, convention, settle) schedules kept by coupon_schedule()
+SCHEDULE_CACHE_SIZE = 65_536
+
+# The remaining coupon dates of one bond, how much of the current coupon has accrued and the time to the next
+# coupon as a fraction of a coupon period
+Schedule = namedtuple('Schedule', ['coupon_dates', 'previous_coupon', 'accrued_fraction', 'period_offset'])
+
+# The schedules of a batch of bonds as flat arrays, one entry per bond
+BondSchedules = namedtuple('BondSchedules', ['n_coupons', 'accrued_fraction', 'period_offset', 'next_coupon',
+                                             'years_to_maturity', 'frequency', 'convention'])
+
+SchedulePrice = namedtuple('SchedulePrice', ['dirty', 'clean', 'accrued'])
+
+# ==============================================================================================================
+# 1. coupon_schedule()
+# ==============================================================================================================
+
+def _ymd(dates):
+    """Year, month (1-12) and day (1-31) of datetime64[D] values."""
+    months = dates.astype('datetime64[M]')
+    return (dates.astype('datetime64[Y]').astype(int) + 1970,
+            months.astype(int) % 12 + 1,
+            (dates - months.astype('datetime64[D]')).astype(int) + 1)
+
+
+def _day_count(start, end, convention):
+    """Number of days from start to end: 30/360 (bond basis) days, or actual days."""
+    if convention == '30/360':
+        y1, m1, d1 = _ymd(start)
+        y2, m2, d2 = _ymd(end)
+        d1 = np.minimum(d1, 30)
+        d2 = np.where(d1 == 30, np.minimum(d2, 30), d2)
+        return 360 * (y2 - y1) + 30 * (m2 - m1) + (d2 - d1)
+    return (end - start).astype(int)
+
+
+@lru_cache(maxsize=SCHEDULE_CACHE_SIZE)
+def _cached_schedule(maturity, frequency, convention, settle):
+    maturity, settle = np.datetime64(maturity, 'D'), np.datetime64(settle, 'D')
+    if maturity <= settle:
+        return Schedule(np.array([], dtype='datetime64[D]'), None, np.nan, np.nan)
+
+    # roll back from the maturity in steps of whole months, keeping its day (or the month end, if it is one)
+    months_per_period = 12 // frequency
+    maturity_month = maturity.astype('datetime64[M]')
+    months_to_settle = (maturity_month - settle.astype('datetime64[M]')).astype(int)
+    periods_back = np.arange(months_to_settle // months_per_period + 2, -1, -1)
+
+    months = maturity_month - periods_back * months_per_period
+    month_starts = months.astype('datetime64[D]')
+    month_lengths = ((months + 1).astype('datetime64[D]') - month_starts).astype(int)
+    day = _ymd(maturity)[2]
+    end_of_month = day == ((maturity_month + 1).astype('datetime64[D]') - maturity_month.astype('datetime64[D]')).astype(int)
+    dates = month_starts + (month_lengths if end_of_month else np.minimum(day, month_lengths)) - 1
+
+    coupon_dates = dates[dates > settle]
+    coupon_dates.flags.writeable = False
+    previous_coupon, next_coupon = dates[dates <= settle][-1], coupon_dates[0]
+
+    # length of the current coupon period in the convention's days
+    if convention == 'ACT/ACT':
+        period_days = _day_count(previous_coupon, next_coupon, convention)
+    else:
+        period_days = 360 / frequency
+
+    return Schedule(coupon_dates, previous_coupon,
+                    _day_count(previous_coupon, settle, convention) / period_days,
+                    _day_count(settle, next_coupon, convention) / period_days)
+
+
+def coupon_schedule(maturity, frequency=2, convention='30/360', settle=AS_OF_DATE):
+    """
+    Generate the remaining coupon dates of a bond, rolled back from its maturity in steps of 12 / frequency months
+    (a maturity on a month end pays on month ends), and the accrual of its current coupon period.
+
+    Schedules are memoized by (maturity, frequency, convention, settle), so repricing the same bonds, e.g. across
+    scenarios, reuses them. The returned arrays are read-only.
+
+    The accrued fraction is the share of the current coupon that has accrued at settle and the period offset is the
+    time from settle to the next coupon in coupon periods: days / (360 / frequency) for 30/360 and ACT/360, and days
+    over the actual days of the coupon period for ACT/ACT (ICMA).
+
+    Parameters:
+    - maturity (date-like): Maturity date of the bond.
+    - frequency (int, optional): Coupons per year, a divisor of 12. Default is 2.
+    - convention (str, optional): Day count convention, one of DAY_COUNTS. Default is '30/360'.
+    - settle (date-like, optional): Settlement date. Default is AS_OF_DATE.
+
+    Returns:
+    - Schedule: Named tuple (coupon_dates, previous_coupon, accrued_fraction, period_offset). A bond that matured on
+                or before settle has no coupon dates and NaN fractions.
+    """
+
+    if convention not in DAY_COUNTS:
+        raise ValueError(f"Unknown day count convention {convention!r}, expected one of {DAY_COUNTS}.")
+    if frequency <= 0 or 12 % frequency:
+        raise ValueError(f"The coupon frequency must divide 12, got {frequency}.")
+
+    # the cache is keyed on plain day numbers so that equal dates of any type hit the same entry
+    maturity_day = int(pd.Timestamp(maturity).to_datetime64().astype('datetime64[D]').astype(int))
+    settle_day = int(pd.Timestamp(settle).to_datetime64().astype('datetime64[D]').astype(int))
+
+    return _cached_schedule(maturity_day, int(frequency), convention, settle_day)
+
+# ==============================================================================================================
+# 2. build_schedules()
+# ==============================================================================================================
+
+def build_schedules(maturities, frequency=2, convention='30/360', settle=AS_OF_DATE):
+    """
+    Build the schedules of a batch of bonds as flat arrays. Each distinct maturity goes through coupon_schedule()
+    once, so a universe with many bonds per maturity date only generates a few thousand schedules.
+
+    Parameters:
+    - maturities (array-like): Maturity dates, e.g. the 'Maturity' column of bonds-data.
+    - frequency (int, optional): Coupons per year, a divisor of 12. Default is 2.
+    - convention (str, optional): Day count convention, one of DAY_COUNTS. Default is '30/360'.
+    - settle (date-like, optional): Settlement date. Default is AS_OF_DATE.
+
+    Returns:
+    - BondSchedules: Named tuple of per-bond arrays: the number of remaining coupons, the accrued fraction and period
+                     offset (see coupon_schedule()), the next coupon date and the exact years to maturity
+                     ((n_coupons - 1 + period_offset) / frequency), plus the frequency and convention used.
+    """
+
+    maturities = pd.to_datetime(pd.Series(maturities)).to_numpy().astype('datetime64[D]')
+    unique_maturities, inverse = np.unique(maturities, return_inverse=True)
+
+    n_unique = len(unique_maturities)
+    n_coupons = np.zeros(n_unique, dtype=np.int32)
+    accrued_fraction = np.full(n_unique, np.nan)
+    period_offset = np.full(n_unique, np.nan)
+    next_coupon = np.full(n_unique, np.datetime64('NaT'), dtype='datetime64[D]')
+
+    for i, maturity in enumerate(unique_maturities):
+        if np.isnat(maturity):
+            continue
+        schedule = coupon_schedule(maturity, frequency=frequency, convention=convention, settle=settle)
+        n_coupons[i] = len(schedule.coupon_dates)
+        accrued_fraction[i], period_offset[i] = schedule.accrued_fraction, schedule.period_offset
+        if n_coupons[i]:
+            next_coupon[i] = schedule.coupon_dates[0]
+
+    years_to_maturity = (n_coupons - 1 + period_offset) / frequency
+
+    return BondSchedules(n_coupons[inverse], accrued_fraction[inverse], period_offset[inverse], next_coupon[inverse],
+                         years_to_maturity[inverse], frequency, convention)
+
+# ==============================================================================================================
+# 3. accrued_interest()
+# ==============================================================================================================
+
+def accrued_interest(face_value, coupon_rate, schedules):
+    """
+    Interest accrued since the last coupon date, per bond.
+
+    Parameters:
+    - face_value (float or array-like): Face value of the bonds.
+    - coupon_rate (float or array-like): Annual coupon rates (in percentage).
+    - schedules (BondSchedules): The schedules of the bonds, from build_schedules().
+
+    Returns:
+    - ndarray: The accrued interest of each bond.
+    """
+
+    coupon_payment = np.asarray(face_value, dtype=float) * np.asarray(coupon_rate, dtype=float) / 100 / schedules.frequency
+    return coupon_payment * schedules.accrued_fraction
+
+# ==============================================================================================================
+# 4. price_with_schedules()
+# ==============================================================================================================
+
+def price_with_schedules(face_value, coupon_rate, ytm, schedules):
+    """
+    Dirty price, clean price and accrued interest of bonds from their exact schedules.
+
+    Every cash flow is discounted at the periodic yield ytm / 100 / frequency over its (fractional) number of periods
+    from settle, so the k-th remaining coupon is discounted over k - 1 + period_offset periods. The sum over the
+    coupons is evaluated in closed form, so the cost does not depend on the maturity, and ytm may carry a leading
+    scenario axis (shape (scenarios, bonds)) to reprice the same schedules under many yield scenarios at once.
+
+    Parameters:
+    - face_value (float or array-like): Face value of the bonds.
+    - coupon_rate (float or array-like): Annual coupon rates (in percentage).
+    - ytm (float or array-like): Yields to maturity (in percentage), per bond or per scenario and bond.
+    - schedules (BondSchedules): The schedules of the bonds, from build_schedules().
+
+    Returns:
+    - SchedulePrice: Named tuple (dirty, clean, accrued) of arrays broadcast to the shape of ytm. Bonds that have
+                     matured by the settlement date are NaN.
+    """
+
+    face_value = np.asarray(face_value, dtype=float)
+    coupon_payment = face_value * np.asarray(coupon_rate, dtype=float) / 100 / schedules.frequency
+    rate = np.asarray(ytm, dtype=float) / 100 / schedules.frequency
+    n_coupons = np.where(schedules.n_coupons > 0, schedules.n_coupons, np.nan)
+    offset = schedules.period_offset
+
+    # sum of (1 + r)^-(k - 1 + offset) for k = 1..n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = 1 + rate
+        annuity = np.where(rate == 0, n_coupons,
+                           growth ** (1 - offset) * (1 - growth ** -n_coupons) / rate)
+        dirty = coupon_payment * annuity + face_value * growth ** -(n_coupons - 1 + offset)
+
+    accrued = coupon_payment * schedules.accrued_fraction
+    dirty, accrued = np.broadcast_arrays(dirty, accrued)
+
+    return SchedulePrice(dirty, dirty - accrued, np.array(accrued))
@@ -0,0 +1,109 @@
+# schema.py
+# |--- apply_schema()
+# |--- memory_report()
+
+import pandas as pd
+
+# Every bond is analyzed with the same face value, so it is a constant and not a column
+FACE_VALUE = 1000
+
+# The date the bonds data was sampled on: the default pricing and settlement date of every module and script
+AS_OF_DATE = '2023-11-24'
+
+# Columns that are not stored: constant columns, and the CDS names, which repeat 'Country' for every matched bond
+DROPPED_COLUMNS = ['Face Value', 'Name_10y', 'Name_5y', 'Name_2y']
+
+# Repeated strings: a few hundred distinct values over all bonds
+CATEGORY_COLUMNS = ['Issuer', 'Ticker', 'Series', 'BBG Composite', 'Mty Type', 'Currency', 'Country']
+
+# CDS statistics are quoted with at most 2 decimals, float32 keeps them exactly enough
+CDS_COLUMNS = [f'{statistic}_{tenor}' for tenor in ('10y', '5y', '2y')
+               for statistic in ('Spread', 'Change', 'SD', 'Low', 'High', 'Avg', '3M +/-', '3M Chg')]
+
+# Declared dtypes of the stored tables. Yields, amounts and prices stay float64: bond prices are computed from the
+# yields and the price columns are compared to 3 decimals, which float32 cannot guarantee for prices above 1000.
+BONDS_DATA_SCHEMA = {
+    **{col: 'category' for col in CATEGORY_COLUMNS},
+    'Amt Out': 'float64',
+    'Cpn': 'float64',
+    'Maturity': 'datetime64[ns]',
+    'YTM - Ask': 'float64',
+    'YTM - Bid': 'float64',
+    **{col: 'float32' for col in CDS_COLUMNS},
+}
+
+BONDS_ANALYZED_SCHEMA = {
+    **BONDS_DATA_SCHEMA,
+    'Years to Maturity': 'int8',
+    'Buy Price': 'float64',
+    'Sell Price': 'float64',
+    'Macaulay Duration (Buy)': 'float32',
+    'Macaulay Duration (Sell)': 'float32',
+    'Modified Duration (Buy)': 'float32',
+    'Modified Duration (Sell)': 'float32',
+    'Convexity (Buy)': 'float32',
+    'Convexity (Sell)': 'float32',
+    'DV01': 'float32',
+    'Buy-Sell Spread': 'float64',
+    'Percentage Spread': 'float32',
+}
+
+SCHEMAS = {
+    'bonds-data': BONDS_DATA_SCHEMA,
+    'bonds-analyzed': BONDS_ANALYZED_SCHEMA,
+}
+
+# ==============================================================================================================
+# 1. apply_schema()
+# ==============================================================================================================
+
+def apply_schema(df, table):
+    """
+    Return df with the declared dtypes of a table: categoricals for repeated strings, float32 where the precision
+    allows, and without the constant and redundant DROPPED_COLUMNS. Columns the schema does not declare are kept as
+    they are, and declared columns that df does not have (e.g. when only some columns were loaded) are ignored.
+
+    Parameters:
+    - df (DataFrame): The data.
+    - table (str): Name of the table whose schema to apply, a key of SCHEMAS.
+
+    Returns:
+    - DataFrame: The data with the declared dtypes. df itself is not modified.
+    """
+
+    schema = SCHEMAS[table]
+
+    df = df.drop(columns=[col for col in DROPPED_COLUMNS if col in df.columns])
+    casts = {col: dtype for col, dtype in schema.items() if col in df.columns and df[col].dtype != dtype}
+
+    return df.astype(casts) if casts else df
+
+# ==============================================================================================================
+# 2. memory_report()
+# ==============================================================================================================
+
+def memory_report(df, table):
+    """
+    Compare the memory used by each column of df with the memory it uses under the table's schema.
+
+    Parameters:
+    - df (DataFrame): The data, e.g. as read from a pickle or Excel file.
+    - table (str): Name of the table whose schema to apply, a key of SCHEMAS.
+
+    Returns:
+    - DataFrame: One row per column of df plus a 'Total' row, with 'Dtype', 'Bytes', 'Schema Dtype' and 'Schema Bytes'
+                 columns (a dropped column has no schema dtype and 0 bytes), sorted by the bytes saved.
+    """
+
+    compact = apply_schema(df, table)
+
+    report = pd.DataFrame({
+        'Dtype': df.dtypes.astype(str),
+        'Bytes': df.memory_usage(index=False, deep=True),
+        'Schema Dtype': compact.dtypes.astype(str).reindex(df.columns),
+        'Schema Bytes': compact.memory_usage(index=False, deep=True).reindex(df.columns, fill_value=0),
+    })
+    report = report.loc[(report['Bytes'] - report['Schema Bytes']).sort_values(ascending=False).index]
+    report.loc['Total'] = ['', report['Bytes'].sum(), '', report['Schema Bytes'].sum()]
+
+    return report
@@ -0,0 +1,119 @@
+# screening.py
+# |--- fit_country_curves()
+# |--- screen_rich_cheap()
+
+import numpy as np
+import pandas as pd
+from utils.curves import YieldCurve
+from utils.schema import AS_OF_DATE
+
+# Maturity buckets (in years) the residual spreads are compared within
+MATURITY_BUCKETS = [0, 2, 5, 10, 20, np.inf]
+MATURITY_BUCKET_LABELS = ['0-2y', '2-5y', '5-10y', '10-20y', '20y+']
+
+# Countries with fewer bonds than this get no curve (a Nelson-Siegel-Svensson curve has 6 parameters)
+MIN_BONDS_PER_CURVE = 6
+
+# Bonds whose yield is more than this many (scaled) median absolute deviations away from their country's median
+# yield are left out of the curve fit, e.g. distressed bonds quoted at several hundred percent
+OUTLIER_MADS = 5
+
+# Lower bound of the robust scale (in basis points) the residual spreads of a maturity bucket are divided by, so a
+# bucket whose bonds all sit on their curves (a median absolute deviation of 0) does not give infinite z-scores
+MIN_RESIDUAL_SCALE_BP = 25
+
+# ==============================================================================================================
+# 1. fit_country_curves()
+# ==============================================================================================================
+
+def _robust_scale(values):
+    """Median absolute deviation, scaled to match the standard deviation for normally distributed values."""
+    return 1.4826 * np.nanmedian(np.abs(values - np.nanmedian(values)))
+
+
+def fit_country_curves(data, method='nss', ytm_col='YTM - Ask', as_of=AS_OF_DATE, min_bonds=MIN_BONDS_PER_CURVE):
+    """
+    Fit a yield curve for every country of the bonds data in one grouped pass.
+
+    Outlying yields (see OUTLIER_MADS) are left out of each fit, so a few distressed bonds do not bend the curve.
+
+    Parameters:
+    - data (DataFrame): Bonds data with 'Country', 'Maturity' and ytm_col columns, e.g. bonds-analyzed.
+    - method (str, optional): Curve method, 'nss' or 'spline'. Default is 'nss'.
+    - ytm_col (str, optional): The yield column to fit. Default is 'YTM - Ask'.
+    - as_of (str, optional): The pricing date the tenors are measured from. Default is AS_OF_DATE.
+    - min_bonds (int, optional): Countries with fewer bonds in the fit get no curve. Default is MIN_BONDS_PER_CURVE.
+
+    Returns:
+    - tuple: (dict of country -> YieldCurve, boolean Series flagging the bonds used in the fits)
+    """
+
+    tenors = (pd.to_datetime(data['Maturity']) - pd.to_datetime(as_of)).dt.days / 365
+    yields = pd.to_numeric(data[ytm_col], errors='coerce')
+
+    # distance from the country's median yield in robust standard deviations (at least 25bp per deviation)
+    country_yields = yields.groupby(data['Country'], observed=True)
+    deviation = (yields - country_yields.transform('median')).abs()
+    scale = country_yields.transform(_robust_scale).clip(lower=0.25)
+    in_fit = (deviation <= OUTLIER_MADS * scale) & (tenors > 0)
+
+    curves = {}
+    for country, bonds in data[in_fit].groupby('Country', sort=True, observed=True):
+        if len(bonds) >= min_bonds:
+            curves[country] = YieldCurve.fit(tenors[bonds.index], yields[bonds.index], method=method, label=country)
+
+    return curves, in_fit
+
+# ==============================================================================================================
+# 2. screen_rich_cheap()
+# ==============================================================================================================
+
+def screen_rich_cheap(data, method='nss', ytm_col='YTM - Ask', as_of=AS_OF_DATE, min_bonds=MIN_BONDS_PER_CURVE):
+    """
+    Rank all bonds by how cheap they are against the fitted curve of their country.
+
+    The residual spread is the bond's yield minus the yield of its country's curve at its maturity, in basis points;
+    a positive spread means the bond yields more than its peers (cheap), a negative spread less (rich). The z-score
+    compares the residual spread with the other bonds of the same maturity bucket (see MATURITY_BUCKETS), using the
+    median and the scaled median absolute deviation (at least MIN_RESIDUAL_SCALE_BP) so that outliers do not distort
+    it. The result only depends on the data, so every quote refresh can be screened the same way.
+
+    Parameters:
+    - data (DataFrame): Bonds data with 'Issuer', 'Country', 'Maturity' and ytm_col columns, e.g. bonds-analyzed.
+    - method (str, optional): Curve method, 'nss' or 'spline'. Default is 'nss'.
+    - ytm_col (str, optional): The yield column to screen. Default is 'YTM - Ask'.
+    - as_of (str, optional): The pricing date the tenors are measured from. Default is AS_OF_DATE.
+    - min_bonds (int, optional): Countries with fewer bonds get no curve. Default is MIN_BONDS_PER_CURVE.
+
+    Returns:
+    - DataFrame: One row per bond (same index as data), ranked from cheapest to richest, with 'Issuer', 'Country',
+                 'Maturity', ytm_col, 'Tenor', 'Fitted Yield', 'Residual Spread (bp)', 'Maturity Bucket', 'Z-Score',
+                 'In Fit' and 'Rank'. Bonds without a country curve have NaN residuals and are ranked last.
+    """
+
+    curves, in_fit = fit_country_curves(data, method=method, ytm_col=ytm_col, as_of=as_of, min_bonds=min_bonds)
+
+    screen = data[['Issuer', 'Country', 'Maturity', ytm_col]].copy()
+    screen[ytm_col] = pd.to_numeric(screen[ytm_col], errors='coerce')
+    screen['Tenor'] = (pd.to_datetime(screen['Maturity']) - pd.to_datetime(as_of)).dt.days / 365
+
+    # evaluate each country's curve on all of its bonds at once
+    fitted = pd.Series(np.nan, index=screen.index)
+    has_curve = screen['Country'].isin(curves.keys())
+    for country, tenors in screen.loc[has_curve, 'Tenor'].groupby(screen['Country'], observed=True):
+        fitted[tenors.index] = curves[country].zero_rate(tenors.to_numpy())
+
+    screen['Fitted Yield'] = fitted
+    screen['Residual Spread (bp)'] = (screen[ytm_col] - screen['Fitted Yield']) * 100
+    screen['Maturity Bucket'] = pd.cut(screen['Tenor'], MATURITY_BUCKETS, labels=MATURITY_BUCKET_LABELS, right=False)
+
+    residuals = screen.groupby('Maturity Bucket', observed=True)['Residual Spread (bp)']
+    screen['Z-Score'] = ((screen['Residual Spread (bp)'] - residuals.transform('median'))
+                         / residuals.transform(_robust_scale).clip(lower=MIN_RESIDUAL_SCALE_BP))
+    screen['In Fit'] = in_fit & has_curve
+
+    # cheapest first; ties are broken by the original row order so the ranking is reproducible
+    screen = screen.sort_values('Z-Score', ascending=False, kind='mergesort', na_position='last')
+    screen['Rank'] = np.arange(1, len(screen) + 1)
+
+    return screen
@@ -0,0 +1,372 @@
+# storage.py
+# |--- table_path()
+# |--- write_table()
+# |--- TableWriter
+# |--- read_table()
+# |--- export_excel()
+# |--- file_fingerprint()
+# |--- code_fingerprint()
+# |--- cached_table()
+
+import hashlib
+import inspect
+import json
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pathlib import Path
+from utils.schema import SCHEMAS, apply_schema
+
+# Set the project directory for easy access to the data
+PROJECT_DIR = Path().resolve()
+PROCESSED_DIR = PROJECT_DIR / "processed_data"
+CACHE_DIR = PROCESSED_DIR / "cache"
+
+# Rows per Parquet row group; min/max statistics are kept per row group, so filters can skip whole groups
+ROW_GROUP_SIZE = 2048
+COMPRESSION = "zstd"
+
+# Version of the cache entries of cached_table(); bump it when the layout of the cached tables changes
+CACHE_VERSION = 1
+
+# Arrow types the declared dtypes of utils/schema.py are stored as; categoricals are stored as their values
+ARROW_TYPES = {
+    'category': pa.string(),
+    'float64': pa.float64(),
+    'float32': pa.float32(),
+    'int8': pa.int8(),
+    'datetime64[ns]': pa.timestamp('ns'),
+}
+
+# ==============================================================================================================
+# 1. table_path()
+# ==============================================================================================================
+
+def table_path(name, directory=None):
+    """
+    Return the path of a table in the columnar store, e.g. 'bonds-data' -> processed_data/bonds-data.parquet.
+
+    Parameters:
+    - name (str): Name of the table, without extension.
+    - directory (Path, optional): Directory of the store. Default is processed_data/ in the project directory.
+
+    Returns:
+    - Path: The path of the Parquet file.
+    """
+
+    return Path(directory or PROCESSED_DIR) / f"{name}.parquet"
+
+# ==============================================================================================================
+# 2. write_table()
+# ==============================================================================================================
+
+def write_table(df, name, directory=None, row_group_size=ROW_GROUP_SIZE, compression=COMPRESSION):
+    """
+    Write a DataFrame to the columnar store as a typed, compressed Parquet file.
+
+    Object columns that only hold numbers (e.g. 'Cpn', which mixes int and float values) are stored as float
+    columns, so readers get proper numeric types back instead of Python objects.
+
+    Parameters:
+    - df (DataFrame): The data to store. The index is not stored.
+    - name (str): Name of the table, without extension.
+    - directory (Path, optional): Directory of the store. Default is processed_data/ in the project directory.
+    - row_group_size (int, optional): Number of rows per row group. Default is ROW_GROUP_SIZE.
+    - compression (str, optional): Parquet compression codec. Default is COMPRESSION.
+
+    Returns:
+    - Path: The path of the written Parquet file.
+    """
+
+    df = _numeric_objects_to_float(df)
+
+    path = table_path(name, directory)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(path, engine="pyarrow", index=False, compression=compression, row_group_size=row_group_size)
+
+    return path
+
+def _numeric_objects_to_float(df):
+    """Return a copy of df in which object columns that only hold numbers are numeric columns."""
+
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        if pd.api.types.infer_dtype(df[col], skipna=True) in ('integer', 'floating', 'mixed-integer-float', 'decimal'):
+            df[col] = pd.to_numeric(df[col])
+
+    return df
+
+# ==============================================================================================================
+# 3. TableWriter
+# ==============================================================================================================
+
+class TableWriter:
+    """
+    Write a table to the columnar store batch by batch, so that a table larger than memory can be produced by a
+    streaming pipeline. Every batch becomes one or more row groups of the same Parquet file.
+
+    Columns declared in the table's schema (see utils/schema.py) are stored with their declared types (ARROW_TYPES),
+    so the file does not depend on how the input was split into batches: a categorical or text column that is empty
+    or all missing in one batch still gets the strings of the others. The other columns get the types of the first
+    batch: integer columns are stored as float (a later batch may have missing values), columns without any value
+    as strings and categorical columns as their values. Every batch is cast to that schema. The file is written
+    under a temporary name and only replaces the table on close(), so a failed run leaves the previous table in place.
+    If no batch was written (e.g. every row was filtered out), close() stores an empty table with the declared
+    columns, so the previous table is not left behind as if it were the result.
+
+    Use as a context manager:
+
+        with TableWriter("bonds-data") as writer:
+            for batch in batches:
+                writer.write(batch)
+
+    Parameters:
+    - name (str): Name of the table, without extension.
+    - directory (Path, optional): Directory of the store. Default is processed_data/ in the project directory.
+    - row_group_size (int, optional): Number of rows per row group. Default is ROW_GROUP_SIZE.
+    - compression (str, optional): Parquet compression codec. Default is COMPRESSION.
+    """
+
+    def __init__(self, name, directory=None, row_group_size=ROW_GROUP_SIZE, compression=COMPRESSION):
+        self.path = table_path(name, directory)
+        self.declared = SCHEMAS.get(name, {})
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.rows = 0
+        self._temporary_path = self.path.with_suffix('.parquet.tmp')
+        self._writer = None
+        self._closed = False
+
+    def _open(self, schema):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._writer = pq.ParquetWriter(self._temporary_path, schema, compression=self.compression)
+
+    def write(self, df):
+        """
+        Append a batch of rows to the table.
+
+        Parameters:
+        - df (DataFrame): The batch. The index is not stored.
+        """
+
+        df = _numeric_objects_to_float(df)
+
+        # declared text columns are passed as plain strings, whatever pandas inferred for this batch
+        for col in df.columns:
+            if self.declared.get(col) == 'category':
+                values = df[col].astype(object)
+                present = values.notna()
+                values[present] = values[present].astype(str)
+                df[col] = values.where(present, None)
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+
+        if self._writer is None:
+            fields = []
+            for field in table.schema:
+                if field.name in self.declared:
+                    field = field.with_type(ARROW_TYPES[self.declared[field.name]])
+                elif pa.types.is_integer(field.type):
+                    field = field.with_type(pa.float64())
+                elif pa.types.is_null(field.type):
+                    field = field.with_type(pa.string())
+                elif pa.types.is_dictionary(field.type):
+                    # categoricals of different batches have different categories, store their values
+                    value_type = field.type.value_type
+                    field = field.with_type(pa.string() if pa.types.is_null(value_type) else value_type)
+                fields.append(field)
+            self._open(pa.schema(fields, metadata=table.schema.metadata))
+
+        self._writer.write_table(table.cast(self._writer.schema), row_group_size=self.row_group_size)
+        self.rows += len(df)
+
+    def close(self):
+        """
+        Finish the file and replace the table with it. Without any batch written the table is replaced by an empty
+        one with the declared columns; a ValueError is raised for a table without a declared schema.
+
+        Returns:
+        - Path: The path of the written Parquet file.
+        """
+
+        if self._writer is None and not self._closed:
+            if not self.declared:
+                raise ValueError(f"no rows were written to {self.path.stem} and it has no declared schema in utils/schema.py")
+            self._open(pa.schema([(col, ARROW_TYPES[dtype]) for col, dtype in self.declared.items()]))
+
+        if self._writer is not None:
+            self._writer.close()
+            self._temporary_path.replace(self.path)
+            self._writer = None
+        self._closed = True
+
+        return self.path
+
+    def abort(self):
+        """Discard the rows written so far and keep the previous table."""
+
+        if self._writer is not None:
+            self._writer.close()
+            self._temporary_path.unlink(missing_ok=True)
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+# ==============================================================================================================
+# 4. read_table()
+# ==============================================================================================================
+
+def read_table(name, columns=None, filters=None, directory=None):
+    """
+    Read a table from the columnar store, optionally only some columns and rows.
+
+    Only the requested columns are decoded, and row groups whose statistics cannot match the filters are skipped
+    without being read. Tables with a declared schema (see utils/schema.py) are returned with its dtypes, and the
+    categoricals of a filtered read only have the categories of the rows read.
+
+    Parameters:
+    - name (str): Name of the table, without extension.
+    - columns (list, optional): Columns to load. Default is None for all columns.
+    - filters (list, optional): Row filters in pyarrow's format, e.g. [('Country', '==', 'United States')].
+                                Default is None for all rows.
+    - directory (Path, optional): Directory of the store. Default is processed_data/ in the project directory.
+
+    Returns:
+    - DataFrame: The (projected and filtered) table.
+    """
+
+    df = pd.read_parquet(table_path(name, directory), engine="pyarrow", columns=columns, filters=filters)
+    df = apply_schema(df, name) if name in SCHEMAS else df
+
+    # the categories of a filtered read are still those of the whole table; keep only the ones in the rows read
+    categorical = df.select_dtypes('category').columns
+    return df.assign(**{col: df[col].cat.remove_unused_categories() for col in categorical}) if filters else df
+
+# ==============================================================================================================
+# 5. export_excel()
+# ==============================================================================================================
+
+def export_excel(df, name, directory=None):
+    """
+    Export a table as an Excel file for reporting. This is a final artifact only; pipeline stages read the
+    Parquet files.
+
+    Parameters:
+    - df (DataFrame): The data to export.
+    - name (str): Name of the file, without extension.
+    - directory (Path, optional): Output directory. Default is processed_data/ in the project directory.
+
+    Returns:
+    - Path: The path of the written Excel file.
+    """
+
+    path = Path(directory or PROCESSED_DIR) / f"{name}.xlsx"
+    df.to_excel(path, index=False)
+
+    return path
+
+# ==============================================================================================================
+# 6. file_fingerprint()
+# ==============================================================================================================
+
+def file_fingerprint(path, previous=None):
+    """
+    Fingerprint a source file by its modification time, size and SHA-256 content hash.
+
+    If a previous fingerprint of the same file has the same modification time and size, its hash is reused
+    instead of reading the file again.
+
+    Parameters:
+    - path (str or Path): The file to fingerprint.
+    - previous (dict, optional): An earlier fingerprint of the file. Default is None.
+
+    Returns:
+    - dict: {'mtime_ns': ..., 'size': ..., 'sha256': ...}
+    """
+
+    stat = Path(path).stat()
+    fingerprint = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+    if previous and all(previous.get(key) == value for key, value in fingerprint.items()):
+        fingerprint['sha256'] = previous['sha256']
+    else:
+        fingerprint['sha256'] = hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+    return fingerprint
+
+# ==============================================================================================================
+# 7. cached_table()
+# ==============================================================================================================
+
+def code_fingerprint(functions):
+    """
+    Fingerprint the code that builds a table: a SHA-256 hash of the source of the given functions and CACHE_VERSION.
+    Functions without source file (e.g. defined in an interactive session) are hashed by their bytecode and constants.
+
+    Parameters:
+    - functions (list): The functions, e.g. the build function of a cached table and the helpers it calls.
+
+    Returns:
+    - str: The hash.
+    """
+
+    digest = hashlib.sha256(f"cache version {CACHE_VERSION}".encode())
+    for function in functions:
+        try:
+            digest.update(inspect.getsource(function).encode())
+        except (OSError, TypeError):
+            digest.update(function.__code__.co_code + repr(function.__code__.co_consts).encode())
+
+    return digest.hexdigest()
+
+
+def cached_table(name, sources, build, directory=None, code=None):
+    """
+    Return a derived table from the cache if it was built from the current contents of its source files by the
+    current code, otherwise build it, store it in the cache and return it.
+
+    The cache entry is a Parquet file plus a JSON file with the fingerprints of the sources and of the code (see
+    code_fingerprint()). A source whose modification time changed but whose content hash did not (e.g. a re-saved
+    workbook) keeps the entry valid; a change to build, to the functions in code or to CACHE_VERSION does not.
+
+    Parameters:
+    - name (str): Name of the cached table, without extension.
+    - sources (list): Paths of the source files the table is derived from.
+    - build (callable): Function without arguments that builds the table (a DataFrame) from the sources.
+    - directory (Path, optional): Directory of the cache. Default is processed_data/cache/ in the project directory.
+    - code (list, optional): Other functions build relies on, whose changes invalidate the entry. Default is None.
+
+    Returns:
+    - DataFrame: The cached or freshly built table.
+    """
+
+    directory = Path(directory or CACHE_DIR)
+    fingerprint_path = directory / f"{name}.json"
+
+    previous = {}
+    if fingerprint_path.exists() and table_path(name, directory).exists():
+        previous = json.loads(fingerprint_path.read_text())
+    previous_sources = previous.get('sources', {})
+
+    fingerprints = {str(source): file_fingerprint(source, previous_sources.get(str(source))) for source in sources}
+    code_hash = code_fingerprint([build, *(code or [])])
+
+    same_sources = previous_sources.keys() == fingerprints.keys() and all(
+        previous_sources[source]['sha256'] == fingerprint['sha256'] for source, fingerprint in fingerprints.items())
+
+    if same_sources and previous.get('code') == code_hash:
+        table = read_table(name, directory=directory)
+    else:
+        table = build()
+        write_table(table, name, directory=directory)
+
+    fingerprint_path.write_text(json.dumps({'code': code_hash, 'sources': fingerprints}, indent=2))
+
+    return table
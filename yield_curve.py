@@ -1,54 +1,86 @@
+import argparse
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from pathlib import Path
-from scipy.interpolate import make_interp_spline
-from matplotlib.ticker import FuncFormatter
-
-# Load the date
-PROJECT_DIR = Path().resolve()
-data = pd.read_excel(PROJECT_DIR / "processed_data/bonds-data.xlsx")
-
-# Convert Maturity column to datetime
-data["Maturity"] = pd.to_datetime(data["Maturity"])
-
-# Calculate time to maturity in years using November 24, 2023
-data["Years to Maturity"] = round((data["Maturity"] - pd.to_datetime('2023-11-24')).dt.days / 365)
-data["Years to Maturity (Unrounded)"] = (data["Maturity"] - pd.to_datetime('2023-11-24')).dt.days / 365
-
-# Subset data for Country=="United States"
-data_us = data[data["Country"] == "United States"]
-
-# Group by maturity year and calculate the mean of yields
-data_mean = data_us.groupby("Years to Maturity").agg({"YTM - Ask": "mean", "YTM - Bid": "mean"}).reset_index()
-data_mean = data_mean.sort_values(by='Years to Maturity')
-
-# Apply spline interpolation
-x_smooth = np.linspace(data_mean['Years to Maturity'].min(), data_mean['Years to Maturity'].max(), 300)
-spl_ask = make_interp_spline(data_mean['Years to Maturity'], data_mean['YTM - Ask'], k=3)
-spl_bid = make_interp_spline(data_mean['Years to Maturity'], data_mean['YTM - Bid'], k=3)
-y_smooth_ask = spl_ask(x_smooth)
-y_smooth_bid = spl_bid(x_smooth)
-
-# Plot the smoothed curve with specified line colors
-plt.plot(x_smooth, y_smooth_ask, color='blue', label='YTM Ask')
-plt.plot(x_smooth, y_smooth_bid, color='black', label='YTM Bid')
-
-filtered_ytm = data_us[(data_us['YTM - Ask'] > 0) & (data_us['YTM - Ask'] < 8)]
-plt.scatter(filtered_ytm['Years to Maturity (Unrounded)'], filtered_ytm['YTM - Ask'], color='deepskyblue', alpha=0.4, s=25)
-
-plt.rcParams['figure.figsize'] = (10, 6)  # Set the figure size
-plt.xticks(fontsize=12)  # Customize font size for x-axis ticks
-plt.yticks(fontsize=12)  # Customize font size for y-axis ticks
-plt.gca().yaxis.set_major_formatter(FuncFormatter(lambda y, _: f'{y:.0f}%'))
-plt.title('Bond Yields with November 24, 2023 Sample', fontsize=16)
-plt.xlabel('Time to Maturity', fontsize=14)
-plt.ylabel('Yield to Maturity', fontsize=14)
-plt.legend(fontsize=12)
-plt.grid(True)
-
-# Save the figure for presentation
-# plt.savefig('figures/yield_curve.png', dpi=300, bbox_inches='tight')
-
-plt.show()
\ No newline at end of file
+from utils.storage import read_table
+from utils.curves import get_curve
+from utils.schema import AS_OF_DATE
+
+
+def plot_yield_curve(country="United States", as_of=AS_OF_DATE):
+    """
+    Scatter the ask yields of a country's bonds against their time to maturity, with the fitted ask and bid curves.
+
+    Parameters:
+    - country (str, optional): Country of the bonds. Default is "United States".
+    - as_of (str, optional): Date the time to maturity is measured from. Default is AS_OF_DATE.
+
+    Returns:
+    - Figure: The matplotlib figure.
+    """
+
+    # matplotlib is only imported to plot, so that importing the module stays fast
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import FuncFormatter
+
+    # Load the data: only the columns of the country's bonds needed for the scatter plot
+    data = read_table("bonds-data",
+                      columns=["Country", "Maturity", "YTM - Ask", "YTM - Bid"],
+                      filters=[("Country", "==", country)])
+
+    # Convert Maturity column to datetime
+    data["Maturity"] = pd.to_datetime(data["Maturity"])
+
+    # Calculate time to maturity in years using the as-of date
+    data["Years to Maturity (Unrounded)"] = (data["Maturity"] - pd.to_datetime(as_of)).dt.days / 365
+
+    # Fitted curves (cubic spline through the mean yield per maturity year); fitted once and reused from the cache
+    curve_ask = get_curve(country, as_of=as_of, method='spline', ytm_col='YTM - Ask')
+    curve_bid = get_curve(country, as_of=as_of, method='spline', ytm_col='YTM - Bid')
+
+    # Evaluate the curves over the fitted maturities
+    x_smooth = np.linspace(*curve_ask.tenor_range, 300)
+    y_smooth_ask = curve_ask.zero_rate(x_smooth)
+    y_smooth_bid = curve_bid.zero_rate(x_smooth)
+
+    plt.rcParams['figure.figsize'] = (10, 6)  # Set the figure size
+    figure = plt.figure()
+
+    # Plot the smoothed curve with specified line colors
+    plt.plot(x_smooth, y_smooth_ask, color='blue', label='YTM Ask')
+    plt.plot(x_smooth, y_smooth_bid, color='black', label='YTM Bid')
+
+    filtered_ytm = data[(data['YTM - Ask'] > 0) & (data['YTM - Ask'] < 8)]
+    plt.scatter(filtered_ytm['Years to Maturity (Unrounded)'], filtered_ytm['YTM - Ask'], color='deepskyblue', alpha=0.4, s=25)
+
+    plt.xticks(fontsize=12)  # Customize font size for x-axis ticks
+    plt.yticks(fontsize=12)  # Customize font size for y-axis ticks
+    plt.gca().yaxis.set_major_formatter(FuncFormatter(lambda y, _: f'{y:.0f}%'))
+    as_of = pd.to_datetime(as_of)
+    plt.title(f'Bond Yields with {as_of:%B} {as_of.day}, {as_of.year} Sample', fontsize=16)
+    plt.xlabel('Time to Maturity', fontsize=14)
+    plt.ylabel('Yield to Maturity', fontsize=14)
+    plt.legend(fontsize=12)
+    plt.grid(True)
+
+    return figure
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plot the fitted yield curve of a country over its bonds.")
+    parser.add_argument("--country", default="United States", help="country of the bonds (default: United States)")
+    parser.add_argument("--as-of", default=AS_OF_DATE, help=f"date the time to maturity is measured from (default: {AS_OF_DATE})")
+    parser.add_argument("--save", default=None, help="save the figure to this path (e.g. figures/yield_curve.png) instead of showing it")
+    args = parser.parse_args(argv)
+
+    figure = plot_yield_curve(args.country, as_of=args.as_of)
+
+    # Save the figure for presentation
+    if args.save:
+        figure.savefig(args.save, dpi=300, bbox_inches='tight')
+    else:
+        import matplotlib.pyplot as plt
+        plt.show()
+
+
+if __name__ == "__main__":
+    main()